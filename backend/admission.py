@@ -0,0 +1,83 @@
+"""
+Admission control for the render pool.
+
+Under queue pressure a quick low-quality video beats a full-quality one
+after minutes of waiting. ``AdmissionController.admit`` looks at the pool's
+queue depth and the predicted wait of a new job, and picks a degradation
+level for it:
+
+- ``full``: the generator's own render settings
+- ``reduced``: 15 fps, same resolution
+- ``preview``: 480p at 15 fps
+
+Past the hard limits new jobs are rejected with ``Overloaded``, which the
+servers turn into 429 with a Retry-After header. The level is stored on the
+job, so the client can ask for a full-quality re-render once the queue has
+drained.
+"""
+
+import math
+import os
+from typing import Any, Dict
+
+# Predicted wait (seconds) at which new jobs are degraded one level, and
+# twice that for two levels
+DEGRADE_WAIT_SECONDS = float(os.environ.get("EDUARENA_DEGRADE_WAIT_SECONDS", 60))
+# Predicted wait at which new jobs are rejected
+SHED_WAIT_SECONDS = float(os.environ.get("EDUARENA_SHED_WAIT_SECONDS", 600))
+# The same limits as queued jobs per worker
+DEGRADE_QUEUE_PER_WORKER = float(os.environ.get("EDUARENA_DEGRADE_QUEUE", 4))
+SHED_QUEUE_PER_WORKER = float(os.environ.get("EDUARENA_SHED_QUEUE", 25))
+
+# Degradation levels, mildest first: render setting overrides of each
+LEVELS = [
+    ("full", {}),
+    ("reduced", {"frame_rate": 15}),
+    ("preview", {"quality": "low_quality", "frame_rate": 15}),
+]
+LEVEL_SETTINGS = dict(LEVELS)
+
+
+class Overloaded(Exception):
+    """The queue is past its hard limit; retry after ``retry_after`` seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Degradation level of new jobs on one render pool"""
+
+    def __init__(self, pool, degrade_wait: float = DEGRADE_WAIT_SECONDS, shed_wait: float = SHED_WAIT_SECONDS,
+                 degrade_queue: float = DEGRADE_QUEUE_PER_WORKER, shed_queue: float = SHED_QUEUE_PER_WORKER):
+        self.pool = pool
+        self.degrade_wait = degrade_wait
+        self.shed_wait = shed_wait
+        self.degrade_queue = degrade_queue * pool.size
+        self.shed_queue = shed_queue * pool.size
+        self._counts = {name: 0 for name, _ in LEVELS}
+        self._counts["rejected"] = 0
+
+    def admit(self, degrade: bool = True) -> str:
+        """Level for a job submitted now; raises ``Overloaded`` past the hard
+        limits, or whenever the job would be degraded if ``degrade`` is off"""
+        load = self.pool.load()
+        wait, queued = load["wait_seconds"], load["queued"]
+        if wait >= self.shed_wait or queued >= self.shed_queue:
+            self._counts["rejected"] += 1
+            # The backlog drains at about one second of wait per second
+            retry_after = max(1, math.ceil(wait - self.shed_wait / 2))
+            raise Overloaded(f"Render queue is full ({queued} queued, about {wait:.0f}s wait)", retry_after)
+
+        pressure = max(wait / self.degrade_wait, queued / self.degrade_queue)
+        name = LEVELS[min(int(pressure), len(LEVELS) - 1)][0]
+        if name != "full" and not degrade:
+            self._counts["rejected"] += 1
+            raise Overloaded("Render queue is too long for a full-quality render",
+                             max(1, math.ceil(wait - self.degrade_wait)))
+        self._counts[name] += 1
+        return name
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.pool.load(), "admitted": dict(self._counts)}
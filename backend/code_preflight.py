@@ -0,0 +1,269 @@
+"""
+Static pre-flight checks for LLM-generated manim code.
+
+``validate_code`` rejects a program before any render process exists when:
+
+- it does not parse
+- it does not define exactly one ``Scene`` subclass with a ``construct`` method
+- it imports a module outside ``ALLOWED_IMPORTS`` or calls a disallowed
+  builtin such as ``open`` or ``eval``
+- it uses a name that is neither defined in the program nor exported by the
+  installed manim (e.g. ``ShowCreation`` from older manim versions)
+
+The installed manim API is listed once per manim version in a subprocess and
+kept in ``media/``, so the API process never imports manim itself. Failures,
+including those recorded after a render, are remembered by code hash, so a
+known-bad program is rejected without being parsed again. Only failures of
+the code itself (``SceneCodeError``) are recorded after a render; timeouts,
+cancellation and crashed render processes say nothing about the program.
+"""
+
+import ast
+import builtins
+import hashlib
+import importlib
+import importlib.metadata
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+ALLOWED_IMPORTS = {"manim", "numpy", "math", "random", "itertools", "functools", "typing", "colour", "__future__"}
+DISALLOWED_CALLS = {
+    "eval", "exec", "compile", "open", "__import__", "input", "breakpoint",
+    "globals", "locals", "vars", "exit", "quit", "getattr", "setattr", "delattr",
+}
+# Stdlib modules whose names can be listed in-process for star imports
+_CHEAP_MODULES = {"math", "random", "itertools", "functools", "typing"}
+
+API_CATALOG_DIR = "media"
+FAILURE_CACHE_SIZE = 1024
+
+_API_SCRIPT = (
+    "import json, manim\n"
+    "names = [n for n in dir(manim) if not n.startswith('_')]\n"
+    "scenes = [n for n in names if isinstance(getattr(manim, n), type)"
+    " and issubclass(getattr(manim, n), manim.Scene)]\n"
+    "print(json.dumps({'names': names, 'scenes': scenes}))\n"
+)
+
+Signature = Tuple[str, str]
+
+
+class PreflightError(ValueError):
+    """Generated code rejected before rendering"""
+
+    def __init__(self, message: str, signature: Signature):
+        super().__init__(message)
+        self.signature = signature
+
+
+class SceneCodeError(RuntimeError):
+    """Generated code raised an exception while rendering. The same program
+    fails the same way again, unlike a timeout or a crashed render process."""
+
+
+# ---------------------------------------------------------------------------
+# Installed manim API
+# ---------------------------------------------------------------------------
+
+_api: Optional[Dict[str, Set[str]]] = None
+_api_lock = threading.Lock()
+
+
+def manim_api() -> Optional[Dict[str, Set[str]]]:
+    """Public names and Scene classes of the installed manim, or None if it is missing"""
+    global _api
+    with _api_lock:
+        if _api is not None:
+            return _api or None
+        try:
+            version = importlib.metadata.version("manim")
+        except importlib.metadata.PackageNotFoundError:
+            version = None
+
+        catalog_path = os.path.join(API_CATALOG_DIR, f"manim_api_{version}.json") if version else None
+        data = None
+        if catalog_path and os.path.exists(catalog_path):
+            with open(catalog_path) as f:
+                data = json.load(f)
+        else:
+            try:
+                result = subprocess.run([sys.executable, "-c", _API_SCRIPT], capture_output=True,
+                                        text=True, timeout=120)
+                data = json.loads(result.stdout.strip().splitlines()[-1]) if result.returncode == 0 else None
+            except (subprocess.TimeoutExpired, ValueError, IndexError) as e:
+                print(f"Could not list the manim API: {e}")
+            if data is not None and catalog_path:
+                os.makedirs(API_CATALOG_DIR, exist_ok=True)
+                with open(catalog_path, "w") as f:
+                    json.dump(data, f)
+
+        _api = {"names": set(data["names"]), "scenes": set(data["scenes"])} if data else {}
+        return _api or None
+
+
+# ---------------------------------------------------------------------------
+# Failure cache
+# ---------------------------------------------------------------------------
+
+_failures: "OrderedDict[str, Tuple[str, Signature]]" = OrderedDict()
+_failures_lock = threading.Lock()
+_stats = {"checked": 0, "rejected": 0, "cache_hits": 0}
+
+
+def _code_key(code: str) -> str:
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def failure_signature(error: str, code: str = "") -> Signature:
+    """(error class, offending line) of a traceback produced by rendering ``code``"""
+    lines = error.strip().splitlines()
+    error_class = "RenderError"
+    for line in reversed(lines):
+        match = re.match(r"^(\w+(?:Error|Exception|Exit)):", line.strip())
+        if match:
+            error_class = match.group(1)
+            break
+
+    offending = ""
+    code_lines = code.splitlines()
+    for line in reversed(lines):
+        match = re.search(r'File "(<generated[^"]*>|[^"]*animation\.py)", line (\d+)', line)
+        if match:
+            number = int(match.group(2))
+            if 0 < number <= len(code_lines):
+                offending = code_lines[number - 1].strip()
+            break
+    return error_class, offending
+
+
+def record_failure(code: str, message: str, signature: Optional[Signature] = None):
+    """Remember that ``code`` failed, so the next identical program is rejected at once"""
+    signature = signature or failure_signature(message, code)
+    with _failures_lock:
+        _failures[_code_key(code)] = (message[-2000:], signature)
+        _failures.move_to_end(_code_key(code))
+        while len(_failures) > FAILURE_CACHE_SIZE:
+            _failures.popitem(last=False)
+
+
+def preflight_stats() -> Dict[str, int]:
+    with _failures_lock:
+        return {**_stats, "known_failures": len(_failures)}
+
+
+# ---------------------------------------------------------------------------
+# Checks
+# ---------------------------------------------------------------------------
+
+def _bound_names(tree: ast.AST) -> Set[str]:
+    """Every name the program binds anywhere (scopes are not distinguished)"""
+    bound = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            bound.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, ast.alias):
+            bound.add((node.asname or node.name).split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+    return bound
+
+
+def _check(code: str) -> None:
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        raise PreflightError(f"SyntaxError: {e.msg} (line {e.lineno})",
+                             ("SyntaxError", (e.text or "").strip()))
+
+    api = manim_api()
+    manim_names = api["names"] if api else set()
+    available = set(dir(builtins))
+    manim_aliases = set()
+    resolvable = True
+
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            modules = [alias.name for alias in node.names] if isinstance(node, ast.Import) else [node.module or ""]
+            for module in modules:
+                if module.split(".")[0] not in ALLOWED_IMPORTS:
+                    raise PreflightError(f"Import of {module} is not allowed", ("ImportError", module))
+            if isinstance(node, ast.Import):
+                manim_aliases.update(alias.asname or alias.name for alias in node.names if alias.name == "manim")
+                continue
+
+            star = any(alias.name == "*" for alias in node.names)
+            if node.module == "manim":
+                if star:
+                    available |= manim_names
+                for alias in node.names:
+                    if alias.name != "*" and api and alias.name not in manim_names:
+                        raise PreflightError(f"manim has no name {alias.name}", ("NameError", alias.name))
+            elif star:
+                if node.module in _CHEAP_MODULES:
+                    available |= set(dir(importlib.import_module(node.module)))
+                else:
+                    resolvable = False
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in DISALLOWED_CALLS:
+            raise PreflightError(f"Call to {node.func.id}() is not allowed", ("ForbiddenCall", node.func.id))
+        elif isinstance(node, ast.Attribute):
+            if node.attr.startswith("__") and node.attr.endswith("__") and node.attr != "__init__":
+                raise PreflightError(f"Access to {node.attr} is not allowed", ("ForbiddenCall", node.attr))
+            if api and isinstance(node.value, ast.Name) and node.value.id in manim_aliases \
+                    and node.attr not in manim_names:
+                raise PreflightError(f"manim has no name {node.attr}", ("NameError", node.attr))
+
+    scenes = [
+        node for node in tree.body
+        if isinstance(node, ast.ClassDef) and any(
+            (isinstance(base, ast.Name) and (base.id in api["scenes"] if api else base.id.endswith("Scene")))
+            or (isinstance(base, ast.Attribute) and base.value.id in manim_aliases
+                if isinstance(base, ast.Attribute) and isinstance(base.value, ast.Name) else False)
+            for base in node.bases)
+    ]
+    if len(scenes) != 1:
+        raise PreflightError(f"Expected exactly one Scene subclass, found {len(scenes)}",
+                             ("SceneError", f"{len(scenes)} scenes"))
+    if not any(isinstance(item, ast.FunctionDef) and item.name == "construct" for item in scenes[0].body):
+        raise PreflightError(f"{scenes[0].name} has no construct method", ("SceneError", "no construct"))
+
+    if api and resolvable:
+        bound = _bound_names(tree)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) \
+                    and node.id not in bound and node.id not in available:
+                raise PreflightError(f"NameError: name '{node.id}' is not defined (line {node.lineno})",
+                                     ("NameError", node.id))
+
+
+def validate_code(code: str) -> None:
+    """Raise ``PreflightError`` if ``code`` cannot be a renderable manim program"""
+    key = _code_key(code)
+    with _failures_lock:
+        _stats["checked"] += 1
+        known = _failures.get(key)
+        if known is not None:
+            _failures.move_to_end(key)
+            _stats["cache_hits"] += 1
+            _stats["rejected"] += 1
+    if known is not None:
+        raise PreflightError(known[0], known[1])
+
+    try:
+        _check(code)
+    except PreflightError as e:
+        with _failures_lock:
+            _stats["rejected"] += 1
+        record_failure(code, str(e), e.signature)
+        raise
@@ -0,0 +1,178 @@
+"""
+Local repairs of LLM-generated manim code.
+
+Generated programs fail in the same few ways again and again: names from
+older manim versions (``ShowCreation``, ``TextMobject``), ``manimlib``
+imports, a missing ``from manim import *``. ``repair_locally`` rewrites
+those without a model call.
+
+A failure is identified by its (error class, offending line) signature, from
+``code_preflight.failure_signature`` or a ``PreflightError``. When an LLM
+repair of a failure renders, ``learn`` remembers what it did to the
+offending line (or, for an unknown name, what it renamed the name to), so
+the next program failing with the same signature gets the same rewrite
+locally.
+"""
+
+import difflib
+import io
+import re
+import threading
+import tokenize
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from code_preflight import Signature, manim_api
+
+LEARNED_CACHE_SIZE = 1024
+
+# Names removed from manim Community Edition and their drop-in replacements
+LEGACY_NAMES = {
+    "ShowCreation": "Create",
+    "TextMobject": "Text",
+    "TexMobject": "MathTex",
+    "TexText": "Tex",
+    "FadeInFromDown": "FadeIn",
+    "FadeInFromLarge": "FadeIn",
+    "get_graph": "plot",
+}
+
+_MANIMLIB_IMPORT = re.compile(r"^(\s*)(from\s+manimlib(\.\w+)*\s+import\s+\*|import\s+manimlib(\.\w+)*)\s*$")
+
+
+def _replace_names(code: str, renames: Dict[str, str]) -> str:
+    """Rename identifier tokens (not strings or comments) listed in ``renames``"""
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(code).readline))
+    except (tokenize.TokenError, SyntaxError):
+        return code
+    lines = code.splitlines(keepends=True)
+    # Right to left, so earlier columns on a line stay valid
+    for token in reversed(tokens):
+        if token.type == tokenize.NAME and token.string in renames:
+            row, col = token.start
+            line = lines[row - 1]
+            lines[row - 1] = line[:col] + renames[token.string] + line[col + len(token.string):]
+    return "".join(lines)
+
+
+def _rename_legacy_names(code: str, signature: Signature) -> str:
+    api = manim_api()
+    renames = {old: new for old, new in LEGACY_NAMES.items() if not api or old not in api["names"]}
+    return _replace_names(code, renames)
+
+
+def _fix_manimlib_imports(code: str, signature: Signature) -> str:
+    lines = [_MANIMLIB_IMPORT.sub(r"\1from manim import *", line) for line in code.split("\n")]
+    return "\n".join(lines)
+
+
+def _add_manim_import(code: str, signature: Signature) -> str:
+    if signature[0] != "NameError" or re.search(r"^from\s+manim\s+import\s+\*", code, re.M):
+        return code
+    return "from manim import *\n\n" + code
+
+
+# Applied in order; each returns the code unchanged when it does not apply
+RULES: List[Callable[[str, Signature], str]] = [
+    _fix_manimlib_imports,
+    _rename_legacy_names,
+    _add_manim_import,
+]
+
+
+# ---------------------------------------------------------------------------
+# Learned rewrites
+# ---------------------------------------------------------------------------
+
+# Signature -> ("line", replacement line) or ("name", replacement name)
+_learned: "OrderedDict[Signature, Tuple[str, str]]" = OrderedDict()
+_learned_lock = threading.Lock()
+_stats = {"local_repairs": 0, "learned_repairs": 0, "llm_repairs": 0, "unrepaired": 0}
+
+
+def _apply_learned(code: str, signature: Signature) -> str:
+    offending = signature[1]
+    with _learned_lock:
+        rewrite = _learned.get(tuple(signature))
+    if rewrite is None:
+        return code
+    kind, replacement = rewrite
+    if kind == "name":
+        return _replace_names(code, {offending: replacement})
+
+    lines = code.split("\n")
+    for i, line in enumerate(lines):
+        if line.strip() == offending:
+            indent = line[:len(line) - len(line.lstrip())]
+            lines[i] = indent + replacement
+    return "\n".join(lines)
+
+
+def _name_tokens(line: str) -> List[str]:
+    try:
+        return [t.string for t in tokenize.generate_tokens(io.StringIO(line).readline) if t.string.strip()]
+    except (tokenize.TokenError, SyntaxError, IndentationError):
+        return []
+
+
+def _learned_rewrite(signature: Signature, failed_code: str, repaired_code: str) -> Optional[Tuple[str, str]]:
+    offending = signature[1]
+    old_lines = [line.strip() for line in failed_code.split("\n")]
+    new_lines = [line.strip() for line in repaired_code.split("\n")]
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "replace" or i2 - i1 != j2 - j1:
+            continue
+        for old_line, new_line in zip(old_lines[i1:i2], new_lines[j1:j2]):
+            if old_line == offending and i2 - i1 == 1:
+                return "line", new_line
+            if signature[0] == "NameError" and offending.isidentifier():
+                # An unknown name: learn the token the model put in its place
+                old_tokens, new_tokens = _name_tokens(old_line), _name_tokens(new_line)
+                if offending not in old_tokens or len(old_tokens) != len(new_tokens):
+                    continue
+                changed = {(a, b) for a, b in zip(old_tokens, new_tokens) if a != b}
+                if len(changed) == 1 and next(iter(changed))[0] == offending \
+                        and next(iter(changed))[1].isidentifier():
+                    return "name", next(iter(changed))[1]
+    return None
+
+
+def learn(signature: Signature, failed_code: str, repaired_code: str):
+    """Remember how a model repair changed the offending line or name of ``signature``"""
+    if not signature[1]:
+        return
+    rewrite = _learned_rewrite(signature, failed_code, repaired_code)
+    if rewrite is None:
+        return
+    with _learned_lock:
+        _learned[tuple(signature)] = rewrite
+        _learned.move_to_end(tuple(signature))
+        while len(_learned) > LEARNED_CACHE_SIZE:
+            _learned.popitem(last=False)
+
+
+def repair_locally(code: str, signature: Signature) -> Optional[Tuple[str, str]]:
+    """``(repaired code, "learned" | "local")``, or None when no known rewrite applies"""
+    learned = _apply_learned(code, signature)
+    if learned != code:
+        return learned, "learned"
+    repaired = code
+    for rule in RULES:
+        repaired = rule(repaired, signature)
+    if repaired != code:
+        return repaired, "local"
+    return None
+
+
+def count_repair(kind: str):
+    """Count a repair that rendered (``local``, ``learned``, ``llm``) or gave up (``unrepaired``)"""
+    key = kind if kind == "unrepaired" else f"{kind}_repairs"
+    with _learned_lock:
+        _stats[key] += 1
+
+
+def repair_stats() -> Dict[str, int]:
+    with _learned_lock:
+        return {**_stats, "learned_signatures": len(_learned)}
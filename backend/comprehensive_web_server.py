@@ -1,6 +1,8 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify
 from flask_cors import CORS
+from video_serving import ArtifactIndex, register_flask_video_routes
 from manim_config_fix import setup_manim_environment
+from render_workspace import job_workspace, publish_movie
 import uuid
 import os
 
@@ -303,10 +305,15 @@ def generate_animation():
     
     try:
         session_id = str(uuid.uuid4())[:8]
-        scene = WebScene()
-        scene.render()
         
-        video_path = "media/videos/480p15/WebScene.mp4"
+        # Render in a private scratch directory so concurrent requests never collide
+        with job_workspace(session_id):
+            scene = WebScene()
+            scene.render()
+            video_path = publish_movie(scene, os.path.join("media", f"{session_id}.mp4"))
+        
+        if video_path is None:
+            return jsonify({"error": "Animation generation failed: no video was written"})
         
         return jsonify({
             "success": True,
@@ -319,12 +326,9 @@ def generate_animation():
     except Exception as e:
         return jsonify({"error": f"Animation generation failed: {str(e)}"})
 
-@app.route('/video/<session_id>')
-def serve_video(session_id):
-    video_path = os.path.join("media", "videos", "480p15", "WebScene.mp4")
-    if os.path.exists(video_path):
-        return send_file(video_path, mimetype='video/mp4')
-    return jsonify({"error": "Video not found"}), 404
+# Videos with byte ranges, ETags and 304s: GET /video/<session_id>
+videos = ArtifactIndex("media", suffix=".mp4")
+register_flask_video_routes(app, videos)
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -1,37 +1,50 @@
 import json
 import re
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import manim as mn
 import numpy as np
 import os
+from render_workspace import job_workspace, publish_movie
+from progress import instrument_scene
+from task_graph import educational_video_graph, educational_video_result
+from render_cache import get_render_cache, make_key, source_digest
+from ffmpeg_tools import concat_videos
+
+_SOURCE_DIGEST = source_digest(__file__)
 
 class EducationalVideoGenerator:
+    # Quality settings applied to every scene this generator renders
+    render_settings = {
+        "quality": "medium_quality",
+        "format": "mp4",
+        "frame_rate": 24,
+    }
+    
     def __init__(self):
         self.output_dir = "media"
         os.makedirs(self.output_dir, exist_ok=True)
     
-    def generate_complete_educational_video(self, prompt: str, animation_id: str) -> Dict[str, Any]:
-        """Generate complete educational video with all 3 components"""
-        
-        # Step 1: Generate structured animation instructions
-        instructions = self._generate_animation_instructions(prompt)
-        
-        # Step 2: Create visual animation based on instructions
-        animation_path = self._create_visual_animation(instructions, animation_id)
-        
-        # Step 3: Generate educational explanation video
-        explanation_path = self._create_educational_explanation(prompt, instructions, f"{animation_id}_explanation")
-        
-        # Step 4: Combine all components into final video
-        final_video_path = self._combine_videos(animation_path, explanation_path, f"{animation_id}_final")
-        
-        return {
-            "instructions": instructions,
-            "animation_video": animation_path,
-            "explanation_video": explanation_path,
-            "final_video": final_video_path,
-            "status": "completed"
-        }
+    def generate_complete_educational_video(self, prompt: str, animation_id: str, pool=None) -> Dict[str, Any]:
+        """Generate complete educational video with all 3 components.
+
+        Runs the instructions -> {animation, explanation} -> combine pipeline;
+        with a render pool the animation and explanation render in parallel.
+        """
+        target = f"{type(self).__module__}:{type(self).__name__}"
+        graph = educational_video_graph(target, prompt, animation_id, instance=self)
+        return educational_video_result(graph.run(pool))
+    
+    def render_animation(self, prompt: str, instructions: Dict[str, Any], animation_id: str) -> str:
+        """Pipeline step: visual animation based on the instructions"""
+        return self._create_visual_animation(instructions, animation_id)
+    
+    def render_explanation(self, prompt: str, instructions: Dict[str, Any], animation_id: str) -> str:
+        """Pipeline step: educational explanation video"""
+        return self._create_educational_explanation(prompt, instructions, f"{animation_id}_explanation")
+    
+    def combine_videos(self, animation_path: str, explanation_path: str, animation_id: str) -> str:
+        """Pipeline step: combine all components into the final video"""
+        return self._combine_videos(animation_path, explanation_path, f"{animation_id}_final")
     
     def _generate_animation_instructions(self, prompt: str) -> Dict[str, Any]:
         """Generate structured set of animation instructions"""
@@ -208,30 +221,7 @@ class EducationalVideoGenerator:
                     self.wait(scene["duration"] - 1)
         
         # Render the scene
-        mn.config.media_dir = self.output_dir
-        mn.config.video_dir = os.path.join(self.output_dir, "videos")
-        mn.config.quality = "medium_quality"
-        mn.config.format = "mp4"
-        mn.config.frame_rate = 24
-        
-        scene = InstructionBasedScene()
-        scene.render()
-        
-        # Find and copy the video
-        video_files = []
-        for root, dirs, files in os.walk(mn.config.video_dir):
-            for file in files:
-                if file.endswith('.mp4'):
-                    video_files.append(os.path.join(root, file))
-        
-        if video_files:
-            latest_video = max(video_files, key=os.path.getctime)
-            final_path = os.path.join(self.output_dir, f"{animation_id}_animation.mp4")
-            import shutil
-            shutil.copy2(latest_video, final_path)
-            return final_path
-        
-        return None
+        return self._render_scene(InstructionBasedScene, f"{animation_id}_animation")
     
     def _create_educational_explanation(self, prompt: str, instructions: Dict[str, Any], explanation_id: str) -> str:
         """Create educational explanation video"""
@@ -317,39 +307,44 @@ class EducationalVideoGenerator:
                 self.wait(3)
         
         # Render explanation scene
-        scene = ExplanationScene()
-        scene.render()
-        
-        # Find and copy the video
-        video_files = []
-        for root, dirs, files in os.walk(mn.config.video_dir):
-            for file in files:
-                if file.endswith('.mp4'):
-                    video_files.append(os.path.join(root, file))
-        
-        if video_files:
-            latest_video = max(video_files, key=os.path.getctime)
-            final_path = os.path.join(self.output_dir, f"{explanation_id}.mp4")
-            import shutil
-            shutil.copy2(latest_video, final_path)
-            return final_path
-        
-        return None
+        return self._render_scene(ExplanationScene, explanation_id)
     
     def _combine_videos(self, animation_path: str, explanation_path: str, final_id: str) -> str:
-        """Combine animation and explanation into final educational video"""
+        """Combine intro card, animation and explanation into final educational video.
+
+        The clips are joined with ffmpeg's concat demuxer; all of them are
+        rendered with the same settings, so this is a stream copy.
+        """
+        final_path = os.path.join(self.output_dir, f"{final_id}.mp4")
+        intro_path = os.path.join(self.output_dir, f"{final_id}_intro.mp4")
+        try:
+            clips = [self._intro_card(intro_path), animation_path, explanation_path]
+            return concat_videos(clips, final_path) or animation_path
+        except Exception as e:
+            print(f"Combining videos failed: {e}")
+            return animation_path  # Fallback to animation if combination fails
+        finally:
+            if os.path.exists(intro_path):
+                os.remove(intro_path)
+    
+    def _intro_card(self, dest_path: str) -> Optional[str]:
+        """Place the intro card shown before every video at ``dest_path``.
+
+        Rendered once and kept in the render cache. The job gets its own link
+        or copy, so evicting the cache entry cannot break a concat in progress.
+        """
         
-        class CombinedScene(mn.Scene):
+        class IntroScene(mn.Scene):
             def construct(self):
                 # Introduction slide
                 intro = mn.Text("Complete Educational Video", font_size=24, color="#00FFFF")
-                intro.shift(UP * 1)
+                intro.shift(mn.UP * 1)
                 
                 subtitle = mn.Text("Animation + Explanation", font_size=16, color="#FFFFFF")
-                subtitle.shift(DOWN * 0.5)
+                subtitle.shift(mn.DOWN * 0.5)
                 
                 self.play(mn.Write(intro), mn.Write(subtitle), run_time=2)
-                self.wait(2)
+                self.wait(1)
                 
                 # Transition message
                 self.play(mn.FadeOut(intro), mn.FadeOut(subtitle))
@@ -357,36 +352,41 @@ class EducationalVideoGenerator:
                 transition = mn.Text("Watch the animation, then learn the concepts!", 
                                     font_size=18, color="#FFFF00")
                 self.play(mn.Write(transition), run_time=1.5)
-                self.wait(2)
+                self.wait(1)
                 self.play(mn.FadeOut(transition))
-                
-                # Note: In a real implementation, you would use video editing libraries
-                # to actually combine the videos. For now, we create a placeholder.
-                
-                final_message = mn.Text("Animation and Explanation Combined", 
-                                       font_size=20, color="#00FF00")
-                self.play(mn.Write(final_message), run_time=2)
-                self.wait(3)
-        
-        # Render combined scene
-        scene = CombinedScene()
-        scene.render()
         
-        # Find and copy the video
-        video_files = []
-        for root, dirs, files in os.walk(mn.config.video_dir):
-            for file in files:
-                if file.endswith('.mp4'):
-                    video_files.append(os.path.join(root, file))
+        cache = get_render_cache()
+        key = make_key({
+            "generator": "EducationalVideoGenerator.intro_card",
+            "source": _SOURCE_DIGEST,
+            "settings": self.render_settings,
+        })
+        if cache.fetch(key, dest_path):
+            return dest_path
         
-        if video_files:
-            latest_video = max(video_files, key=os.path.getctime)
-            final_path = os.path.join(self.output_dir, f"{final_id}.mp4")
-            import shutil
-            shutil.copy2(latest_video, final_path)
-            return final_path
+        # Rendered under the job's own name, so concurrent jobs never share it
+        video_id = os.path.splitext(os.path.basename(dest_path))[0]
+        rendered = self._render_scene(IntroScene, video_id)
+        if not rendered:
+            return None
+        cache.put(key, rendered)
+        if os.path.abspath(rendered) != os.path.abspath(dest_path):
+            os.replace(rendered, dest_path)
+        return dest_path
+    
+    def _render_scene(self, scene_class, video_id: str) -> str:
+        """Render a scene in its own scratch directory and return the video path"""
         
-        return animation_path  # Fallback to animation if combination fails
+        final_path = os.path.join(self.output_dir, f"{video_id}.mp4")
+        with job_workspace(video_id):
+            for key, value in self.render_settings.items():
+                setattr(mn.config, key, value)
+            
+            scene = instrument_scene(scene_class(), label=video_id)
+            scene.render()
+            
+            # Take the output straight from the file writer
+            return publish_movie(scene, final_path)
     
     def _identify_concept(self, prompt: str) -> str:
         """Identify the main concept from prompt"""
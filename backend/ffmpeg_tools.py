@@ -0,0 +1,245 @@
+"""
+ffmpeg helpers for post-processing rendered videos.
+
+Joining clips goes through ffmpeg's concat demuxer with stream copy, so
+already-encoded frames are never decoded or rasterized again. Clips whose
+encoding parameters differ are re-encoded to the first clip's format instead.
+
+Finished videos are written in a web delivery profile (``EDUARENA_MP4_PROFILE``):
+``faststart`` puts the index (moov atom) in front of the frames and
+``fragmented`` writes a fragmented MP4. Either way a browser starts playing
+after the first few KB instead of downloading the whole file. manim's own
+output keeps the index at the end. ``EDUARENA_KEYFRAME_SECONDS`` sets the
+keyframe interval for seeking. Setting it makes the final mux re-encode
+instead of copying.
+"""
+
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import uuid
+from typing import Dict, List, Optional
+
+# Fields that must agree between clips for a stream-copy concat
+COPY_COMPATIBLE_FIELDS = ("codec", "pix_fmt", "width", "height", "fps")
+
+_STREAM_RE = re.compile(r"Stream #\d+:\d+.*?: Video: (?P<codec>\w+)(?P<rest>.*)")
+_SIZE_RE = re.compile(r"(?<![\w.])(\d{2,5})x(\d{2,5})(?![\w.])")
+_FPS_RE = re.compile(r"([\d.]+) fps")
+_PIX_FMT_RE = re.compile(r",\s*(yuv\w+|rgb\w+|bgr\w+|gray\w*|nv\d+)")
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):([\d.]+)")
+
+# Web delivery profile of finished videos: "faststart", "fragmented" or "off"
+MP4_PROFILE = os.environ.get("EDUARENA_MP4_PROFILE", "faststart")
+# Seconds between keyframes of finished videos; 0 keeps the encoder's
+KEYFRAME_SECONDS = float(os.environ.get("EDUARENA_KEYFRAME_SECONDS", 0))
+PROFILE_MOVFLAGS = {
+    "faststart": "+faststart",
+    # A fragment starts at every keyframe
+    "fragmented": "+frag_keyframe+empty_moov+default_base_moof",
+}
+
+
+def ffmpeg_binary() -> str:
+    """ffmpeg executable: FFMPEG_BINARY, then PATH, then the imageio-ffmpeg build"""
+    configured = os.environ.get("FFMPEG_BINARY")
+    if configured and os.path.exists(configured):
+        return configured
+
+    found = shutil.which("ffmpeg")
+    if found:
+        return found
+
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        pass
+    raise FileNotFoundError("ffmpeg not found; set FFMPEG_BINARY or add ffmpeg to PATH")
+
+
+def run_ffmpeg(args: List[str], timeout: float = 120) -> subprocess.CompletedProcess:
+    """Run ffmpeg with ``args`` and raise with its stderr on failure"""
+    result = subprocess.run(
+        [ffmpeg_binary(), "-hide_banner", "-nostdin", "-y", *args],
+        capture_output=True, text=True, timeout=timeout,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed ({result.returncode}): {result.stderr[-2000:]}")
+    return result
+
+
+def probe_video(path: str) -> Dict[str, object]:
+    """Encoding parameters of the first video stream of ``path``.
+
+    Parsed from ``ffmpeg -i`` so no separate ffprobe binary is needed.
+    """
+    result = subprocess.run(
+        [ffmpeg_binary(), "-hide_banner", "-nostdin", "-i", path],
+        capture_output=True, text=True, timeout=30,
+    )
+    for line in result.stderr.splitlines():
+        match = _STREAM_RE.search(line)
+        if not match:
+            continue
+        rest = match.group("rest")
+        size = _SIZE_RE.search(rest)
+        fps = _FPS_RE.search(rest)
+        pix_fmt = _PIX_FMT_RE.search(rest)
+        return {
+            "codec": match.group("codec"),
+            "pix_fmt": pix_fmt.group(1) if pix_fmt else None,
+            "width": int(size.group(1)) if size else None,
+            "height": int(size.group(2)) if size else None,
+            "fps": float(fps.group(1)) if fps else None,
+        }
+    raise ValueError(f"No video stream in {path}")
+
+
+def can_stream_copy(probes: List[Dict[str, object]]) -> bool:
+    """True when every clip matches the first one on all copy-relevant fields"""
+    first = probes[0]
+    return all(
+        probe[field] == first[field] and first[field] is not None
+        for probe in probes[1:] for field in COPY_COMPATIBLE_FIELDS
+    )
+
+
+def delivery_args(profile: Optional[str] = None) -> List[str]:
+    """Muxer options of a web delivery profile (default ``MP4_PROFILE``)"""
+    flags = PROFILE_MOVFLAGS.get(profile or MP4_PROFILE)
+    return ["-movflags", flags] if flags else []
+
+
+def keyframe_args(seconds: Optional[float] = None) -> List[str]:
+    """Encoder options for a keyframe every ``seconds`` (default ``KEYFRAME_SECONDS``)"""
+    seconds = KEYFRAME_SECONDS if seconds is None else seconds
+    if seconds <= 0:
+        return []
+    return ["-force_key_frames", f"expr:gte(t,n_forced*{seconds:g})"]
+
+
+def web_delivery_enabled() -> bool:
+    """Whether finished videos need a final mux at all"""
+    return MP4_PROFILE in PROFILE_MOVFLAGS or KEYFRAME_SECONDS > 0
+
+
+def finalize_mp4(path: str, dest_path: str) -> str:
+    """Write the video ``path`` to ``dest_path`` in the web delivery profile
+    and return ``dest_path``.
+
+    Streams are copied unless a keyframe interval is set, which needs a
+    re-encode.
+    """
+    keyframes = keyframe_args()
+    codec = ["-c:v", "libx264", "-pix_fmt", "yuv420p", *keyframes] if keyframes else ["-c", "copy"]
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    temp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp.mp4"
+    try:
+        run_ffmpeg(["-i", path, "-map", "0", *codec, *delivery_args(), temp_path],
+                   timeout=600 if keyframes else 120)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    os.replace(temp_path, dest_path)
+    return dest_path
+
+
+def _concat_list_entry(path: str) -> str:
+    escaped = os.path.abspath(path).replace("\\", "/").replace("'", "'\\''")
+    return f"file '{escaped}'\n"
+
+
+def concat_videos(paths: List[str], dest_path: str, web: bool = True) -> Optional[str]:
+    """Join ``paths`` in order into ``dest_path`` and return it.
+
+    Uses the concat demuxer with ``-c copy`` when all clips share codec,
+    pixel format, size and frame rate; otherwise re-encodes to the first
+    clip's size and frame rate. A configured keyframe interval also needs
+    the re-encode. With ``web`` the result is in the web delivery profile;
+    intermediate clips skip that. Audio is not carried over (manim clips
+    have none unless sounds were added).
+    """
+    paths = [p for p in paths if p and os.path.exists(p)]
+    if not paths:
+        return None
+
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    temp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp.mp4"
+    probes = [probe_video(p) for p in paths]
+    try:
+        _concat(paths, probes, temp_path, web)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    os.replace(temp_path, dest_path)
+    return dest_path
+
+
+def _concat(paths: List[str], probes: List[Dict[str, object]], temp_path: str, web: bool = True):
+    keyframes = keyframe_args() if web else []
+    delivery = delivery_args() if web else []
+    if can_stream_copy(probes) and not keyframes:
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+            f.writelines(_concat_list_entry(p) for p in paths)
+            list_path = f.name
+        try:
+            run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_path,
+                        "-map", "0:v", "-c", "copy", *delivery, temp_path])
+        finally:
+            os.remove(list_path)
+    else:
+        first = probes[0]
+        width, height = first["width"], first["height"]
+        fps = first["fps"] or 30
+        inputs, filters = [], []
+        for i, path in enumerate(paths):
+            inputs += ["-i", path]
+            filters.append(
+                f"[{i}:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps},format=yuv420p[v{i}]"
+            )
+        joined = "".join(f"[v{i}]" for i in range(len(paths)))
+        filters.append(f"{joined}concat=n={len(paths)}:v=1:a=0[out]")
+        run_ffmpeg([*inputs, "-filter_complex", ";".join(filters), "-map", "[out]",
+                    "-c:v", "libx264", "-pix_fmt", "yuv420p", *keyframes, *delivery, temp_path],
+                   timeout=600)
+
+
+def open_raw_video_encoder(dest_path: str, width: int, height: int, fps: float) -> subprocess.Popen:
+    """Start an encoder reading raw RGBA frames on stdin.
+
+    Uses the same codec settings as manim's partial movies, so the output
+    can be stream-copy concatenated with them.
+    """
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    if fps == int(fps):
+        fps = int(fps)
+    return subprocess.Popen(
+        [ffmpeg_binary(), "-hide_banner", "-nostdin", "-y", "-loglevel", "error",
+         "-f", "rawvideo", "-s", f"{width}x{height}", "-pix_fmt", "rgba", "-r", str(fps),
+         "-i", "-", "-an", "-vcodec", "libx264", "-pix_fmt", "yuv420p", dest_path],
+        stdin=subprocess.PIPE,
+    )
+
+
+def remux_to_mpegts(path: str, dest_path: str, offset: float = 0.0) -> float:
+    """Copy the video of ``path`` into an MPEG-TS file whose timestamps start
+    at ``offset`` seconds, and return the clip's duration.
+
+    The H.264 stream is copied, not re-encoded, so this takes milliseconds.
+    """
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    result = run_ffmpeg(["-i", path, "-map", "0:v", "-c", "copy", "-bsf:v", "h264_mp4toannexb",
+                         "-output_ts_offset", f"{offset:.6f}", "-f", "mpegts", dest_path])
+    match = _DURATION_RE.search(result.stderr)
+    if not match:
+        raise ValueError(f"No duration reported for {path}")
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
@@ -15,14 +15,18 @@ manim.config.quality = "low_quality"
 manim.config.media_dir = os.path.join(backend_dir, "media")
 
 from manim import *
-import uuid
-import shutil
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import uuid
+from concurrent.futures import CancelledError
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
 from pydantic import BaseModel
+from video_serving import ArtifactIndex, register_video_routes
+from render_pool import RenderCancelledError, cancel_render_jobs, get_render_pool, shutdown_render_pool
+from render_workspace import job_workspace, publish_movie
+from job_store import get_job_store
+from progress import ProgressBroker, register_progress_routes, instrument_scene
+from hls_stream import HLS_DIR, HLS_PREFIX, progressive_hls
 
 app = FastAPI()
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
@@ -30,10 +34,36 @@ app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], all
 class AnimationRequest(BaseModel):
     prompt: str
 
-animation_status = {}
-executor = ThreadPoolExecutor(max_workers=1)
+jobs = get_job_store()
+progress = ProgressBroker(jobs)
+register_progress_routes(app, jobs, progress)
+
+# Renders on this process's pool; cancels made on another API process are polled for
+local_renders = set()
+CANCEL_POLL_SECONDS = 0.5
+background_tasks = set()
+
+@app.on_event("startup")
+async def start_render_pool():
+    get_render_pool().add_progress_listener(progress.pool_listener)
+    background_tasks.add(asyncio.create_task(watch_cancellations()))
+
+@app.on_event("shutdown")
+async def stop_render_pool():
+    for task in background_tasks:
+        task.cancel()
+    shutdown_render_pool()
+
+async def watch_cancellations():
+    while True:
+        await asyncio.sleep(CANCEL_POLL_SECONDS)
+        for animation_id in list(local_renders):
+            record = jobs.get(animation_id)
+            if record is not None and record.get("status") == "cancelled":
+                cancel_render_jobs(animation_id)
 
 def create_animation(prompt: str, animation_id: str):
+    """Render the scene for a prompt inside a render worker and return its status"""
     try:
         prompt_lower = prompt.lower()
         
@@ -100,46 +130,77 @@ def create_animation(prompt: str, animation_id: str):
                     self.wait(1)
             scene_class = DefaultScene
         
-        scene = scene_class()
-        scene.render()
+        # Render in a private scratch directory and take the output from the file writer
+        with job_workspace(animation_id):
+            scene = instrument_scene(scene_class())
+            # Playable as HLS from the first finished play
+            with progressive_hls(scene, animation_id):
+                scene.render()
+            dst = publish_movie(scene, os.path.join(backend_dir, "media", f"{animation_id}.mp4"))
         
-        # Find video
-        for root, dirs, files in os.walk(os.path.join(backend_dir, "media")):
-            for file in files:
-                if file.endswith('.mp4'):
-                    src = os.path.join(root, file)
-                    dst = os.path.join(backend_dir, "media", f"{animation_id}.mp4")
-                    shutil.copy2(src, dst)
-                    animation_status[animation_id] = {"status": "completed", "video_url": f"/video/{animation_id}.mp4"}
-                    return
+        if dst:
+            return {"status": "completed", "video_url": f"/video/{animation_id}.mp4"}
         
-        animation_status[animation_id] = {"status": "failed", "error": "No video generated"}
+        return {"status": "failed", "error": "No video generated"}
         
     except Exception as e:
-        animation_status[animation_id] = {"status": "failed", "error": str(e)}
+        return {"status": "failed", "error": str(e)}
+
+def record_animation_result(animation_id: str, future):
+    local_renders.discard(animation_id)
+    try:
+        result = future.result()
+    except (RenderCancelledError, CancelledError):
+        # Usually already recorded by the cancel request
+        result = {"status": "cancelled"}
+    except Exception as e:
+        result = {"status": "failed", "error": str(e)}
+    status = result.pop("status")
+    if result.get("video_url"):
+        # Cacheable URL of this version of the video
+        result["video_url"] = videos.url(f"{animation_id}.mp4") or result["video_url"]
+    if jobs.transition(animation_id, status, expected=("processing",), **result):
+        progress.publish(animation_id, status, **result)
 
 @app.post("/generate-animation")
 async def generate_animation(request: AnimationRequest):
     animation_id = str(uuid.uuid4())
-    animation_status[animation_id] = {"status": "processing"}
+    jobs.create(animation_id, {"status": "processing"})
+    progress.publish(animation_id, "queued")
     
-    loop = asyncio.get_event_loop()
-    loop.run_in_executor(executor, create_animation, request.prompt, animation_id)
+    pool = get_render_pool()
+    future= pool.submit(create_animation, request.prompt, animation_id, job_id=animation_id)
+    local_renders.add(animation_id)
+    future.add_done_callback(lambda f: record_animation_result(animation_id, f))
     
-    return {"id": animation_id, "status": "processing"}
+    eta = pool.eta(animation_id)
+    return {"id": animation_id, "status": "processing", "eta_seconds": None if eta is None else round(eta, 1)}
+
+@app.delete("/animation/{animation_id}")
+async def cancel_animation(animation_id: str):
+    """Cancel a render: a queued job is dropped, a running one killed with its worker"""
+    record = jobs.get(animation_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not jobs.transition(animation_id, "cancelled", expected=("processing",)):
+        raise HTTPException(status_code=409, detail=f"Animation is already {record['status']}")
+    cancel_render_jobs(animation_id)
+    progress.publish(animation_id, "cancelled")
+    return {"id": animation_id, "status": "cancelled"}
 
 @app.get("/animation-status/{animation_id}")
 async def get_status(animation_id: str):
-    if animation_id not in animation_status:
+    record = jobs.get(animation_id)
+    if record is None:
         raise HTTPException(status_code=404, detail="Not found")
-    return animation_status[animation_id]
-
-@app.get("/video/{filename}")
-async def get_video(filename: str):
-    video_path = os.path.join(backend_dir, "media", filename)
-    if os.path.exists(video_path):
-        return FileResponse(video_path, media_type="video/mp4")
-    raise HTTPException(status_code=404, detail="Video not found")
+    return record
+
+# Videos with byte ranges, ETags and 304s: GET /video/{filename}
+videos = ArtifactIndex(os.path.join(backend_dir, "media"))
+register_video_routes(app, videos)
+
+# Live playlists of renders in progress, as playlist_url in the status: GET /hls/{id}.m3u8
+register_video_routes(app, ArtifactIndex(HLS_DIR), prefix=HLS_PREFIX)
 
 @app.get("/health")
 async def health():
@@ -15,8 +15,8 @@ import asyncio
 from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
 from pydantic import BaseModel
+from video_serving import ArtifactIndex, register_video_routes
 
 app = FastAPI()
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
@@ -93,13 +93,9 @@ async def get_animation_status(animation_id: str):
         raise HTTPException(status_code=404, detail="Animation not found")
     return animation_status[animation_id]
 
-@app.get("/video/{filename}")
-async def get_video(filename: str):
-    backend_dir = os.path.dirname(os.path.abspath(__file__))
-    video_path = os.path.join(backend_dir, "media", filename)
-    if os.path.exists(video_path):
-        return FileResponse(video_path, media_type="video/mp4")
-    raise HTTPException(status_code=404, detail="Video not found")
+# Videos with byte ranges, ETags and 304s: GET /video/{filename}
+videos = ArtifactIndex(os.path.join(os.path.dirname(os.path.abspath(__file__)), "media"))
+register_video_routes(app, videos)
 
 @app.get("/health")
 async def health():
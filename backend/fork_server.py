@@ -0,0 +1,362 @@
+"""
+Fork server for rendering LLM-generated manim code.
+
+Starting ``python -m manim`` for every job costs seconds of interpreter start
+and manim import. Instead a zygote process imports manim once and forks a
+child per job. The child runs the generated module from an in-memory
+namespace in a private scratch directory, under CPU and address-space
+rlimits, and reports the rendered video path back. The zygote kills
+children that run past their wall-time limit, so a runaway program never
+outlives its job.
+
+Forking needs ``os.fork``; on Windows ``fork_server_enabled()`` is False and
+callers keep rendering in a ``python -m manim`` subprocess.
+"""
+
+import importlib
+import json
+import multiprocessing as mp
+import os
+import selectors
+import shutil
+import signal
+import sys
+import threading
+import time
+import traceback
+import types
+import uuid
+from concurrent.futures import Future
+from typing import Any, Dict, Iterable, Optional
+
+from code_preflight import SceneCodeError
+from render_workspace import scratch_dir
+
+DEFAULT_WALL_SECONDS = 60
+DEFAULT_MEMORY_MB = 2048
+
+
+def fork_server_enabled() -> bool:
+    """``EDUARENA_FORK_SERVER`` is ``auto`` (default: on where fork exists), ``1`` or ``0``"""
+    setting = os.environ.get("EDUARENA_FORK_SERVER", "auto")
+    if setting == "0" or not hasattr(os, "fork") or sys.platform == "win32":
+        return False
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Zygote and job children
+# ---------------------------------------------------------------------------
+
+def _apply_limits(limits: Dict[str, Any]):
+    import resource
+
+    cpu = limits.get("cpu_seconds")
+    if cpu:
+        resource.setrlimit(resource.RLIMIT_CPU, (int(cpu), int(cpu) + 1))
+    memory = limits.get("memory_mb")
+    if memory:
+        size = int(memory) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (size, size))
+
+
+def render_generated_code(job_id: str, code: str, dest_path: str, quality: str = "low_quality") -> Optional[str]:
+    """Run ``code`` as a fresh module, render its first Scene and move it to ``dest_path``"""
+    import manim as mn
+    from render_workspace import job_workspace, publish_movie
+
+    module = types.ModuleType(f"generated_{job_id.replace('-', '_')}")
+    with job_workspace(job_id):
+        mn.config.quality = quality
+        mn.config.preview = False
+        exec(compile(code, f"<generated {job_id}>", "exec"), module.__dict__)
+        scenes = [
+            obj for obj in vars(module).values()
+            if isinstance(obj, type) and issubclass(obj, mn.Scene) and obj.__module__ == module.__name__
+        ]
+        if not scenes:
+            raise ValueError("Generated code defines no Scene subclass")
+        scene = scenes[0]()
+        scene.render()
+        return publish_movie(scene, dest_path)
+
+
+def _run_child(write_fd: int, job_id: str, code: str, dest_path: str, quality: str, limits: Dict[str, Any]):
+    """Body of a forked job child; never returns"""
+    status = 0
+    try:
+        # Own process group, so a kill also reaches manim's ffmpeg
+        os.setpgid(0, 0)
+        _apply_limits(limits)
+        result = {"video_path": render_generated_code(job_id, code, dest_path, quality)}
+    except BaseException as e:
+        result = {"error": f"{type(e).__name__}: {e}\n{traceback.format_exc()[-2000:]}",
+                  # Resource limits and I/O failures are not the program's fault
+                  "code_error": isinstance(e, Exception) and not isinstance(e, (OSError, MemoryError))}
+    try:
+        data = json.dumps(result).encode()
+        while data:
+            data = data[os.write(write_fd, data):]
+    except BaseException:
+        status = 1
+    os._exit(status)
+
+
+class _Child:
+    def __init__(self, job_id: str, pid: int, read_fd: int, deadline: float):
+        self.job_id = job_id
+        self.pid = pid
+        self.read_fd = read_fd
+        self.deadline = deadline
+        self.chunks = []
+        self.timed_out = False
+        self.cancelled = False
+
+
+def _zygote_main(conn, preload: Iterable[str]):
+    """Import manim once, then fork one child per render request"""
+    try:
+        from manim_config_fix import setup_manim_environment
+        setup_manim_environment()
+    except Exception as e:
+        print(f"Fork server: could not setup Manim environment: {e}")
+
+    import manim  # noqa: F401
+
+    for module_name in preload:
+        try:
+            importlib.import_module(module_name)
+        except Exception as e:
+            print(f"Fork server: failed to preload {module_name}: {e}")
+
+    selector = selectors.DefaultSelector()
+    selector.register(conn, selectors.EVENT_READ)
+    children: Dict[int, _Child] = {}
+    conn.send(("ready", os.getpid()))
+
+    def finish(child: _Child):
+        selector.unregister(child.read_fd)
+        os.close(child.read_fd)
+        del children[child.read_fd]
+        _, wait_status = os.waitpid(child.pid, 0)
+        # A killed child never reached its own cleanup
+        shutil.rmtree(scratch_dir(child.job_id), ignore_errors=True)
+        try:
+            result = json.loads(b"".join(child.chunks) or b"null")
+        except ValueError:
+            result = None
+        if child.cancelled:
+            result = {"error": "Render cancelled"}
+        elif child.timed_out:
+            result = {"error": "Render exceeded its wall-time limit"}
+        elif not result:
+            if os.WIFSIGNALED(wait_status):
+                reason = signal.Signals(os.WTERMSIG(wait_status)).name
+            else:
+                reason = f"exit code {os.WEXITSTATUS(wait_status)}"
+            result = {"error": f"Render process died ({reason})"}
+        try:
+            conn.send(("done", child.job_id, result.get("video_path"), result.get("error"),
+                       bool(result.get("code_error"))))
+        except OSError:
+            pass
+
+    running = True
+    while running or children:
+        now = time.monotonic()
+        for child in children.values():
+            if not child.timed_out and child.deadline <= now:
+                child.timed_out = True
+                try:
+                    os.killpg(child.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+        deadlines = [c.deadline for c in children.values() if not c.timed_out]
+        timeout = max(0.0, min(deadlines) - now) if deadlines else None
+        for key, _ in selector.select(timeout):
+            if key.fileobj is conn:
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    message = None
+                if message is None:
+                    # Parent is gone or asked to stop: let running jobs finish
+                    selector.unregister(conn)
+                    running = False
+                    continue
+
+                if message[0] == "cancel":
+                    for child in children.values():
+                        if child.job_id == message[1] and not child.cancelled:
+                            child.cancelled = True
+                            try:
+                                os.killpg(child.pid, signal.SIGKILL)
+                            except ProcessLookupError:
+                                pass
+                    continue
+
+                _, job_id, code, dest_path, quality, limits = message
+                read_fd, write_fd = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    os.close(read_fd)
+                    _run_child(write_fd, job_id, code, dest_path, quality, limits)
+                os.close(write_fd)
+                child = _Child(job_id, pid, read_fd, time.monotonic() + limits["wall_seconds"])
+                children[read_fd] = child
+                selector.register(read_fd, selectors.EVENT_READ)
+            else:
+                child = children[key.fileobj]
+                data = os.read(child.read_fd, 65536)
+                if data:
+                    child.chunks.append(data)
+                else:
+                    finish(child)
+
+
+# ---------------------------------------------------------------------------
+# Parent side
+# ---------------------------------------------------------------------------
+
+class ForkServerError(RuntimeError):
+    """Raised in the parent when a forked render fails"""
+
+
+class ForkServer:
+    """Client of one zygote process; safe to use from any thread"""
+
+    def __init__(self, preload: Iterable[str] = ()):
+        self.preload = list(preload)
+        self._ctx = mp.get_context("spawn")
+        self._lock = threading.Lock()
+        self._futures: Dict[str, Future] = {}
+        # Group (e.g. the animation id) of each job, for cancel()
+        self._groups: Dict[str, str] = {}
+        self._conn = None
+        self._process = None
+
+    def _ensure_started(self):
+        """Start the zygote if it is not running. Caller holds the lock."""
+        if self._process is not None and self._process.is_alive():
+            return
+        parent_conn, child_conn = self._ctx.Pipe()
+        self._process = self._ctx.Process(target=_zygote_main, args=(child_conn, self.preload),
+                                          name="render-zygote", daemon=True)
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        threading.Thread(target=self._collect, args=(parent_conn,), name="fork-server-collector",
+                         daemon=True).start()
+
+    def submit(self, code: str, dest_path: str, wall_seconds: float = DEFAULT_WALL_SECONDS,
+               memory_mb: Optional[int] = None, quality: str = "low_quality",
+               group: Optional[str] = None) -> Future:
+        """Render ``code`` in a forked child and return a future of the video path.
+
+        The child's CPU time is limited to ``wall_seconds`` and its address
+        space to ``memory_mb`` (``EDUARENA_RENDER_MEMORY_MB``, default 2048);
+        it is killed once ``wall_seconds`` have passed. ``cancel(group)``
+        kills it earlier.
+        """
+        if memory_mb is None:
+            memory_mb = int(os.environ.get("EDUARENA_RENDER_MEMORY_MB", DEFAULT_MEMORY_MB))
+        limits = {"wall_seconds": wall_seconds, "cpu_seconds": wall_seconds, "memory_mb": memory_mb}
+
+        job_id = uuid.uuid4().hex
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            self._ensure_started()
+            self._futures[job_id] = future
+            if group is not None:
+                self._groups[job_id] = group
+            self._conn.send(("render", job_id, code, os.path.abspath(dest_path), quality, limits))
+        return future
+
+    def cancel(self, group: str) -> int:
+        """Kill the running renders of ``group``; their futures fail with
+        ``ForkServerError``. Returns the number of renders cancelled."""
+        with self._lock:
+            job_ids = [job_id for job_id, g in self._groups.items() if g == group]
+            if self._conn is None:
+                return 0
+            try:
+                for job_id in job_ids:
+                    self._conn.send(("cancel", job_id))
+            except OSError:
+                return 0
+        return len(job_ids)
+
+    def _collect(self, conn):
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] != "done":
+                continue
+            _, job_id, video_path, error, code_error = message
+            with self._lock:
+                future = self._futures.pop(job_id, None)
+                self._groups.pop(job_id, None)
+            if future is None:
+                continue
+            if error is None:
+                future.set_result(video_path)
+            elif code_error:
+                future.set_exception(SceneCodeError(error))
+            else:
+                future.set_exception(ForkServerError(error))
+
+        # Zygote exited: fail its jobs, the next submit starts a new one
+        with self._lock:
+            if self._conn is not conn:
+                return
+            failed = list(self._futures.values())
+            self._futures.clear()
+            self._groups.clear()
+        for future in failed:
+            future.set_exception(ForkServerError("Fork server exited"))
+
+    def shutdown(self):
+        with self._lock:
+            conn, process = self._conn, self._process
+            self._conn = self._process = None
+        if conn is not None:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        if process is not None:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+
+_server: Optional[ForkServer] = None
+_server_lock = threading.Lock()
+
+
+def get_fork_server(preload: Iterable[str] = ()) -> ForkServer:
+    """Return the process-wide fork server; its zygote starts on first submit"""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ForkServer(preload=preload)
+        return _server
+
+
+def cancel_fork_renders(group: str) -> int:
+    """Cancel the renders of ``group`` on the process-wide fork server, if it was started"""
+    with _server_lock:
+        server = _server
+    return server.cancel(group) if server is not None else 0
+
+
+def shutdown_fork_server():
+    global _server
+    with _server_lock:
+        if _server is not None:
+            _server.shutdown()
+            _server = None
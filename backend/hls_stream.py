@@ -0,0 +1,180 @@
+"""
+Progressive HLS output of a render in progress.
+
+manim writes one partial movie per ``play`` and only joins them once the
+scene is done, so a client normally waits for the whole render before the
+first frame. ``HlsPlaylist`` remuxes every finished partial movie (stream
+copy, no re-encode) into an MPEG-TS segment and appends it to a live
+``EVENT`` playlist, ``media/hls/<id>.m3u8``. A player starts on the first
+segment and reloads the playlist for the rest; ``#EXT-X-ENDLIST`` is written
+when the render ends.
+
+Segments may finish out of order (segment-parallel renders). They are
+published as the contiguous prefix grows, with timestamps offset so the
+stream plays without discontinuities. The playlist URL is reported with a
+``segment`` progress event, which the servers keep in the job record as
+``playlist_url``.
+
+``EDUARENA_PROGRESSIVE_HLS=0`` turns this off. Playlists and segments are
+removed after ``EDUARENA_HLS_TTL`` seconds (default 1h); the finished video
+stays at ``video_url``.
+"""
+
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ffmpeg_tools import remux_to_mpegts
+from progress import emit
+
+PROGRESSIVE_HLS = os.environ.get("EDUARENA_PROGRESSIVE_HLS", "1") != "0"
+HLS_DIR = os.path.join("media", "hls")
+# Servers serve HLS_DIR under this path
+HLS_PREFIX = "/hls"
+HLS_TTL_SECONDS = float(os.environ.get("EDUARENA_HLS_TTL", 3600))
+
+
+def prune_hls(root: str = HLS_DIR, max_age: float = HLS_TTL_SECONDS):
+    """Remove playlists and segments older than ``max_age`` seconds"""
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+class HlsPlaylist:
+    """Live playlist of one render, fed with finished movie files.
+
+    ``listener(stage, **data)`` is told about every published segment; the
+    default reports it as a progress event of the current pool job.
+    """
+
+    def __init__(self, name: str, root: str = HLS_DIR, listener: Callable[..., None] = emit):
+        self.name = name
+        self.root = root
+        self.listener = listener
+        # Segments of a re-render never overwrite those a player may still be loading
+        self.run = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._pending: Dict[int, str] = {}
+        self._segments: List[Tuple[str, float]] = []
+        self._offset = 0.0
+        self._ended = False
+        self._failed = False
+        os.makedirs(root, exist_ok=True)
+        prune_hls(root)
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.root, f"{self.name}.m3u8")
+
+    @property
+    def url(self) -> str:
+        return f"{HLS_PREFIX}/{self.name}.m3u8"
+
+    def add(self, index: int, movie_path: str):
+        """Publish ``movie_path`` as segment ``index`` once every segment before it is in"""
+        with self._lock:
+            if self._ended or self._failed:
+                return
+            self._pending[index] = movie_path
+            published = len(self._segments)
+            try:
+                while len(self._segments) in self._pending:
+                    source = self._pending.pop(len(self._segments))
+                    segment = f"{self.name}_{self.run}_{len(self._segments):05d}.ts"
+                    duration = remux_to_mpegts(source, os.path.join(self.root, segment), self._offset)
+                    self._segments.append((segment, duration))
+                    self._offset += duration
+            except Exception as e:
+                # Later segments cannot follow a gap; the finished video still arrives
+                print(f"Progressive output of {self.name} stopped: {e}")
+                self._failed = True
+            if len(self._segments) == published:
+                return
+            self._write()
+            count = len(self._segments)
+        self.listener("segment", playlist_url=self.url, segments=count)
+
+    def end(self):
+        """Mark the playlist complete; no segments are added after this"""
+        with self._lock:
+            if self._ended:
+                return
+            self._ended = True
+            if self._segments:
+                self._write()
+
+    def _write(self):
+        target = max(1, math.ceil(max(duration for _, duration in self._segments)))
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            # Players would otherwise join a live playlist near its end
+            "#EXT-X-START:TIME-OFFSET=0,PRECISE=YES",
+            "#EXT-X-INDEPENDENT-SEGMENTS",
+            # Raised when a longer play arrives; players accept that
+            f"#EXT-X-TARGETDURATION:{target}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for segment, duration in self._segments:
+            lines += [f"#EXTINF:{duration:.3f},", segment]
+        if self._ended:
+            lines.append("#EXT-X-ENDLIST")
+
+        # Readers only ever see a complete playlist
+        temp_path = f"{self.path}.{self.run}.tmp"
+        with open(temp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, self.path)
+
+
+def stream_partial_movies(scene, playlist: HlsPlaylist):
+    """Add each partial movie of ``scene`` to ``playlist`` as soon as its play
+    ends. Call before ``scene.render()``."""
+    renderer = scene.renderer
+    file_writer = getattr(renderer, "file_writer", None)
+    if file_writer is None:
+        return scene
+    end_animation = file_writer.end_animation
+    count = [0]
+
+    def streaming_end_animation(*args, **kwargs):
+        end_animation(*args, **kwargs)
+        # The renderer counts the play after this returns; skipped plays have no movie
+        files = getattr(file_writer, "partial_movie_files", [])
+        index = renderer.num_plays
+        movie_path = files[index] if index < len(files) else None
+        if movie_path and os.path.exists(movie_path):
+            playlist.add(count[0], str(movie_path))
+            count[0] += 1
+
+    file_writer.end_animation = streaming_end_animation
+    return scene
+
+
+@contextmanager
+def progressive_hls(scene, name: str):
+    """Stream the partial movies of ``scene`` to the playlist ``name`` while
+    the block renders it. Does nothing with ``EDUARENA_PROGRESSIVE_HLS=0``."""
+    if not PROGRESSIVE_HLS:
+        yield None
+        return
+    playlist = HlsPlaylist(name)
+    stream_partial_movies(scene, playlist)
+    try:
+        yield playlist
+    finally:
+        playlist.end()
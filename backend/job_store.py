@@ -0,0 +1,420 @@
+"""
+Job store for animation status records.
+
+Replaces the per-process ``animation_status`` / ``active_workflows`` dicts.
+Two backends share one interface:
+
+- ``SQLiteJobStore``: embedded SQLite file, safe to share between several
+  API processes (uvicorn workers) on one machine and survives restarts.
+- ``MemoryJobStore``: in-process dict for tests and single-process use.
+
+Records are plain dicts (what the status endpoints return). Finished jobs
+expire after a TTL so the store does not grow without bound.
+
+``create_or_join`` coalesces identical requests: while a job created under
+a request key is unfinished, a second request with that key gets the
+existing job id instead of a new job.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_DB_PATH = os.path.join("media", "job_store.sqlite3")
+
+# How often writers sweep expired jobs
+PURGE_INTERVAL_SECONDS = 60
+
+# Requests only join jobs younger than this, so a job orphaned by a crashed
+# server does not capture its prompt forever
+DEFAULT_JOIN_MAX_AGE = 30 * 60
+
+# Ids per query in SQLiteJobStore.get_many
+GET_MANY_CHUNK = 500
+
+
+def request_key(target: str, prompt: str, variant: Optional[str] = None) -> str:
+    """Key shared by identical generation requests: the generator and the
+    prompt with whitespace normalized. Case is kept, since generators draw
+    the prompt on screen. ``variant`` names render settings that differ
+    between otherwise identical requests, such as a degradation level."""
+    normalized = " ".join(prompt.split())
+    parts = [target, normalized] if variant is None else [target, normalized, variant]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+class JobStore:
+    """Interface shared by the job store backends"""
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._last_purge = 0.0
+
+    def _expiry(self, status: str, now: float) -> Optional[float]:
+        return now + self.ttl_seconds if status in FINISHED_STATUSES else None
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge >= PURGE_INTERVAL_SECONDS:
+            self._last_purge = now
+            self.purge_expired()
+
+    def create(self, job_id: str, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Insert a new job. ``record`` must contain a ``status``."""
+        raise NotImplementedError
+
+    def create_or_join(self, job_id: str, record: Dict[str, Any], key: str,
+                       max_age: float = DEFAULT_JOIN_MAX_AGE) -> Tuple[str, bool]:
+        """Create ``job_id`` unless an unfinished job younger than ``max_age``
+        was created under ``key``.
+
+        Returns the id of the job the caller should follow and whether it was
+        created. The key is released when its job finishes.
+        """
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_many(self, job_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Records of the existing jobs among ``job_ids``, by id, in one read"""
+        raise NotImplementedError
+
+    def put(self, job_id: str, record: Dict[str, Any]):
+        """Replace the whole record of a job, creating it if needed"""
+        raise NotImplementedError
+
+    def update(self, job_id: str, **fields) -> Optional[Dict[str, Any]]:
+        """Merge ``fields`` into an existing record and return it"""
+        raise NotImplementedError
+
+    def transition(self, job_id: str, status: str, expected: Iterable[str] = (), **fields) -> bool:
+        """Atomically move a job to ``status`` if its current status is in ``expected``.
+
+        An empty ``expected`` accepts any non-finished status. Returns False
+        (and changes nothing) when the job is missing or in another status.
+        """
+        raise NotImplementedError
+
+    def list_by_status(self, status: str, limit: int = 100) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def delete(self, job_id: str):
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        """Remove finished jobs whose TTL has passed. Returns the number removed."""
+        raise NotImplementedError
+
+    def __contains__(self, job_id: str) -> bool:
+        return self.get(job_id) is not None
+
+
+class MemoryJobStore(JobStore):
+    """Job store kept in a dict, for a single API process"""
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        super().__init__(ttl_seconds)
+        self._lock = threading.Lock()
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._expires: Dict[str, float] = {}
+        self._by_status: Dict[str, set] = {}
+        # Request key -> (job id, created at), and the key of each such job
+        self._inflight: Dict[str, Tuple[str, float]] = {}
+        self._inflight_keys: Dict[str, str] = {}
+
+    def _store(self, job_id: str, record: Dict[str, Any]):
+        old = self._records.get(job_id)
+        if old is not None:
+            self._by_status.get(old["status"], set()).discard(job_id)
+        self._records[job_id] = record
+        self._by_status.setdefault(record["status"], set()).add(job_id)
+        if record["status"] in FINISHED_STATUSES:
+            self._release(job_id)
+        expires_at = self._expiry(record["status"], time.time())
+        if expires_at is None:
+            self._expires.pop(job_id, None)
+        else:
+            self._expires[job_id] = expires_at
+
+    def _release(self, job_id: str):
+        key = self._inflight_keys.pop(job_id, None)
+        if key is not None and self._inflight.get(key, (None,))[0] == job_id:
+            del self._inflight[key]
+
+    def _remove(self, job_id: str):
+        self._release(job_id)
+        record = self._records.pop(job_id, None)
+        self._expires.pop(job_id, None)
+        if record is not None:
+            self._by_status.get(record["status"], set()).discard(job_id)
+
+    def _live(self, job_id: str) -> Optional[Dict[str, Any]]:
+        expires_at = self._expires.get(job_id)
+        if expires_at is not None and expires_at <= time.time():
+            self._remove(job_id)
+            return None
+        return self._records.get(job_id)
+
+    def create(self, job_id, record):
+        self._maybe_purge()
+        with self._lock:
+            if self._live(job_id) is not None:
+                raise KeyError(f"Job {job_id} already exists")
+            self._store(job_id, dict(record))
+            return dict(record)
+
+    def create_or_join(self, job_id, record, key, max_age=DEFAULT_JOIN_MAX_AGE):
+        self._maybe_purge()
+        now = time.time()
+        with self._lock:
+            existing_id, created_at = self._inflight.get(key, (None, 0.0))
+            existing = self._live(existing_id) if existing_id else None
+            if existing is not None and existing["status"] not in FINISHED_STATUSES \
+                    and now - created_at < max_age:
+                return existing_id, False
+            if self._live(job_id) is not None:
+                raise KeyError(f"Job {job_id} already exists")
+            self._store(job_id, dict(record))
+            self._inflight[key] = (job_id, now)
+            self._inflight_keys[job_id] = key
+            return job_id, True
+
+    def get(self, job_id):
+        with self._lock:
+            record = self._live(job_id)
+            return dict(record) if record is not None else None
+
+    def get_many(self, job_ids):
+        with self._lock:
+            records = {job_id: self._live(job_id) for job_id in job_ids}
+            return {job_id: dict(r) for job_id, r in records.items() if r is not None}
+
+    def put(self, job_id, record):
+        self._maybe_purge()
+        with self._lock:
+            self._store(job_id, dict(record))
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            record = self._live(job_id)
+            if record is None:
+                return None
+            record = {**record, **fields}
+            self._store(job_id, record)
+            return dict(record)
+
+    def transition(self, job_id, status, expected=(), **fields):
+        with self._lock:
+            record = self._live(job_id)
+            if record is None:
+                return False
+            current = record["status"]
+            if expected and current not in expected:
+                return False
+            if not expected and current in FINISHED_STATUSES:
+                return False
+            self._store(job_id, {**record, **fields, "status": status})
+            return True
+
+    def list_by_status(self, status, limit=100):
+        with self._lock:
+            ids = list(self._by_status.get(status, ()))
+            records = [self._live(job_id) for job_id in ids]
+            return [dict(r) for r in records if r is not None][:limit]
+
+    def delete(self, job_id):
+        with self._lock:
+            self._remove(job_id)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, expires_at in self._expires.items() if expires_at <= now]
+            for job_id in expired:
+                self._remove(job_id)
+            return len(expired)
+
+
+class SQLiteJobStore(JobStore):
+    """Job store in an embedded SQLite database shared by all API processes"""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        super().__init__(ttl_seconds)
+        self.path = path
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = self._db()
+        with db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, status TEXT NOT NULL, data TEXT NOT NULL,"
+                " created_at REAL NOT NULL, updated_at REAL NOT NULL, expires_at REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, updated_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_expires_at ON jobs(expires_at)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS inflight ("
+                " key TEXT PRIMARY KEY, job_id TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS inflight_job_id ON inflight(job_id)")
+
+    def _db(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets readers run alongside a writer"""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _write(self, db, job_id: str, record: Dict[str, Any], now: float):
+        db.execute(
+            "INSERT INTO jobs(id, status, data, created_at, updated_at, expires_at) VALUES(?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET status = excluded.status, data = excluded.data,"
+            " updated_at = excluded.updated_at, expires_at = excluded.expires_at",
+            (job_id, record["status"], json.dumps(record, default=str), now, now,
+             self._expiry(record["status"], now)),
+        )
+        if record["status"] in FINISHED_STATUSES:
+            db.execute("DELETE FROM inflight WHERE job_id = ?", (job_id,))
+
+    def _read(self, db, job_id: str) -> Optional[Dict[str, Any]]:
+        row = db.execute(
+            "SELECT data FROM jobs WHERE id = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (job_id, time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def create(self, job_id, record):
+        self._maybe_purge()
+        db = self._db()
+        now = time.time()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            if self._read(db, job_id) is not None:
+                raise KeyError(f"Job {job_id} already exists")
+            self._write(db, job_id, record, now)
+        return dict(record)
+
+    def create_or_join(self, job_id, record, key, max_age=DEFAULT_JOIN_MAX_AGE):
+        self._maybe_purge()
+        db = self._db()
+        now = time.time()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT job_id, created_at FROM inflight WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] < max_age:
+                existing = self._read(db, row[0])
+                if existing is not None and existing["status"] not in FINISHED_STATUSES:
+                    return row[0], False
+            if self._read(db, job_id) is not None:
+                raise KeyError(f"Job {job_id} already exists")
+            self._write(db, job_id, record, now)
+            db.execute("INSERT OR REPLACE INTO inflight(key, job_id, created_at) VALUES(?, ?, ?)",
+                       (key, job_id, now))
+        return job_id, True
+
+    def get(self, job_id):
+        return self._read(self._db(), job_id)
+
+    def get_many(self, job_ids):
+        job_ids = list(job_ids)
+        db = self._db()
+        now = time.time()
+        records = {}
+        # Stay below SQLite's limit on bound parameters per statement
+        for start in range(0, len(job_ids), GET_MANY_CHUNK):
+            chunk = job_ids[start:start + GET_MANY_CHUNK]
+            rows = db.execute(
+                f"SELECT id, data FROM jobs WHERE id IN ({', '.join('?' * len(chunk))})"
+                " AND (expires_at IS NULL OR expires_at > ?)",
+                (*chunk, now),
+            ).fetchall()
+            records.update((row[0], json.loads(row[1])) for row in rows)
+        return records
+
+    def put(self, job_id, record):
+        self._maybe_purge()
+        db = self._db()
+        with db:
+            self._write(db, job_id, record, time.time())
+
+    def update(self, job_id, **fields):
+        db = self._db()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            record = self._read(db, job_id)
+            if record is None:
+                return None
+            record = {**record, **fields}
+            self._write(db, job_id, record, time.time())
+        return record
+
+    def transition(self, job_id, status, expected=(), **fields):
+        db = self._db()
+        with db:
+            # BEGIN IMMEDIATE takes the write lock before reading, so two
+            # processes can never both move the same job
+            db.execute("BEGIN IMMEDIATE")
+            record = self._read(db, job_id)
+            if record is None:
+                return False
+            current = record["status"]
+            if expected and current not in expected:
+                return False
+            if not expected and current in FINISHED_STATUSES:
+                return False
+            self._write(db, job_id, {**record, **fields, "status": status}, time.time())
+        return True
+
+    def list_by_status(self, status, limit=100):
+        rows = self._db().execute(
+            "SELECT data FROM jobs WHERE status = ? AND (expires_at IS NULL OR expires_at > ?) "
+            "ORDER BY updated_at LIMIT ?",
+            (status, time.time(), limit),
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def delete(self, job_id):
+        db = self._db()
+        with db:
+            db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            db.execute("DELETE FROM inflight WHERE job_id = ?", (job_id,))
+
+    def purge_expired(self):
+        db = self._db()
+        with db:
+            cursor = db.execute("DELETE FROM jobs WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        return cursor.rowcount
+
+
+_store: Optional[JobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """Return the process-wide job store.
+
+    ``EDUARENA_JOB_STORE`` selects the backend: ``memory`` or a SQLite file
+    path (default ``media/job_store.sqlite3``). ``EDUARENA_JOB_TTL`` sets how
+    many seconds finished jobs are kept.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = os.environ.get("EDUARENA_JOB_STORE", DEFAULT_DB_PATH)
+            ttl = float(os.environ.get("EDUARENA_JOB_TTL", DEFAULT_TTL_SECONDS))
+            if backend == "memory":
+                _store = MemoryJobStore(ttl_seconds=ttl)
+            else:
+                _store = SQLiteJobStore(backend, ttl_seconds=ttl)
+        return _store
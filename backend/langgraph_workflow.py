@@ -1,21 +1,118 @@
-from typing import TypedDict, List
+from typing import Annotated, TypedDict, List
 from langgraph.graph import StateGraph, END
-import openai
+from langgraph.types import Send
+import operator
+import json
 import os
+import sys
+import asyncio
+import uuid
 from dotenv import load_dotenv
-import subprocess
 import glob
+import shutil
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from ffmpeg_tools import concat_videos
+from code_preflight import PreflightError, SceneCodeError, failure_signature, record_failure, validate_code
+from code_repair import count_repair, learn, repair_locally
+from fork_server import fork_server_enabled, get_fork_server
+from llm_gateway import get_llm_gateway, register_stub
+from render_cache import get_render_cache, make_key
+from render_pool import default_worker_count, get_render_pool
+from render_workspace import scratch_dir
+from render_scheduler import plan_seconds, plays_plan
+from scene_ir import IR_PROMPT, compile_program, parse_program, render_program
+from template_router import cached_template_video, get_template, match_template, render_template
+
+try:
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+except ImportError:
+    AsyncSqliteSaver = None
 
 load_dotenv()
 
+RENDER_TIMEOUT_SECONDS = 60
+
+# manim quality presets and their command-line flags
+QUALITY_FLAGS = {
+    "low_quality": "-ql",
+    "medium_quality": "-qm",
+    "high_quality": "-qh",
+    "production_quality": "-qp",
+    "fourk_quality": "-qk",
+}
+DEFAULT_QUALITY = "low_quality"
+
+# Job whose workflow is running; renders are submitted under it so the job can be cancelled
+current_job: ContextVar[str] = ContextVar("current_job", default=None)
+
+# Workflow checkpoints, keyed by job id; "off" disables them
+CHECKPOINT_DB = os.environ.get("EDUARENA_CHECKPOINT_DB", os.path.join("media", "workflow_checkpoints.sqlite3"))
+
+# manim subprocesses allowed at once per API process; other renders wait
+_render_slots = None
+
+def render_slots() -> asyncio.Semaphore:
+    global _render_slots
+    if _render_slots is None:
+        _render_slots = asyncio.Semaphore(default_worker_count())
+    return _render_slots
+
+def merge_clips(current: List[dict], update: List[dict]) -> List[dict]:
+    """Clips by scene index; a repaired clip replaces the failed one"""
+    by_index = {clip["index"]: clip for clip in current}
+    by_index.update((clip["index"], clip) for clip in update)
+    return [by_index[index] for index in sorted(by_index)]
+
 class AnimationState(TypedDict):
     prompt: str
+    template: str
     scenes: List[dict]
+    # Results of the per-scene branches, merged as they finish
+    clips: Annotated[List[dict], merge_clips]
     code: str
     video_path: str
+    quality: str
     status: str
 
-def plan_scenes(state: AnimationState) -> AnimationState:
+async def route_prompt(state: AnimationState) -> AnimationState:
+    """Router: send prompts with a hand-written scene straight to rendering"""
+    
+    template = match_template(state["prompt"])
+    if template is None:
+        return {**state, "template": "", "status": "routed"}
+    
+    scenes = [{"title": template["name"], "description": state["prompt"], "template": template["target"]}]
+    return {**state, "template": template["name"], "scenes": scenes, "status": "routed"}
+
+def choose_path(state: AnimationState) -> str:
+    return "template" if state["template"] else "plan"
+
+async def render_from_template(state: AnimationState) -> AnimationState:
+    """Renderer: hand-written scene from the template registry"""
+    
+    template = get_template(state["template"])
+    animation_id = uuid.uuid4().hex
+    video_path = os.path.join("media", f"{animation_id}.mp4")
+    if cached_template_video(template, video_path):
+        return {**state, "video_path": video_path, "status": "completed"}
+    
+    try:
+        future = get_render_pool().submit(render_template, template, state["prompt"], animation_id,
+                                          job_id=animation_id, group=current_job.get())
+        video_path = await asyncio.wrap_future(future)
+    except Exception as e:
+        print(f"Template {template['name']} failed, falling back to generated code: {e}")
+        video_path = None
+    
+    if not video_path:
+        return {**state, "template": "", "scenes": [], "status": "template_failed"}
+    return {**state, "video_path": video_path, "status": "completed"}
+
+def after_template(state: AnimationState) -> str:
+    return "done" if state["status"] == "completed" else "plan"
+
+async def plan_scenes(state: AnimationState) -> AnimationState:
     """Director: Break prompt into scenes"""
     
     system_prompt = """Break the user's prompt into 2-3 simple animation scenes.
@@ -27,35 +124,54 @@ def plan_scenes(state: AnimationState) -> AnimationState:
         {"title": "Action", "description": "Show main animation", "duration": 3}
     ]"""
     
-    client = openai.OpenAI()
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": state["prompt"]}
-        ]
-    )
+    content = await get_llm_gateway().complete([
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": state["prompt"]}
+    ], purpose="plan_scenes")
     
-    import json
     try:
-        scenes = json.loads(response.choices[0].message.content)
+        scenes = json.loads(content)
     except:
+        scenes = None
+    if not isinstance(scenes, list) or not scenes:
         scenes = [{"title": "Animation", "description": state["prompt"], "duration": 5}]
     
     return {**state, "scenes": scenes, "status": "planned"}
 
-def generate_code(state: AnimationState) -> AnimationState:
-    """Coder: Generate Manim code"""
+SCENE_ATTEMPTS = 2
+# Repair rounds per failed scene of generated code, each with at most one render
+REPAIR_ROUNDS = 2
+# "ir": the LLM describes scenes in the instruction IR, with generated code as
+# the fallback; "code": the LLM always writes manim code
+SCENE_FORMAT = os.environ.get("EDUARENA_SCENE_FORMAT", "ir")
+
+async def generate_scene_ir(prompt: str, scene: dict, error: str = "") -> dict:
+    """Coder: Describe one scene as an instruction IR program"""
+    
+    system_prompt = f"""Plan this scene of an animation about "{prompt}":
+{scene.get('title', 'Scene')} - {scene.get('description', prompt)}
+Duration: about {scene.get('duration', 3)} seconds
+
+{IR_PROMPT}"""
+    if error:
+        system_prompt += f"\n\nThe previous program was rejected: {error[-500:]}\nFix it."
     
-    scenes_text = "\n".join([f"Scene {i+1}: {s['title']} - {s['description']}" 
-                            for i, s in enumerate(state["scenes"])])
+    content = await get_llm_gateway().complete([
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Create animation for: {scene.get('description', prompt)}"}
+    ], purpose="generate_ir")
+    return parse_program(content)
+
+async def generate_scene_code(prompt: str, scene: dict) -> str:
+    """Coder: Generate Manim code for one scene"""
     
-    system_prompt = f"""Generate Manim Python code for these scenes:
-{scenes_text}
+    system_prompt = f"""Generate Manim Python code for this scene of an animation about "{prompt}":
+{scene.get('title', 'Scene')} - {scene.get('description', prompt)}
+Duration: about {scene.get('duration', 3)} seconds
 
 Rules:
 - Import: from manim import *
-- Class inheriting Scene
+- One class inheriting Scene
 - Use construct(self) method
 - End with self.wait(2)
 - Simple shapes and text only
@@ -63,67 +179,435 @@ Rules:
 
 Return ONLY Python code."""
 
-    client = openai.OpenAI()
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Create animation for: {state['prompt']}"}
-        ]
-    )
+    content = await get_llm_gateway().complete([
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Create animation for: {scene.get('description', prompt)}"}
+    ], purpose="generate_code")
+    return strip_code_fence(content)
+
+async def generate_repair(prompt: str, scene: dict, code: str, error: str) -> str:
+    """Repairer: ask the LLM to fix one failed program"""
     
-    code = response.choices[0].message.content.strip()
+    system_prompt = f"""This Manim Community Edition code for a scene of an animation about "{prompt}"
+({scene.get('title', 'Scene')} - {scene.get('description', prompt)}) failed with:
+
+{error[-1000:]}
+
+Fix the error and change nothing else. Keep one class inheriting Scene with a construct(self) method.
+
+Return ONLY Python code."""
+    
+    # Never cached: a retried job failing the same way must not get the same failed fix.
+    # A fix that renders is kept by learn() instead
+    content = await get_llm_gateway().complete([
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": code}
+    ], purpose="repair_code", cache=False)
+    return strip_code_fence(content)
+
+def strip_code_fence(content: str) -> str:
+    code = content.strip()
     if code.startswith("```python"):
         code = code[9:-3]
     elif code.startswith("```"):
         code = code[3:-3]
+    return code
+
+@register_stub("plan_scenes")
+def stub_scenes(messages) -> str:
+    """Offline plan: one scene per sentence of the prompt"""
+    prompt = messages[-1]["content"]
+    parts = [p.strip() for p in prompt.split(".") if p.strip()][:3] or [prompt]
+    return json.dumps([{"title": f"Scene {i+1}", "description": p, "duration": 2}
+                       for i, p in enumerate(parts)])
+
+@register_stub("generate_code")
+def stub_code(messages) -> str:
+    """Offline code: a title card with the scene description"""
+    description = messages[-1]["content"].replace("Create animation for: ", "", 1)
+    return f"""from manim import *
+
+class GeneratedScene(Scene):
+    def construct(self):
+        title = Text({description[:60]!r}, font_size=36)
+        self.play(Write(title))
+        self.wait(2)
+"""
+
+@register_stub("repair_code")
+def stub_repair(messages) -> str:
+    """Offline repair: the failed program with its known mistakes rewritten"""
+    code = messages[-1]["content"]
+    repaired = repair_locally(code, failure_signature(messages[0]["content"], code))
+    return repaired[0] if repaired else code
+
+@register_stub("generate_ir")
+def stub_ir(messages) -> str:
+    """Offline IR: a title, then a sorted array of the description's word lengths"""
+    description = messages[-1]["content"].replace("Create animation for: ", "", 1)
+    values = [len(word) for word in description.split()][:8] or [3, 1, 2]
+    return json.dumps({"version": 1, "steps": [
+        {"op": "show_title", "text": description[:60]},
+        {"op": "create_array", "values": values},
+        {"op": "sort_array", "algorithm": "bubble"},
+        {"op": "wait", "seconds": 1}
+    ]})
+
+async def render_ir(program: dict, quality: str = DEFAULT_QUALITY) -> str:
+    """Render an IR program on the render pool; no generated Python runs"""
+    animation_id = uuid.uuid4().hex
+    # The compiled plays give the scheduler the program's render cost up front
+    cost = plan_seconds(plays_plan(compile_program(program), {"quality": quality}))
+    future = get_render_pool().submit(render_program, program, animation_id, quality=quality,
+                                      job_id=animation_id, group=current_job.get(),
+                                      wall_seconds=RENDER_TIMEOUT_SECONDS, cost=cost)
+    video_path = await asyncio.wrap_future(future)
+    if not video_path:
+        raise RuntimeError("manim produced no video")
+    return video_path
+
+async def render_code(code: str, quality: str = DEFAULT_QUALITY) -> str:
+    """Render one generated program and return its video path.
+
+    Raises with manim's error output when the program does not render.
+    """
+    
+    # Generated code is the cache key: the same program renders the same video
+    cache = get_render_cache()
+    cache_key = make_key({"code": code, "flags": QUALITY_FLAGS[quality]})
+    video_path = os.path.join("media", f"{cache_key[:16]}_{uuid.uuid4().hex[:8]}.mp4")
+    if cache.fetch(cache_key, video_path):
+        return video_path
+    
+    async with render_slots():
+        if fork_server_enabled():
+            # Forked from a zygote that already imported manim
+            future = get_fork_server().submit(code, video_path, wall_seconds=RENDER_TIMEOUT_SECONDS,
+                                              quality=quality, group=current_job.get())
+            rendered_path = await asyncio.wrap_future(future)
+        else:
+            rendered_path = await render_in_subprocess(code, video_path, quality)
+    if not rendered_path:
+        raise RuntimeError("manim produced no video")
     
-    return {**state, "code": code, "status": "coded"}
+    cache.put(cache_key, video_path)
+    return video_path
 
-def render_video(state: AnimationState) -> AnimationState:
-    """Renderer: Create video from code"""
+async def render_in_subprocess(code: str, video_path: str, quality: str = DEFAULT_QUALITY) -> str:
+    """Render with ``python -m manim``, for platforms without fork"""
     
-    # Write code to file
-    with open("temp_animation.py", "w") as f:
-        f.write(state["code"])
+    # Each render gets its own code file and media directory
+    scratch = scratch_dir(f"workflow_{uuid.uuid4().hex}")
+    os.makedirs(scratch, exist_ok=True)
+    code_path = os.path.join(scratch, "animation.py")
+    with open(code_path, "w") as f:
+        f.write(code)
     
-    # Render with Manim
     try:
-        subprocess.run(["python", "-m", "manim", "-pql", "temp_animation.py", "--media_dir", "media"], 
-                      check=True, capture_output=True, timeout=60)
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "manim", QUALITY_FLAGS[quality], code_path, "--media_dir", scratch,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), RENDER_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise RuntimeError(f"Render timed out after {RENDER_TIMEOUT_SECONDS}s")
+        except asyncio.CancelledError:
+            # The job was cancelled: stop manim before its scratch directory goes
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode < 0:
+            raise RuntimeError(f"Render process died (signal {-process.returncode})")
+        if process.returncode != 0:
+            raise SceneCodeError(stderr.decode(errors="replace")[-2000:])
         
         # Find video
-        videos = glob.glob("media/videos/**/*.mp4", recursive=True)
-        video_path = videos[-1] if videos else None
-        
-        return {**state, "video_path": video_path, "status": "completed"}
-    except:
-        return {**state, "status": "failed"}
+        videos = glob.glob(os.path.join(scratch, "videos", "**", "*.mp4"), recursive=True)
+        if not videos:
+            return None
+        shutil.move(max(videos, key=os.path.getmtime), video_path)
+        return video_path
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def fan_out_scenes(state: AnimationState) -> List[Send]:
+    """One code + render branch per planned scene, all running at once"""
+    quality = state.get("quality") or DEFAULT_QUALITY
+    return [Send("scene", {"prompt": state["prompt"], "scene": scene, "index": i, "quality": quality})
+            for i, scene in enumerate(state["scenes"])]
+
+async def build_scene(task: dict) -> dict:
+    """Coder + renderer for one scene.
+
+    Generated code that fails comes back as a failed clip carrying its
+    error; the repair node fixes it without redoing the other scenes.
+    """
+    
+    if SCENE_FORMAT == "ir":
+        clip = await build_scene_from_ir(task)
+        if clip["status"] == "completed":
+            return {"clips": [clip]}
+        print(f"Scene {task['index'] + 1}: no usable IR program, falling back to generated code")
+    code = await generate_scene_code(task["prompt"], task["scene"])
+    return {"clips": [await check_and_render(task, code)]}
+
+async def build_scene_from_ir(task: dict) -> dict:
+    program, error = None, ""
+    for attempt in range(SCENE_ATTEMPTS):
+        try:
+            program = await generate_scene_ir(task["prompt"], task["scene"], error)
+            video_path = await render_ir(program, task.get("quality", DEFAULT_QUALITY))
+            code = json.dumps(program, sort_keys=True)
+            return {"index": task["index"], "format": "ir", "code": code, "video_path": video_path,
+                    "status": "completed"}
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            print(f"Scene {task['index'] + 1} IR attempt {attempt + 1} failed: {error[-200:]}")
+    
+    return {"index": task["index"], "format": "ir", "code": json.dumps(program), "video_path": None,
+            "status": "failed", "error": error[-2000:]}
+
+async def check_and_render(task: dict, code: str, repairs: int = 0) -> dict:
+    """Validate and render one program; a failure is returned as a clip with its error and signature"""
+    
+    clip = {"index": task["index"], "format": "code", "code": code, "video_path": None, "repairs": repairs}
+    try:
+        # Broken programs are rejected here, before any render process runs
+        await asyncio.to_thread(validate_code, code)
+    except PreflightError as e:
+        print(f"Scene {task['index'] + 1} rejected: {str(e)[-200:]}")
+        return {**clip, "status": "failed", "failed_at": "preflight", "error": str(e),
+                "signature": list(e.signature)}
+    
+    try:
+        video_path = await render_code(code, task.get("quality", DEFAULT_QUALITY))
+    except Exception as e:
+        error = str(e) or type(e).__name__
+        signature = failure_signature(error, code)
+        if isinstance(e, SceneCodeError):
+            # Only the program's own exceptions; a timeout or crashed worker may pass next time
+            record_failure(code, error, signature)
+        print(f"Scene {task['index'] + 1} failed: {error[-200:]}")
+        return {**clip, "status": "failed", "failed_at": "render", "error": error[-2000:],
+                "signature": list(signature)}
+    return {**clip, "video_path": video_path, "status": "completed"}
+
+async def review_clips(state: AnimationState) -> dict:
+    """Checker: note whether any scene needs a repair"""
+    failed = [clip for clip in state["clips"] if clip["status"] != "completed"]
+    return {"status": "repairing" if failed else "rendered"}
+
+def route_repairs(state: AnimationState):
+    """One repair branch per failed scene; join once every scene has a video"""
+    failed = [clip for clip in state["clips"] if clip["status"] != "completed"]
+    if not failed or any(clip.get("repairs", 0) >= REPAIR_ROUNDS for clip in failed):
+        return "join"
+    quality = state.get("quality") or DEFAULT_QUALITY
+    return [Send("repair", {"prompt": state["prompt"], "scene": state["scenes"][clip["index"]],
+                            "index": clip["index"], "quality": quality, "clip": clip})
+            for clip in failed]
+
+async def repair_scene(task: dict) -> dict:
+    """Repairer: fix one failed program, locally when a known rewrite applies.
+
+    Each round renders at most once. A scene still failing after the last
+    round raises, so a resumed run retries this repair only.
+    """
+    
+    clip = task["clip"]
+    code, error = clip["code"], clip.get("error", "")
+    signature = tuple(clip.get("signature") or failure_signature(error, code))
+    repairs = clip.get("repairs", 0) + 1
+    
+    result = None
+    repaired = await asyncio.to_thread(repair_locally, code, signature)
+    if repaired is not None:
+        result = await check_and_render(task, repaired[0], repairs)
+        if result["status"] == "completed":
+            print(f"Scene {task['index'] + 1} repaired locally ({signature[0]})")
+            count_repair(repaired[1])
+            return {"clips": [result]}
+    
+    # A local rewrite that was rendered used up this round's render
+    if result is None or result["failed_at"] == "preflight":
+        fixed = await generate_repair(task["prompt"], task["scene"], code, error)
+        result = await check_and_render(task, fixed, repairs)
+        if result["status"] == "completed":
+            count_repair("llm")
+            # The next program failing the same way is fixed without the LLM
+            learn(signature, code, fixed)
+            return {"clips": [result]}
+    
+    if repairs >= REPAIR_ROUNDS:
+        count_repair("unrepaired")
+        raise RuntimeError(f"Scene {task['index'] + 1} failed after {repairs} repairs: {result['error']}")
+    return {"clips": [result]}
+
+async def join_scenes(state: AnimationState) -> dict:
+    """Editor: concatenate the scene clips in plan order"""
+    
+    clips = sorted(state["clips"], key=lambda clip: clip["index"])
+    code = "\n\n".join(clip["code"] for clip in clips)
+    paths = [clip["video_path"] for clip in clips if clip["video_path"]]
+    if clips and len(paths) == len(clips) == 1:
+        return {"code": code, "video_path": paths[0], "status": "completed"}
+    
+    if not clips or len(paths) != len(clips):
+        raise RuntimeError("Some scenes have no video")
+    
+    # Raising keeps the clips, so a resumed run only repeats the join
+    key = make_key({"clips": [clip["code"] for clip in clips], "quality": state.get("quality")})
+    video_path = os.path.join("media", f"{key[:16]}.mp4")
+    await asyncio.to_thread(concat_videos, paths, video_path)
+    
+    # Clips stay in the render cache; only the joined video is kept in media
+    for path in paths:
+        os.remove(path)
+    return {"code": code, "video_path": video_path, "status": "completed"}
 
 # Build workflow graph
 workflow = StateGraph(AnimationState)
 
+workflow.add_node("route", route_prompt)
+workflow.add_node("template", render_from_template)
 workflow.add_node("plan", plan_scenes)
-workflow.add_node("code", generate_code)
-workflow.add_node("render", render_video)
+workflow.add_node("scene", build_scene)
+workflow.add_node("review", review_clips)
+workflow.add_node("repair", repair_scene)
+workflow.add_node("join", join_scenes)
 
-workflow.add_edge("plan", "code")
-workflow.add_edge("code", "render")
-workflow.add_edge("render", END)
+# Known concepts skip the LLM; a failed template render falls back to it
+workflow.add_conditional_edges("route", choose_path, {"template": "template", "plan": "plan"})
+workflow.add_conditional_edges("template", after_template, {"done": END, "plan": "plan"})
+# Every planned scene is generated and rendered in parallel, then joined
+workflow.add_conditional_edges("plan", fan_out_scenes, ["scene"])
+# Failed scenes loop through repair until they render or run out of rounds
+workflow.add_edge("scene", "review")
+workflow.add_conditional_edges("review", route_repairs, ["repair", "join"])
+workflow.add_edge("repair", "review")
+workflow.add_edge("join", END)
 
-workflow.set_entry_point("plan")
+workflow.set_entry_point("route")
 
 app = workflow.compile()
 
-def create_animation_workflow(prompt: str) -> AnimationState:
-    """Execute complete workflow"""
-    initial_state = {
+def initial_state(prompt: str, quality: str = DEFAULT_QUALITY) -> AnimationState:
+    return {
         "prompt": prompt,
+        "template": "",
         "scenes": [],
+        "clips": [],
         "code": "",
         "video_path": "",
+        "quality": quality,
         "status": "starting"
     }
+
+def checkpoints_enabled() -> bool:
+    return AsyncSqliteSaver is not None and CHECKPOINT_DB != "off"
+
+@asynccontextmanager
+async def checkpointed_app():
+    """The workflow compiled with the SQLite checkpointer, or without one if it is unavailable"""
+    if not checkpoints_enabled():
+        yield app
+        return
+    os.makedirs(os.path.dirname(CHECKPOINT_DB) or ".", exist_ok=True)
+    async with AsyncSqliteSaver.from_conn_string(CHECKPOINT_DB) as saver:
+        yield workflow.compile(checkpointer=saver)
+
+async def run_animation_workflow(prompt: str, on_step=None, thread_id: str = None,
+                                 quality: str = DEFAULT_QUALITY) -> AnimationState:
+    """Execute complete workflow on the running event loop.
+
+    ``await on_step(state)`` runs with the state after every node. With a
+    ``thread_id`` (the job id) every finished node is checkpointed: calling
+    again with the same id after a failure or restart resumes at the node
+    that did not finish, so planned scenes and rendered clips are not redone.
+    Raises when a node fails.
+    """
+    if thread_id is None:
+        return await _stream(app, initial_state(prompt, quality), None, on_step)
     
-    result = app.invoke(initial_state)
-    return result
\ No newline at end of file
+    token = current_job.set(thread_id)
+    try:
+        config = {"configurable": {"thread_id": thread_id}}
+        async with checkpointed_app() as graph:
+            if graph is app:
+                return await _stream(app, initial_state(prompt, quality), None, on_step)
+            
+            snapshot = await graph.aget_state(config)
+            if snapshot.next:
+                print(f"Resuming workflow {thread_id} at {', '.join(sorted(set(snapshot.next)))}")
+                return await _stream(graph, None, config, on_step, dict(snapshot.values))
+            if snapshot.values.get("status") == "completed":
+                return dict(snapshot.values)
+            if snapshot.values:
+                # Clips accumulate across runs; a fresh run needs a fresh thread
+                await graph.checkpointer.adelete_thread(thread_id)
+            return await _stream(graph, initial_state(prompt, quality), config, on_step)
+    finally:
+        current_job.reset(token)
+
+async def _stream(graph, inputs, config, on_step, result=None) -> AnimationState:
+    result = inputs if result is None else result
+    async for state in graph.astream(inputs, config, stream_mode="values"):
+        result = state
+        if on_step is not None:
+            await on_step(result)
+    return result
+
+async def rerender_workflow(thread_id: str, quality: str) -> AnimationState:
+    """Render the stored scenes of a finished job again at ``quality``.
+
+    Only the render and join stages run: the plan and the generated code
+    or IR programs come from the job's checkpoint.
+    """
+    if quality not in QUALITY_FLAGS:
+        raise ValueError(f"Unknown quality {quality!r}; expected one of {', '.join(QUALITY_FLAGS)}")
+    if not checkpoints_enabled():
+        raise LookupError("Workflow checkpoints are disabled")
+    
+    token = current_job.set(thread_id)
+    try:
+        config = {"configurable": {"thread_id": thread_id}}
+        async with checkpointed_app() as graph:
+            snapshot = await graph.aget_state(config)
+            state = dict(snapshot.values)
+            if not state or snapshot.next:
+                raise LookupError(f"No finished workflow for {thread_id}")
+            if not state.get("clips"):
+                raise LookupError("Template animations are rendered from their hand-written scene only")
+            
+            async def render_clip(clip: dict) -> dict:
+                if clip["format"] == "ir":
+                    video_path = await render_ir(json.loads(clip["code"]), quality)
+                else:
+                    video_path = await render_code(clip["code"], quality)
+                return {**clip, "video_path": video_path}
+            
+            results = await asyncio.gather(*(render_clip(clip) for clip in state["clips"]), return_exceptions=True)
+            errors = [r for r in results if isinstance(r, BaseException)]
+            if errors:
+                for clip in results:
+                    if not isinstance(clip, BaseException):
+                        os.remove(clip["video_path"])
+                raise errors[0]
+            update = await join_scenes({**state, "clips": results, "quality": quality})
+            update["quality"] = quality
+            # Recorded as the join's output, so a later re-render starts from it
+            await graph.aupdate_state(config, update, as_node="join")
+            return {**state, **update}
+    finally:
+        current_job.reset(token)
+
+def create_animation_workflow(prompt: str) -> AnimationState:
+    """Execute complete workflow"""
+    try:
+        return asyncio.run(run_animation_workflow(prompt))
+    except Exception as e:
+        print(f"Workflow failed: {e}")
+        return {**initial_state(prompt), "status": "failed"}
\ No newline at end of file
@@ -0,0 +1,293 @@
+"""
+Shared gateway for the LLM calls of the LangGraph workflow.
+
+All chat completions go through one ``LLMGateway`` per process, which keeps:
+
+- one pooled ``AsyncOpenAI`` client (per event loop) instead of a client per call
+- a persistent SQLite response cache keyed by (model, messages, params), so a
+  repeated prompt never touches the network (calls with ``cache=False`` skip it).
+  Entries expire after a TTL and the least recently used go past a size budget
+- hedged retries: a duplicate request is sent when the first one is slow,
+  and failed attempts are retried with backoff
+- a per-process limit on concurrent requests
+
+``EDUARENA_LLM_BACKEND=stub`` swaps OpenAI for a deterministic local backend
+so the whole workflow can be load-tested offline.
+"""
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from render_cache import make_key
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+DEFAULT_CACHE_PATH = os.path.join("media", "llm_cache.sqlite3")
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT_SECONDS = 60.0
+# Seconds without a response before a duplicate request is sent
+DEFAULT_HEDGE_SECONDS = 10.0
+MAX_ATTEMPTS = 3
+BACKOFF_SECONDS = 0.5
+
+Messages = List[Dict[str, str]]
+
+
+class ResponseCache:
+    """Completions stored in SQLite, shared by every API process.
+
+    Entries older than ``ttl_seconds`` are misses; past ``max_bytes`` of
+    content the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: Optional[int] = None,
+                 ttl_seconds: Optional[float] = None):
+        self.path = path
+        if max_bytes is None:
+            configured = os.environ.get("EDUARENA_LLM_CACHE_MB")
+            max_bytes = int(configured) * 1024 * 1024 if configured else DEFAULT_CACHE_MAX_BYTES
+        if ttl_seconds is None:
+            ttl_seconds = float(os.environ.get("EDUARENA_LLM_CACHE_TTL", DEFAULT_CACHE_TTL_SECONDS))
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._db() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT NOT NULL, content TEXT NOT NULL,"
+                " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._db() as db:
+            row = db.execute("SELECT content FROM responses WHERE key = ? AND created_at > ?",
+                             (key, now - self.ttl_seconds)).fetchone()
+            if row:
+                db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        return row[0] if row else None
+
+    def put(self, key: str, model: str, content: str):
+        """Store a completion and evict expired entries and old ones past the size budget"""
+        now = time.time()
+        with self._db() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses(key, model, content, created_at, last_access) VALUES(?, ?, ?, ?, ?)",
+                (key, model, content, now, now),
+            )
+            self._evict(db, now)
+
+    def _evict(self, db, now: float):
+        db.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl_seconds,))
+        total = db.execute("SELECT COALESCE(SUM(LENGTH(content)), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, size in db.execute(
+            "SELECT key, LENGTH(content) FROM responses ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+
+class OpenAIBackend:
+    """Chat completions from the OpenAI API over one pooled client"""
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self._client = None
+        self._loop = None
+
+    def client(self):
+        # httpx connections belong to the loop that opened them, so a new
+        # loop (e.g. another asyncio.run) gets its own client
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            import openai
+            self._client = openai.AsyncOpenAI(timeout=self.timeout, max_retries=0)
+            self._loop = loop
+        return self._client
+
+    async def complete(self, model: str, messages: Messages, purpose: Optional[str], **params) -> str:
+        response = await self.client().chat.completions.create(model=model, messages=messages, **params)
+        return response.choices[0].message.content
+
+
+_stubs: Dict[str, Callable[[Messages], str]] = {}
+
+
+def register_stub(purpose: str):
+    """Register the stub response for calls made with ``purpose``"""
+    def decorator(fn: Callable[[Messages], str]):
+        _stubs[purpose] = fn
+        return fn
+    return decorator
+
+
+class StubBackend:
+    """Deterministic offline backend: same messages, same answer"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    async def complete(self, model: str, messages: Messages, purpose: Optional[str], **params) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        stub = _stubs.get(purpose)
+        if stub is not None:
+            return stub(messages)
+        digest = hashlib.sha256(make_key({"model": model, "messages": messages}).encode()).hexdigest()[:12]
+        return f"stub response {digest}"
+
+
+class LLMGateway:
+    """Cached, hedged and rate-limited chat completions"""
+
+    def __init__(self, backend=None, cache: Optional[ResponseCache] = None,
+                 concurrency: int = DEFAULT_CONCURRENCY, hedge_seconds: Optional[float] = DEFAULT_HEDGE_SECONDS):
+        self.backend = backend or OpenAIBackend()
+        self.cache = cache
+        self.concurrency = concurrency
+        self.hedge_seconds = hedge_seconds
+        self._slots = None
+        self._loop = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._counters = {"requests": 0, "cache_hits": 0, "backend_calls": 0, "hedges": 0, "retries": 0, "errors": 0}
+
+    def slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._loop is not loop:
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._inflight = {}
+            self._loop = loop
+        return self._slots
+
+    async def complete(self, messages: Messages, model: str = DEFAULT_MODEL,
+                       purpose: Optional[str] = None, cache: bool = True, **params) -> str:
+        """Return the completion text for ``messages``.
+
+        ``purpose`` names the call site (used by the stub backend). Extra
+        ``params`` are passed to the API and are part of the cache key.
+        ``cache=False`` neither reads nor stores a cached answer, for calls
+        whose answer is only worth keeping once it has been checked.
+        """
+        self._counters["requests"] += 1
+        key = make_key({"backend": type(self.backend).__name__, "model": model,
+                        "messages": messages, "params": params})
+        use_cache = cache and self.cache is not None
+        if use_cache:
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                self._counters["cache_hits"] += 1
+                return cached
+
+        # Identical requests already in flight share one answer
+        slots = self.slots()
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        pending = asyncio.ensure_future(self._fetch(slots, model, messages, purpose, params))
+        self._inflight[key] = pending
+        try:
+            content = await asyncio.shield(pending)
+        finally:
+            if self._inflight.get(key) is pending:
+                del self._inflight[key]
+
+        if use_cache:
+            await asyncio.to_thread(self.cache.put, key, model, content)
+        return content
+
+    async def _fetch(self, slots, model, messages, purpose, params) -> str:
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                return await self._hedged(slots, model, messages, purpose, params)
+            except Exception as e:
+                self._counters["errors"] += 1
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                self._counters["retries"] += 1
+                print(f"LLM request failed ({e}), retrying")
+                await asyncio.sleep(BACKOFF_SECONDS * 2 ** attempt)
+
+    async def _hedged(self, slots, model, messages, purpose, params) -> str:
+        """First successful answer of the request and, if it is slow, one duplicate"""
+        async def call():
+            async with slots:
+                self._counters["backend_calls"] += 1
+                return await self.backend.complete(model, messages, purpose, **params)
+
+        tasks = [asyncio.ensure_future(call())]
+        try:
+            if self.hedge_seconds is not None:
+                done, _ = await asyncio.wait(tasks, timeout=self.hedge_seconds)
+                if not done:
+                    self._counters["hedges"] += 1
+                    tasks.append(asyncio.ensure_future(call()))
+
+            error = None
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    return await next_done
+                except Exception as e:
+                    error = e
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "backend": type(self.backend).__name__}
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Return the process-wide gateway.
+
+    ``EDUARENA_LLM_BACKEND`` selects ``openai`` (default) or ``stub``;
+    ``EDUARENA_LLM_STUB_LATENCY`` adds a delay to stub answers.
+    ``EDUARENA_LLM_CACHE`` is the cache file, or ``off`` to disable it;
+    ``EDUARENA_LLM_CACHE_MB`` and ``EDUARENA_LLM_CACHE_TTL`` bound its size
+    and the age of its entries in seconds.
+    ``EDUARENA_LLM_CONCURRENCY`` and ``EDUARENA_LLM_HEDGE_SECONDS`` tune
+    the request limit and hedging delay (``off`` disables hedging).
+    """
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            if os.environ.get("EDUARENA_LLM_BACKEND", "openai") == "stub":
+                backend = StubBackend(float(os.environ.get("EDUARENA_LLM_STUB_LATENCY", 0)))
+            else:
+                backend = OpenAIBackend(float(os.environ.get("EDUARENA_LLM_TIMEOUT", DEFAULT_TIMEOUT_SECONDS)))
+
+            cache_path = os.environ.get("EDUARENA_LLM_CACHE", DEFAULT_CACHE_PATH)
+            hedge = os.environ.get("EDUARENA_LLM_HEDGE_SECONDS", str(DEFAULT_HEDGE_SECONDS))
+            _gateway = LLMGateway(
+                backend,
+                cache=None if cache_path == "off" else ResponseCache(cache_path),
+                concurrency=int(os.environ.get("EDUARENA_LLM_CONCURRENCY", DEFAULT_CONCURRENCY)),
+                hedge_seconds=None if hedge == "off" else float(hedge),
+            )
+        return _gateway
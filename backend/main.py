@@ -4,7 +4,15 @@ from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import os
 import uuid
-from langgraph_workflow import create_animation_workflow
+import socket
+import asyncio
+from langgraph_workflow import DEFAULT_QUALITY, QUALITY_FLAGS, rerender_workflow, run_animation_workflow
+from job_store import get_job_store
+from code_preflight import manim_api, preflight_stats
+from code_repair import repair_stats
+from fork_server import cancel_fork_renders, shutdown_fork_server
+from render_pool import cancel_render_jobs, shutdown_render_pool
+from template_router import router_stats
 
 app = FastAPI()
 
@@ -19,11 +27,27 @@ app.add_middleware(
 os.makedirs("media", exist_ok=True)
 app.mount("/media", StaticFiles(directory="media"), name="media")
 
-active_workflows = {}
+# Workflow results, shared by every API process. Store calls block on
+# SQLite, so handlers run them with asyncio.to_thread.
+active_workflows = get_job_store()
+
+# Workflows running on this process's event loop by job id; kept so tasks are
+# not garbage collected and can be cancelled
+running_workflows = {}
+
+# How often a cancel made on another API process is looked for
+CANCEL_POLL_SECONDS = 0.5
+background_tasks = set()
+
+# Recorded on each job, so a restarted server can tell which jobs lost their process
+PROCESS_OWNER = f"{socket.gethostname()}:{os.getpid()}"
 
 class AnimationRequest(BaseModel):
     prompt: str
 
+class RerenderRequest(BaseModel):
+    quality: str = "high_quality"
+
 class AnimationResponse(BaseModel):
     id: str
     scenes: list
@@ -34,35 +58,181 @@ class AnimationResponse(BaseModel):
 async def generate_animation_endpoint(request: AnimationRequest):
     animation_id = str(uuid.uuid4())
     
+    # Record the job and run the LangGraph workflow in the background;
+    # clients follow it with GET /animation/{id}
+    await asyncio.to_thread(active_workflows.create, animation_id,
+                            {"id": animation_id, "status": "processing", "prompt": request.prompt,
+                             "scenes": [], "owner": PROCESS_OWNER})
+    start_job(animation_id, run_workflow_job(animation_id, request.prompt))
+    
+    return AnimationResponse(id=animation_id, scenes=[], status="processing")
+
+def start_job(animation_id: str, coro):
+    task = asyncio.create_task(coro)
+    running_workflows[animation_id] = task
+    
+    def forget(_):
+        if running_workflows.get(animation_id) is task:
+            del running_workflows[animation_id]
+    task.add_done_callback(forget)
+
+async def run_workflow_job(animation_id: str, prompt: str):
+    """Run the workflow for one job and store its progress and result"""
+    
+    async def record_step(state):
+        # Intermediate states (planned, coded) keep the job in "processing"
+        if state.get("status") not in ("completed", "failed"):
+            await asyncio.to_thread(active_workflows.update, animation_id,
+                                    scenes=state.get("scenes", []), step=state.get("status"))
+    
+    try:
+        # The job id is the checkpoint thread: a retry resumes where this run stopped
+        result = dict(await run_animation_workflow(prompt, on_step=record_step, thread_id=animation_id))
+        status = "completed" if result.pop("status", None) == "completed" else "failed"
+        await asyncio.to_thread(active_workflows.transition, animation_id, status,
+                                expected=("processing",), **result)
+    except Exception as e:
+        await asyncio.to_thread(active_workflows.transition, animation_id, "failed",
+                                expected=("processing",), error=str(e))
+
+async def run_rerender_job(animation_id: str, quality: str):
+    """Render a finished job's stored scenes again; the old video stays on failure"""
     try:
-        # Execute existing LangGraph workflow
-        result = create_animation_workflow(request.prompt)
-        active_workflows[animation_id] = result
-        
-        # Extract data from workflow result
-        scenes = result.get("scenes", [])
-        video_url = f"/media/{os.path.basename(result['video_path'])}" if result.get("video_path") else None
-        status = result.get("status", "failed")
-        
-        response = AnimationResponse(
-            id=animation_id,
-            scenes=scenes,
-            video_url=video_url,
-            status=status
-        )
-        
-        return response
-        
+        result = await rerender_workflow(animation_id, quality)
+        await asyncio.to_thread(active_workflows.transition, animation_id, "completed",
+                                expected=("processing",), step=None, video_path=result["video_path"],
+                                code=result["code"], quality=quality)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        await asyncio.to_thread(active_workflows.transition, animation_id, "completed",
+                                expected=("processing",), step=None, rerender_error=str(e))
+
+@app.post("/animation/{animation_id}/retry")
+async def retry_animation(animation_id: str):
+    """Resume a failed workflow from its checkpoint"""
+    record = await asyncio.to_thread(active_workflows.get, animation_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Animation not found")
+    if not await asyncio.to_thread(active_workflows.transition, animation_id, "processing",
+                                   expected=("failed",), owner=PROCESS_OWNER, error=None):
+        raise HTTPException(status_code=409, detail=f"Animation is {record['status']}, not failed")
+    start_job(animation_id, run_workflow_job(animation_id, record["prompt"]))
+    return {"id": animation_id, "status": "processing"}
+
+@app.post("/animation/{animation_id}/rerender")
+async def rerender_animation(animation_id: str, request: RerenderRequest):
+    """Render a completed animation again at another quality, without new LLM calls"""
+    if request.quality not in QUALITY_FLAGS:
+        raise HTTPException(status_code=400, detail=f"quality must be one of {', '.join(QUALITY_FLAGS)}")
+    record = await asyncio.to_thread(active_workflows.get, animation_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Animation not found")
+    if not await asyncio.to_thread(active_workflows.transition, animation_id, "processing",
+                                   expected=("completed",), owner=PROCESS_OWNER, step="rerendering",
+                                   rerender_error=None, cancel_requested=None):
+        raise HTTPException(status_code=409, detail=f"Animation is {record['status']}, not completed")
+    start_job(animation_id, run_rerender_job(animation_id, request.quality))
+    return {"id": animation_id, "status": "processing"}
+
+@app.delete("/animation/{animation_id}")
+async def cancel_animation(animation_id: str):
+    """Cancel a running job: its renders are killed and their scratch directories removed"""
+    record = await asyncio.to_thread(active_workflows.get, animation_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Animation not found")
+    if record.get("step") == "rerendering":
+        # The video from before the re-render is still there; the marker
+        # tells the process running the re-render to stop it
+        cancelled = await asyncio.to_thread(active_workflows.transition, animation_id, "completed",
+                                            expected=("processing",), step=None,
+                                            rerender_error="Re-render cancelled", cancel_requested=True)
+    else:
+        cancelled = await asyncio.to_thread(active_workflows.transition, animation_id, "cancelled",
+                                            expected=("processing", "resuming"))
+    if not cancelled:
+        raise HTTPException(status_code=409, detail=f"Animation is already {record['status']}")
+    cancel_local_job(animation_id)
+    record = await asyncio.to_thread(active_workflows.get, animation_id)
+    return {"id": animation_id, "status": record["status"]}
+
+def cancel_local_job(animation_id: str):
+    """Stop a job if it runs on this process. Renders are killed first, so
+    the worker slots are free before the workflow task unwinds."""
+    cancel_render_jobs(animation_id)
+    cancel_fork_renders(animation_id)
+    task = running_workflows.get(animation_id)
+    if task is not None:
+        task.cancel()
+
+async def watch_cancellations():
+    # A DELETE handled by another API process only changes the job store.
+    # All running jobs are read in one query per poll.
+    while True:
+        await asyncio.sleep(CANCEL_POLL_SECONDS)
+        if not running_workflows:
+            continue
+        records = await asyncio.to_thread(active_workflows.get_many, list(running_workflows))
+        for animation_id, record in records.items():
+            if is_cancelled(record):
+                cancel_local_job(animation_id)
+
+def is_cancelled(record: dict) -> bool:
+    """True when the job, or the re-render running on it, was cancelled"""
+    return record.get("status") == "cancelled" or bool(record.get("cancel_requested"))
+
+def owner_is_gone(owner: str) -> bool:
+    """True when ``owner`` is a process on this host that no longer exists"""
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+@app.on_event("startup")
+async def load_manim_api():
+    # Pre-flight checks need the manim API listing; build it before the first request
+    asyncio.get_running_loop().run_in_executor(None, manim_api)
+
+@app.on_event("startup")
+async def start_cancel_watcher():
+    watcher = asyncio.create_task(watch_cancellations())
+    background_tasks.add(watcher)
+
+@app.on_event("startup")
+async def resume_orphaned_workflows():
+    # Jobs whose server process died resume from their last checkpoint.
+    # "resuming" is a claim, so only one of several new workers takes each job.
+    for record in await asyncio.to_thread(active_workflows.list_by_status, "processing", limit=1000):
+        animation_id = record.get("id")
+        if not animation_id or not owner_is_gone(record.get("owner")):
+            continue
+        if not await asyncio.to_thread(active_workflows.transition, animation_id, "resuming",
+                                       expected=("processing",)):
+            continue
+        await asyncio.to_thread(active_workflows.transition, animation_id, "processing",
+                                expected=("resuming",), owner=PROCESS_OWNER)
+        if record.get("step") == "rerendering":
+            start_job(animation_id, run_rerender_job(animation_id, record.get("quality") or DEFAULT_QUALITY))
+        else:
+            start_job(animation_id, run_workflow_job(animation_id, record["prompt"]))
+
+@app.on_event("shutdown")
+async def cancel_workflows():
+    for task in [*running_workflows.values(), *background_tasks]:
+        task.cancel()
+    shutdown_render_pool()
+    shutdown_fork_server()
 
 @app.get("/animation/{animation_id}")
 async def get_animation_status(animation_id: str):
-    if animation_id not in active_workflows:
+    result = await asyncio.to_thread(active_workflows.get, animation_id)
+    if result is None:
         raise HTTPException(status_code=404, detail="Animation not found")
     
-    result = active_workflows[animation_id]
-    
     scenes = result.get("scenes", [])
     video_url = f"/media/{os.path.basename(result['video_path'])}" if result.get("video_path") else None
     status = result.get("status", "failed")
@@ -71,9 +241,22 @@ async def get_animation_status(animation_id: str):
         "id": animation_id,
         "status": status,
         "scenes": scenes,
-        "video_url": video_url
+        "video_url": video_url,
+        "quality": result.get("quality", DEFAULT_QUALITY)
     }
 
+@app.get("/router-stats")
+async def get_router_stats():
+    return router_stats()
+
+@app.get("/preflight-stats")
+async def get_preflight_stats():
+    return preflight_stats()
+
+@app.get("/repair-stats")
+async def get_repair_stats():
+    return repair_stats()
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
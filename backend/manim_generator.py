@@ -6,23 +6,84 @@ from typing import Dict, Any
 import json
 import re
 import numpy as np
+from render_cache import get_render_cache, make_key, source_digest
+from render_workspace import job_workspace, publish_movie
+from progress import instrument_scene
+from hls_stream import progressive_hls
+
+_SOURCE_DIGEST = source_digest(__file__)
+
+# Prompt keywords for each template branch, checked in this order
+TEMPLATE_KEYWORDS = {
+    "sorting": ['sort', 'bubble', 'merge', 'quick'],
+    "math": ['function', 'graph', 'plot', 'sine', 'cosine', 'equation', 'derivative'],
+    "physics": ['force', 'pendulum', 'gravity', 'motion', 'velocity', 'acceleration'],
+    "data_structure": ['tree', 'linked', 'stack', 'queue', 'array', 'node'],
+    "algorithm": ['search', 'binary', 'algorithm', 'bfs', 'dfs'],
+}
 
 class TextToAnimationGenerator:
+    # Quality settings applied in _render_scene; part of every cache key
+    render_settings = {
+        "quality": "medium_quality",
+        "format": "mp4",
+        "frame_rate": 30,
+        "background_color": "#000000",
+    }
+    
     def __init__(self):
         self.output_dir = "media"
         os.makedirs(self.output_dir, exist_ok=True)
+        self.cache = get_render_cache()
     
-    def generate_animation(self, prompt: str, animation_id: str) -> str:
-        """Generate Manim animation for ANY text prompt"""
+    def generate_animation(self, prompt: str, animation_id: str, settings: Dict[str, Any] = None) -> str:
+        """Generate Manim animation for ANY text prompt.
+        
+        ``settings`` override ``render_settings`` for this render only.
+        """
+        
+        # Reuse a previous render of identical scene inputs
+        cache_key = make_key(self._resolve_scene_inputs(prompt, settings))
+        final_path = os.path.join(self.output_dir, f"{animation_id}.mp4")
+        if self.cache.fetch(cache_key, final_path):
+            return final_path
         
         # Create dynamic scene class for this specific prompt
         scene_class = self._create_dynamic_scene(prompt)
         
         # Generate animation
-        video_path = self._render_scene(scene_class, animation_id)
+        video_path = self._render_scene(scene_class, animation_id, settings)
+        
+        if video_path:
+            self.cache.put(cache_key, video_path)
         
         return video_path
     
+    def _job_settings(self, settings: Dict[str, Any] = None) -> Dict[str, Any]:
+        """``render_settings`` with the overrides of one render"""
+        return {**self.render_settings, **(settings or {})}
+    
+    def _resolve_scene_inputs(self, prompt: str, settings: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Everything that determines the rendered video for a prompt"""
+        prompt_lower = prompt.lower()
+        template = next(
+            (name for name, words in TEMPLATE_KEYWORDS.items() if any(word in prompt_lower for word in words)),
+            "general"
+        )
+        numbers = []
+        if template == "sorting":
+            numbers = [int(n) for n in re.findall(r'\d+', prompt)[:5]] or [64, 34, 25, 12, 22]
+        
+        return {
+            "generator": __name__,
+            "source": _SOURCE_DIGEST,
+            "template": template,
+            "numbers": numbers,
+            # The prompt text is drawn on screen, so it is part of the output
+            "prompt": prompt,
+            "settings": self._job_settings(settings),
+        }
+    
     def _create_dynamic_scene(self, prompt: str):
         """Create a dynamic Manim scene for any prompt"""
         
@@ -51,19 +112,19 @@ class TextToAnimationGenerator:
                 self.wait(2)
             
             def _is_sorting_prompt(self, prompt):
-                return any(word in prompt.lower() for word in ['sort', 'bubble', 'merge', 'quick'])
+                return any(word in prompt.lower() for word in TEMPLATE_KEYWORDS["sorting"])
             
             def _is_math_prompt(self, prompt):
-                return any(word in prompt.lower() for word in ['function', 'graph', 'plot', 'sine', 'cosine', 'equation', 'derivative'])
+                return any(word in prompt.lower() for word in TEMPLATE_KEYWORDS["math"])
             
             def _is_physics_prompt(self, prompt):
-                return any(word in prompt.lower() for word in ['force', 'pendulum', 'gravity', 'motion', 'velocity', 'acceleration'])
+                return any(word in prompt.lower() for word in TEMPLATE_KEYWORDS["physics"])
             
             def _is_data_structure_prompt(self, prompt):
-                return any(word in prompt.lower() for word in ['tree', 'linked', 'stack', 'queue', 'array', 'node'])
+                return any(word in prompt.lower() for word in TEMPLATE_KEYWORDS["data_structure"])
             
             def _is_algorithm_prompt(self, prompt):
-                return any(word in prompt.lower() for word in ['search', 'binary', 'algorithm', 'bfs', 'dfs'])
+                return any(word in prompt.lower() for word in TEMPLATE_KEYWORDS["algorithm"])
             
             def _create_sorting_animation(self, prompt):
                 """Create sorting animation"""
@@ -321,37 +382,22 @@ class TextToAnimationGenerator:
         
         return DynamicScene
     
-    def _render_scene(self, scene_class, animation_id: str) -> str:
+    def _render_scene(self, scene_class, animation_id: str, settings: Dict[str, Any] = None) -> str:
         """Render the Manim scene and return video path"""
         
-        # Configure Manim for web output
-        config.media_dir = self.output_dir
-        config.video_dir = os.path.join(self.output_dir, "videos")
-        config.quality = "medium_quality"
-        config.format = "mp4"
-        config.frame_rate = 30
-        config.background_color = "#000000"
-        
-        # Create and render scene
-        scene = scene_class()
-        scene.render()
+        final_path = os.path.join(self.output_dir, f"{animation_id}.mp4")
         
-        # Find the generated video file
-        video_files = []
-        for root, dirs, files in os.walk(config.video_dir):
-            for file in files:
-                if file.endswith('.mp4'):
-                    video_files.append(os.path.join(root, file))
-        
-        if video_files:
-            # Get the most recent video file
-            latest_video = max(video_files, key=os.path.getctime)
+        # Render in a private scratch directory so concurrent jobs never collide
+        with job_workspace(animation_id):
+            # Configure Manim for web output
+            for key, value in self._job_settings(settings).items():
+                setattr(config, key, value)
             
-            # Copy to a predictable location
-            final_path = os.path.join(self.output_dir, f"{animation_id}.mp4")
-            import shutil
-            shutil.copy2(latest_video, final_path)
+            # Create and render scene, reporting progress from its render loop
+            scene = instrument_scene(scene_class())
+            # Playable as HLS from the first finished play
+            with progressive_hls(scene, animation_id):
+                scene.render()
             
-            return final_path
-        
-        return None
\ No newline at end of file
+            # Take the output straight from the file writer
+            return publish_movie(scene, final_path)
\ No newline at end of file
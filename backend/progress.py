@@ -0,0 +1,278 @@
+"""
+Render progress events pushed to clients instead of status polling.
+
+Worker side: ``instrument_scene`` hooks a manim scene's renderer so every
+``play`` call, rendered frame and the final encode emit an event through the
+sink installed by the render pool for the current job.
+
+Server side: ``ProgressBroker`` keeps a short, sequence-numbered history per
+job and wakes waiting requests. ``register_progress_routes`` adds a
+Server-Sent Events stream and a long-poll fallback to a FastAPI app. The
+latest event is also written to the job record (stage changes at once, frame
+counts at most once a second), so a request that lands on another API
+process still sees progress by reading the job store. Finished jobs are
+dropped from memory after a grace period for reconnecting clients.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from job_store import FINISHED_STATUSES
+
+# Minimum seconds between two frame-count events of one play
+FRAME_EVENT_INTERVAL = 0.25
+# Seconds between job store reads while waiting for events
+STORE_POLL_SECONDS = 1.0
+# Events kept per job for clients that reconnect
+HISTORY_SIZE = 200
+# Minimum seconds between job store writes of events with the same stage
+STORE_WRITE_INTERVAL = 1.0
+# Seconds a finished job's events stay in memory for reconnecting clients
+FORGET_AFTER_SECONDS = 300
+# Seconds between sweeps for jobs to forget
+SWEEP_INTERVAL_SECONDS = 60
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+_sink: Optional[Callable[[Dict[str, Any]], None]] = None
+
+
+def set_sink(sink: Optional[Callable[[Dict[str, Any]], None]]):
+    """Install the callable that receives progress events of the current job"""
+    global _sink
+    _sink = sink
+
+
+def emit(stage: str, **data):
+    """Report progress of the current job. A no-op outside a render job."""
+    if _sink is None:
+        return
+    try:
+        _sink({"stage": stage, **data})
+    except Exception as e:
+        print(f"Could not report progress: {e}")
+
+
+def instrument_scene(scene, label: Optional[str] = None, total_plays: Optional[int] = None):
+    """Emit progress events from the render loop of ``scene``.
+
+    Call after constructing the scene and before ``scene.render()``. Events
+    carry the play index (and ``total_plays`` when the caller knows it), the
+    frames written for the current play, and an ``encoding`` event when the
+    partial movies are combined.
+    """
+    renderer = scene.renderer
+    play = renderer.play
+    add_frame = renderer.add_frame
+    state = {"play_index": 0, "frame": 0, "last_emit": 0.0}
+
+    def report(stage, **data):
+        emit(stage, label=label, play_index=state["play_index"], total_plays=total_plays, **data)
+
+    def instrumented_play(current_scene, *args, **kwargs):
+        state["play_index"] = renderer.num_plays + 1
+        state["frame"] = 0
+        report("rendering")
+        return play(current_scene, *args, **kwargs)
+
+    def instrumented_add_frame(frame, num_frames=1):
+        add_frame(frame, num_frames)
+        if renderer.skip_animations:
+            return
+        state["frame"] += num_frames
+        now = time.monotonic()
+        if now - state["last_emit"] >= FRAME_EVENT_INTERVAL:
+            state["last_emit"] = now
+            frames = int(round(scene.duration * renderer.camera.frame_rate))
+            report("rendering", frame=state["frame"], frames=frames)
+
+    renderer.play = instrumented_play
+    renderer.add_frame = instrumented_add_frame
+
+    file_writer = getattr(renderer, "file_writer", None)
+    if file_writer is not None:
+        finish = file_writer.finish
+
+        def instrumented_finish():
+            report("encoding")
+            return finish()
+
+        file_writer.finish = instrumented_finish
+    return scene
+
+
+# ---------------------------------------------------------------------------
+# Server side
+# ---------------------------------------------------------------------------
+
+class ProgressBroker:
+    """Per-job event history that async requests can wait on"""
+
+    def __init__(self, jobs=None, history: int = HISTORY_SIZE, forget_after: float = FORGET_AFTER_SECONDS):
+        self.jobs = jobs
+        self.history = history
+        self.forget_after = forget_after
+        self._lock = threading.Lock()
+        self._events: Dict[str, deque] = {}
+        self._seq: Dict[str, int] = {}
+        # job id -> (stage, time) of the last event written to the job store
+        self._stored: Dict[str, tuple] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_sweep = 0.0
+
+    def publish(self, job_id: str, stage: str, **data) -> Dict[str, Any]:
+        """Record an event for ``job_id`` and wake its waiters. Safe from any thread."""
+        now = time.time()
+        first = 0
+        if job_id not in self._seq and self.jobs is not None:
+            # A forgotten job (re-rendered, say) continues its stored numbering
+            record = self.jobs.get(job_id) or {}
+            first = (record.get("progress") or {}).get("seq", 0)
+        with self._lock:
+            seq = self._seq.get(job_id, first) + 1
+            self._seq[job_id] = seq
+            event = {"seq": seq, "stage": stage, "time": now, **data}
+            self._events.setdefault(job_id, deque(maxlen=self.history)).append(event)
+            # Stage changes are stored at once, frame counts at most every STORE_WRITE_INTERVAL
+            stored_stage, stored_at = self._stored.get(job_id, (None, 0.0))
+            store = stage != stored_stage or now - stored_at >= STORE_WRITE_INTERVAL
+            if store:
+                self._stored[job_id] = (stage, now)
+
+        if self.jobs is not None and store:
+            fields = {"progress": event}
+            # The live playlist stays in the status after later events
+            if data.get("playlist_url"):
+                fields["playlist_url"] = data["playlist_url"]
+            self.jobs.update(job_id, **fields)
+
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake, job_id)
+        self._sweep(now)
+        return event
+
+    def pool_listener(self, job_id: str, event: Dict[str, Any]):
+        """Listener for ``RenderPool.add_progress_listener``"""
+        self.publish(job_id, **event)
+
+    def forget(self, job_id: str):
+        with self._lock:
+            self._events.pop(job_id, None)
+            self._seq.pop(job_id, None)
+            self._stored.pop(job_id, None)
+
+    def _sweep(self, now: float):
+        """Forget jobs idle for ``forget_after`` seconds that finished or
+        left the job store; later reads fall back to the stored record"""
+        if now - self._last_sweep < SWEEP_INTERVAL_SECONDS:
+            return
+        self._last_sweep = now
+        with self._lock:
+            idle = [job_id for job_id, events in self._events.items()
+                    if not events or now - events[-1]["time"] >= self.forget_after]
+            last_stages = {job_id: self._events[job_id][-1]["stage"] if self._events[job_id] else None
+                           for job_id in idle}
+        for job_id in idle:
+            if last_stages[job_id] not in FINISHED_STATUSES:
+                record = self.jobs.get(job_id) if self.jobs is not None else {"status": None}
+                if record is not None and record["status"] not in FINISHED_STATUSES:
+                    continue
+            self.forget(job_id)
+
+    def events_after(self, job_id: str, after: int = 0) -> List[Dict[str, Any]]:
+        """Events of ``job_id`` newer than sequence number ``after``"""
+        with self._lock:
+            events = [e for e in self._events.get(job_id, ()) if e["seq"] > after]
+        if events or self.jobs is None:
+            return events
+
+        # Job owned by another API process: fall back to its latest stored event
+        record = self.jobs.get(job_id) or {}
+        latest = record.get("progress")
+        if latest and latest["seq"] > after:
+            return [latest]
+        if record.get("status") in FINISHED_STATUSES and not latest:
+            return [{"seq": after + 1, "stage": record["status"], "time": time.time()}]
+        return []
+
+    def _wake(self, job_id: str):
+        for waiter in self._waiters.pop(job_id, []):
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def wait_for_events(self, job_id: str, after: int = 0, timeout: float = 25.0) -> List[Dict[str, Any]]:
+        """Return events newer than ``after``, waiting up to ``timeout`` seconds for one"""
+        self._loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout
+        while True:
+            events = self.events_after(job_id, after)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                return events
+
+            waiter = self._loop.create_future()
+            self._waiters.setdefault(job_id, []).append(waiter)
+            try:
+                await asyncio.wait_for(waiter, min(remaining, STORE_POLL_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                waiters = self._waiters.get(job_id)
+                if waiters and waiter in waiters:
+                    waiters.remove(waiter)
+
+    async def stream(self, job_id: str, after: int = 0, request=None, heartbeat: float = 15.0):
+        """Server-Sent Events for ``job_id`` until the job finishes"""
+        while True:
+            if request is not None and await request.is_disconnected():
+                return
+            events = await self.wait_for_events(job_id, after, timeout=heartbeat)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                after = event["seq"]
+                yield f"id: {event['seq']}\nevent: {event['stage']}\ndata: {json.dumps(event, default=str)}\n\n"
+                if event["stage"] in FINISHED_STATUSES:
+                    return
+
+
+def register_progress_routes(app, jobs, broker: ProgressBroker, prefix: str = "/animation"):
+    """Add ``{prefix}-stream/{id}`` (SSE) and ``{prefix}-events/{id}`` (long-poll) to ``app``"""
+    from fastapi import HTTPException, Request
+    from fastapi.responses import StreamingResponse
+
+    @app.get(prefix + "-stream/{job_id}")
+    async def stream_progress(job_id: str, request: Request, after: int = 0):
+        if jobs.get(job_id) is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        # EventSource sends the last seen id when it reconnects
+        last_event_id = request.headers.get("last-event-id")
+        if last_event_id and last_event_id.isdigit():
+            after = max(after, int(last_event_id))
+        return StreamingResponse(
+            broker.stream(job_id, after, request),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.get(prefix + "-events/{job_id}")
+    async def poll_progress(job_id: str, after: int = 0, timeout: float = 25.0):
+        record = jobs.get(job_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if record["status"] in FINISHED_STATUSES:
+            events = broker.events_after(job_id, after)
+        else:
+            events = await broker.wait_for_events(job_id, after, timeout=min(max(timeout, 0.0), 60.0))
+        record = jobs.get(job_id) or record
+        return {"id": job_id, "status": record["status"], "events": events}
@@ -0,0 +1,166 @@
+"""
+Content-addressed cache of rendered videos.
+
+Videos are stored under a key derived from the resolved scene inputs
+(template branch, extracted numbers, quality settings, or the generated
+code itself), so identical requests reuse the stored MP4 instead of
+rendering again. The index lives in SQLite so every render worker process
+shares the same entries, counters and size budget.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+DEFAULT_CACHE_DIR = os.path.join("media", "cache")
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+
+def make_key(inputs: Dict[str, Any]) -> str:
+    """Stable hash of the inputs that fully determine a render"""
+    payload = json.dumps(inputs, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def source_digest(path: str) -> str:
+    """Short hash of a source file, so editing a template invalidates its entries"""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+class RenderCache:
+    """Size-bounded, LRU-evicted store of rendered MP4s keyed by content hash"""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir or os.environ.get("EDUARENA_RENDER_CACHE_DIR", DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            configured = os.environ.get("EDUARENA_RENDER_CACHE_MB")
+            max_bytes = int(configured) * 1024 * 1024 if configured else DEFAULT_MAX_BYTES
+        self.max_bytes = max_bytes
+        self.db_path = os.path.join(self.cache_dir, "index.sqlite3")
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access)")
+            db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _count(self, db, name: str):
+        db.execute(
+            "INSERT INTO counters(name, value) VALUES(?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached video path for ``key``, or None on a miss"""
+        with self._connect() as db:
+            row = db.execute("SELECT path FROM entries WHERE key = ?", (key,)).fetchone()
+            if row and os.path.exists(row[0]):
+                db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+                self._count(db, "hits")
+                return row[0]
+            if row:
+                # File was removed behind our back
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._count(db, "misses")
+            return None
+
+    def fetch(self, key: str, dest_path: str) -> bool:
+        """Place the cached video for ``key`` at ``dest_path``. Returns True on a hit."""
+        cached = self.get(key)
+        if cached is None:
+            return False
+
+        os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        try:
+            # Hard links make a hit O(1) regardless of the video size
+            os.link(cached, dest_path)
+        except FileNotFoundError:
+            # Evicted by another process since the lookup
+            return False
+        except OSError:
+            try:
+                shutil.copy2(cached, dest_path)
+            except FileNotFoundError:
+                return False
+        return True
+
+    def put(self, key: str, video_path: str) -> Optional[str]:
+        """Store a rendered video under ``key`` and evict old entries past the size budget"""
+        if not video_path or not os.path.exists(video_path):
+            return None
+
+        cached_path = os.path.join(self.cache_dir, f"{key}.mp4")
+        temp_path = f"{cached_path}.{uuid.uuid4().hex}.tmp"
+        shutil.copy2(video_path, temp_path)
+        os.replace(temp_path, cached_path)
+
+        size = os.path.getsize(cached_path)
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries(key, path, size, created_at, last_access) VALUES(?, ?, ?, ?, ?)",
+                (key, cached_path, size, now, now),
+            )
+            self._evict(db)
+        return cached_path
+
+    def _evict(self, db):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, path, size in db.execute(
+            "SELECT key, path, size FROM entries ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._count(db, "evictions")
+            total -= size
+
+    def stats(self) -> Dict[str, int]:
+        with self._connect() as db:
+            counters = dict(db.execute("SELECT name, value FROM counters").fetchall())
+            entries, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+        }
+
+
+_cache: Optional[RenderCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_render_cache() -> RenderCache:
+    """Return the process-wide render cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RenderCache()
+        return _cache
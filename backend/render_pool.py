@@ -0,0 +1,577 @@
+"""
+Process-pool render backend for the animation servers.
+
+Each worker is a long-lived process that imports manim once when it is
+spawned and then takes render jobs from the parent. Every job runs inside
+its own manim ``tempconfig`` so quality, frame rate and media directories
+set by one job never leak into the next one.
+
+Every job has a wall-clock and a CPU budget. The worker stops a job that
+uses up its CPU time; the parent kills a worker whose job runs past its
+wall-clock budget or is cancelled, removes the job's scratch directories
+and starts a replacement worker.
+
+Queued jobs run shortest predicted render time first, with aging and a fair
+share of the workers per user (``render_scheduler.py``).
+"""
+
+import importlib
+import multiprocessing as mp
+import os
+import shutil
+import signal
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import Future
+from multiprocessing.connection import wait as wait_connections
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from render_scheduler import JobScheduler, expected_seconds, observe
+
+try:
+    import resource
+except ImportError:
+    # Windows: only the wall-clock budget is enforced
+    resource = None
+
+DEFAULT_WALL_SECONDS = 600
+
+
+def default_worker_count() -> int:
+    """Number of render workers, one per CPU core unless overridden"""
+    configured = os.environ.get("EDUARENA_RENDER_WORKERS")
+    if configured:
+        return max(1, int(configured))
+    return os.cpu_count() or 1
+
+
+def default_budgets() -> Dict[str, float]:
+    """Per-job budgets: ``EDUARENA_RENDER_WALL_SECONDS`` (default 600) and
+    ``EDUARENA_RENDER_CPU_SECONDS`` (default: the wall-clock budget)"""
+    wall = float(os.environ.get("EDUARENA_RENDER_WALL_SECONDS", DEFAULT_WALL_SECONDS))
+    cpu = float(os.environ.get("EDUARENA_RENDER_CPU_SECONDS", wall))
+    return {"wall_seconds": wall, "cpu_seconds": cpu}
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+_instances: Dict[str, Any] = {}
+
+
+def _resolve(target: str) -> Any:
+    """Resolve a "module:attribute" reference"""
+    module_name, _, attr_path = target.partition(":")
+    obj = importlib.import_module(module_name)
+    for attr in attr_path.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def get_instance(target: str) -> Any:
+    """Per-process instance of ``target`` ("module:Class").
+
+    Generators are constructed once per worker and reused for every job that
+    worker picks up.
+    """
+    instance = _instances.get(target)
+    if instance is None:
+        instance = _resolve(target)()
+        _instances[target] = instance
+    return instance
+
+
+def call_method(target: str, method: str, *args, **kwargs) -> Any:
+    """Call a method on the per-process instance of ``target``"""
+    return getattr(get_instance(target), method)(*args, **kwargs)
+
+
+class CPUBudgetExceeded(BaseException):
+    """Raised inside a worker when its job used up its CPU budget. Not an
+    ``Exception``, like ``KeyboardInterrupt``: generators catch those to
+    render a fallback video, which would run past the budget again."""
+
+
+def _on_cpu_limit(signum, frame):
+    raise CPUBudgetExceeded("Render exceeded its CPU budget")
+
+
+def _set_cpu_budget(seconds: Optional[float]):
+    """Let the current job use ``seconds`` more CPU time; None lifts the limit"""
+    if resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if seconds is None:
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime + seconds) + 1
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _worker_main(worker_id: int, inbox, conn, preload: Iterable[str]):
+    """Worker loop: import manim once, then run jobs until told to stop"""
+    if hasattr(os, "setpgid"):
+        # Own process group, so killing the worker also kills manim's ffmpeg
+        os.setpgid(0, 0)
+    if resource is not None:
+        signal.signal(signal.SIGXCPU, _on_cpu_limit)
+
+    # Each worker has its own pipe to the parent, so a killed worker cannot
+    # leave a shared queue locked
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    try:
+        from manim_config_fix import setup_manim_environment
+        setup_manim_environment()
+    except Exception as e:
+        print(f"Render worker {worker_id}: could not setup Manim environment: {e}")
+
+    import manim as mn
+
+    for module_name in preload:
+        try:
+            importlib.import_module(module_name)
+        except Exception as e:
+            print(f"Render worker {worker_id}: failed to preload {module_name}: {e}")
+
+    from progress import emit, set_sink
+    from render_workspace import set_workspace_listener
+
+    send(("ready", worker_id, os.getpid()))
+
+    while True:
+        job = inbox.get()
+        if job is None:
+            break
+
+        job_id, fn, args, kwargs, config, progress_id, budgets = job
+        set_sink(lambda event, progress_id=progress_id: send(("progress", worker_id, progress_id, event)))
+        # The parent removes these if it has to kill the job
+        set_workspace_listener(lambda path, job_id=job_id: send(("workspace", worker_id, job_id, path)))
+        emit("rendering")
+        try:
+            _set_cpu_budget(budgets.get("cpu_seconds"))
+            if isinstance(fn, str):
+                fn = _resolve(fn)
+            with mn.tempconfig(config or {}):
+                result = fn(*args, **kwargs)
+            _set_cpu_budget(None)
+            send(("done", worker_id, job_id, result, None))
+        except BaseException as e:
+            _set_cpu_budget(None)
+            error = f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+            send(("done", worker_id, job_id, None, error))
+        finally:
+            set_sink(None)
+            set_workspace_listener(None)
+
+
+# ---------------------------------------------------------------------------
+# Parent side
+# ---------------------------------------------------------------------------
+
+class RenderJobError(RuntimeError):
+    """Raised in the parent when a render job fails inside a worker"""
+
+
+class RenderTimeoutError(RenderJobError):
+    """Raised in the parent when a job ran past its wall-clock budget"""
+
+
+class RenderCancelledError(RenderJobError):
+    """Raised in the parent when a running job was cancelled"""
+
+
+class _Worker:
+    def __init__(self, worker_id: int, process, inbox, conn):
+        self.worker_id = worker_id
+        self.process = process
+        self.inbox = inbox
+        self.conn = conn
+        self.ready = False
+        self.job_id: Optional[str] = None
+        self.started: Optional[float] = None
+        self.deadline: Optional[float] = None
+        self.workspaces: List[str] = []
+
+
+class RenderPool:
+    """Pool of long-lived manim render processes fed from a job queue"""
+
+    def __init__(self, workers: Optional[int] = None, preload: Iterable[str] = ()):
+        self.size = workers or default_worker_count()
+        self.preload = list(preload)
+
+        # spawn keeps workers independent of whatever threads the API process runs
+        self._ctx = mp.get_context("spawn")
+        self._lock = threading.Lock()
+        self._workers: Dict[int, _Worker] = {}
+        self._pending = JobScheduler()
+        self._futures: Dict[str, Future] = {}
+        # Group (e.g. the animation id) of each job, for cancel()
+        self._groups: Dict[str, str] = {}
+        # (user, kind, model seconds, predicted seconds) of each job
+        self._costs: Dict[str, tuple] = {}
+        # Stopped workers whose pipes are read to the end before their
+        # scratch directories are removed
+        self._retired: Dict[int, _Worker] = {}
+        self._next_worker_id = 0
+        self._closed = False
+        self._progress_listeners = []
+
+        for _ in range(self.size):
+            self._spawn_worker()
+
+        self._collector = threading.Thread(target=self._collect, name="render-pool-collector", daemon=True)
+        self._collector.start()
+
+    def submit(self, fn: Callable, *args, job_id: Optional[str] = None,
+               config: Optional[Dict[str, Any]] = None, progress_id: Optional[str] = None,
+               group: Optional[str] = None, wall_seconds: Optional[float] = None,
+               cpu_seconds: Optional[float] = None, cost: Optional[float] = None,
+               kind: Optional[str] = None, user: Optional[str] = None, **kwargs) -> Future:
+        """Queue ``fn(*args, **kwargs)`` for a worker and return its future.
+
+        ``fn`` must be importable by the workers: a module-level function or a
+        "module:attribute" string. ``config`` is applied with manim's
+        ``tempconfig`` for the duration of the job only. Progress events are
+        reported under ``progress_id`` (default: the job id), so the steps of
+        one pipeline can all report to the request that started them.
+
+        The job fails with ``RenderTimeoutError`` after ``wall_seconds`` of
+        running and with a ``CPUBudgetExceeded`` error after ``cpu_seconds``
+        of CPU time (defaults: ``default_budgets()``). ``cancel(group)``
+        cancels every job submitted with that ``group``.
+
+        ``cost`` is the model's render time for the job (see
+        ``render_scheduler.plan_seconds``), calibrated with the observed
+        render times of jobs of the same ``kind`` (default: the function
+        called). ``user`` (default: the group) shares the workers fairly
+        with other users.
+        """
+        if self._closed:
+            raise RuntimeError("Render pool has been shut down")
+
+        budgets = default_budgets()
+        if wall_seconds is not None:
+            budgets["wall_seconds"] = wall_seconds
+        if cpu_seconds is not None:
+            budgets["cpu_seconds"] = cpu_seconds
+
+        job_id = job_id or str(uuid.uuid4())
+        kind = kind or _job_kind(fn, args)
+        predicted = expected_seconds(kind, cost)
+        user = user or group or job_id
+        future = Future()
+        with self._lock:
+            self._futures[job_id] = future
+            if group is not None:
+                self._groups[job_id] = group
+            self._costs[job_id] = (user, kind, cost, predicted)
+            job = (job_id, fn, args, kwargs, config, progress_id or job_id, budgets)
+            self._pending.push(job_id, job, predicted, user, time.monotonic())
+            self._dispatch()
+        return future
+
+    def cancel(self, job_id: str) -> int:
+        """Cancel the job ``job_id``, or every job of the group ``job_id``.
+
+        Queued jobs are dropped. Running jobs are killed with their worker,
+        their scratch directories removed and a new worker started. Returns
+        the number of jobs cancelled.
+        """
+        queued, killed = [], []
+        with self._lock:
+            matches = {j for j in self._futures if j == job_id or self._groups.get(j) == job_id}
+            if not matches:
+                return 0
+            for job in self._pending.remove(matches):
+                queued.append(self._pop_future(job[0]))
+            for worker in list(self._workers.values()):
+                if worker.job_id in matches:
+                    killed.append(self._pop_future(worker.job_id))
+                    self._kill_worker(worker)
+            self._dispatch()
+
+        for future in queued:
+            future.cancel()
+        for future in killed:
+            future.set_exception(RenderCancelledError("Render cancelled"))
+        return len(queued) + len(killed)
+
+    def eta(self, job_id: str) -> Optional[float]:
+        """Predicted seconds until ``job_id`` finishes, or None when it is not
+        queued or running"""
+        with self._lock:
+            now = time.monotonic()
+            busy = []
+            for worker in self._workers.values():
+                if worker.job_id is None:
+                    continue
+                remaining = max(0.0, self._costs[worker.job_id][3] - (now - worker.started))
+                if worker.job_id == job_id:
+                    return remaining
+                busy.append((self._costs[worker.job_id][0], remaining))
+            if job_id not in self._futures:
+                return None
+            return self._pending.eta(job_id, busy, self.size)
+
+    def load(self) -> Dict[str, float]:
+        """Queued jobs, and the predicted wait of a job submitted now: the
+        predicted work of the running and queued jobs spread over the workers"""
+        with self._lock:
+            now = time.monotonic()
+            running = sum(max(0.0, self._costs[w.job_id][3] - (now - w.started))
+                          for w in self._workers.values() if w.job_id is not None)
+            return {
+                "queued": len(self._pending),
+                "wait_seconds": (running + self._pending.queued_seconds()) / self.size,
+            }
+
+    def add_progress_listener(self, listener: Callable[[str, Dict[str, Any]], None]):
+        """Call ``listener(job_id, event)`` for every progress event a job emits"""
+        with self._lock:
+            if listener not in self._progress_listeners:
+                self._progress_listeners.append(listener)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            busy = sum(1 for w in self._workers.values() if w.job_id is not None)
+            return {
+                "workers": len(self._workers),
+                "busy": busy,
+                "idle": len(self._workers) - busy,
+                "queued": len(self._pending),
+                "queued_seconds": round(self._pending.queued_seconds(), 1),
+            }
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            self._closed = True
+            cancelled = [self._pop_future(job_id) for job_id, *_ in self._pending.drain()]
+            for worker in self._workers.values():
+                worker.inbox.put(None)
+        for future in cancelled:
+            future.cancel()
+        if wait:
+            for worker in list(self._workers.values()):
+                worker.process.join(timeout=5)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+
+    def _spawn_worker(self):
+        worker_id = self._next_worker_id
+        self._next_worker_id += 1
+        inbox = self._ctx.Queue()
+        reader, writer = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, inbox, writer, self.preload),
+            name=f"render-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        writer.close()
+        self._workers[worker_id] = _Worker(worker_id, process, inbox, reader)
+
+    def _pop_future(self, job_id: str) -> Future:
+        """Forget a job. Caller holds the lock."""
+        self._groups.pop(job_id, None)
+        self._costs.pop(job_id, None)
+        return self._futures.pop(job_id)
+
+    def _kill_worker(self, worker: _Worker):
+        """Kill a worker and its children and start a replacement. Caller holds the lock."""
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(worker.process.pid, signal.SIGKILL)
+            else:
+                worker.process.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+        self._retire(worker)
+
+    def _retire(self, worker: _Worker):
+        """Replace a stopped worker. Caller holds the lock. The collector
+        removes its job's scratch directories once its pipe is drained."""
+        del self._workers[worker.worker_id]
+        self._retired[worker.worker_id] = worker
+        if not self._closed:
+            self._spawn_worker()
+
+    def _dispatch(self):
+        """Hand pending jobs to idle workers. Caller holds the lock."""
+        idle = [w for w in self._workers.values() if w.ready and w.job_id is None]
+        running = {}
+        for worker in self._workers.values():
+            if worker.job_id is not None:
+                user = self._costs[worker.job_id][0]
+                running[user] = running.get(user, 0) + 1
+        while idle and self._pending:
+            user, job = self._pending.pop(running, self.size)
+            job_id = job[0]
+            future = self._futures[job_id]
+            if not future.set_running_or_notify_cancel():
+                self._pop_future(job_id)
+                continue
+            worker = idle.pop()
+            worker.job_id = job_id
+            running[user] = running.get(user, 0) + 1
+            worker.started = time.monotonic()
+            worker.deadline = worker.started + job[6]["wall_seconds"]
+            worker.workspaces = []
+            worker.inbox.put(job)
+
+    def _expire_jobs(self):
+        """Kill workers whose job ran past its wall-clock budget"""
+        expired = []
+        now = time.monotonic()
+        with self._lock:
+            for worker in list(self._workers.values()):
+                if worker.job_id is not None and worker.deadline <= now:
+                    expired.append(self._pop_future(worker.job_id))
+                    self._kill_worker(worker)
+            if expired:
+                self._dispatch()
+        for future in expired:
+            future.set_exception(RenderTimeoutError("Render exceeded its wall-clock budget"))
+
+    def _collect(self):
+        last_reap = time.monotonic()
+        while not self._closed:
+            if time.monotonic() - last_reap >= 1:
+                self._reap_dead_workers()
+                last_reap = time.monotonic()
+            self._expire_jobs()
+
+            with self._lock:
+                workers = [*self._workers.values(), *self._retired.values()]
+                conns = {w.conn: w for w in workers if not w.conn.closed}
+                deadlines = [w.deadline for w in self._workers.values() if w.job_id is not None]
+            timeout = min([1.0] + [max(0.0, d - time.monotonic()) for d in deadlines])
+            # Pipes of newly started workers are picked up on the next pass
+            for conn in wait_connections(list(conns), timeout):
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    self._close_worker(conns[conn])
+                    continue
+                self._handle(message)
+
+    def _close_worker(self, worker: _Worker):
+        """The worker's pipe is at its end: remove a retired worker's scratch
+        directories, or leave a dead one to the reaper"""
+        worker.conn.close()
+        with self._lock:
+            retired = self._retired.pop(worker.worker_id, None)
+        if retired is not None:
+            for path in retired.workspaces:
+                shutil.rmtree(path, ignore_errors=True)
+            retired.process.join(timeout=1)
+
+    def _handle(self, message):
+        finished = None
+        progress = None
+        with self._lock:
+            kind, worker_id = message[0], message[1]
+            worker = self._workers.get(worker_id)
+            if kind == "ready" and worker is not None:
+                worker.ready = True
+            elif kind == "progress":
+                progress = (message[2], message[3], list(self._progress_listeners))
+            elif kind == "workspace":
+                worker = worker or self._retired.get(worker_id)
+                if worker is not None and worker.job_id == message[2]:
+                    worker.workspaces.append(message[3])
+            elif kind == "done":
+                _, _, job_id, result, error = message
+                if worker is not None and worker.job_id == job_id:
+                    if error is None:
+                        _, kind, cost, _ = self._costs[job_id]
+                        observe(kind, cost, time.monotonic() - worker.started)
+                    worker.job_id = None
+                    worker.deadline = None
+                if job_id in self._futures:
+                    finished = (self._pop_future(job_id), result, error)
+            self._dispatch()
+
+        if progress is not None:
+            job_id, event, listeners = progress
+            for listener in listeners:
+                try:
+                    listener(job_id, event)
+                except Exception as e:
+                    print(f"Progress listener failed for job {job_id}: {e}")
+
+        # Resolve outside the lock: done-callbacks may submit follow-up jobs
+        if finished is not None:
+            future, result, error = finished
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(RenderJobError(error))
+
+    def _reap_dead_workers(self):
+        """Fail the job of any worker that died and replace the worker"""
+        failed = []
+        with self._lock:
+            for worker in list(self._workers.values()):
+                if worker.process.is_alive():
+                    continue
+                if worker.job_id is not None and worker.job_id in self._futures:
+                    failed.append((self._pop_future(worker.job_id), worker.process.exitcode))
+                self._retire(worker)
+                if worker.conn.closed:
+                    # Pipe already drained
+                    self._retired.pop(worker.worker_id)
+                    for path in worker.workspaces:
+                        shutil.rmtree(path, ignore_errors=True)
+            self._dispatch()
+
+        for future, exitcode in failed:
+            future.set_exception(RenderJobError(f"Render worker exited with code {exitcode}"))
+
+
+def _job_kind(fn: Callable, args: tuple) -> str:
+    """Default calibration kind of a job: the function (or generator method) it calls"""
+    if fn is call_method and len(args) >= 2:
+        return f"{args[0]}.{args[1]}"
+    return fn if isinstance(fn, str) else f"{fn.__module__}.{fn.__qualname__}"
+
+
+_pool: Optional[RenderPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool(preload: Iterable[str] = ()) -> RenderPool:
+    """Return the process-wide render pool, starting it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RenderPool(preload=preload)
+        return _pool
+
+
+def cancel_render_jobs(job_id: str) -> int:
+    """Cancel a job or job group on the process-wide pool, if it was started"""
+    with _pool_lock:
+        pool = _pool
+    return pool.cancel(job_id) if pool is not None else 0
+
+
+def shutdown_render_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
@@ -0,0 +1,250 @@
+"""
+Cost-aware ordering of render pool jobs.
+
+Every job gets a predicted render time before it runs. For template prompts
+it comes from the resolved scene plan (number of plays, summed ``run_time``,
+frame rate and resolution); jobs without a plan start from a default. The
+prediction is calibrated per job kind with the render times observed so far,
+so a model that is off by a constant factor corrects itself after a few jobs.
+
+``JobScheduler`` is the pool's queue. It runs the shortest predicted job
+first, with aging: each second a job has waited counts as one second less of
+predicted work (``EDUARENA_SCHED_AGING``), so a long render is never starved
+by a stream of short ones. Jobs are grouped by user, and a user already
+running at least their share of the workers only gets another one when no
+other user is waiting. ``eta`` replays this policy over the current queue to
+predict when a job will finish.
+"""
+
+import heapq
+import itertools
+import os
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Seconds of predicted work one second of waiting is worth
+AGING = float(os.environ.get("EDUARENA_SCHED_AGING", 1.0))
+# Prediction for a kind of job that has no plan and has never finished
+DEFAULT_JOB_SECONDS = 30.0
+
+# Cost model: scene setup and teardown, then per play, then per rasterized
+# pixel. Calibrated per job kind at run time.
+SETUP_SECONDS = 1.5
+PLAY_SECONDS = 0.15
+PIXEL_SECONDS = 1e-8
+
+# Weight of one observation in the calibration factor of its kind, and the
+# largest factor either way
+CALIBRATION_WEIGHT = 0.3
+MAX_CALIBRATION = 100.0
+
+# manim quality presets: (pixel width, pixel height, frame rate)
+QUALITY_FORMATS = {
+    "low_quality": (854, 480, 15),
+    "medium_quality": (1280, 720, 30),
+    "high_quality": (1920, 1080, 60),
+    "production_quality": (2560, 1440, 60),
+    "fourk_quality": (3840, 2160, 60),
+}
+
+# Plays and seconds of video of each keyword branch of the generator
+# templates (``manim_generator``, ``manim_generator_clean``), including the
+# title and the closing wait. Sorting adds three plays per swap.
+TEMPLATE_PLANS = {
+    "sorting": (4, 4.5),
+    "math": (5, 5.5),
+    "physics": (7, 8.5),
+    "data_structure": (8, 6.5),
+    "algorithm": (9, 8.0),
+    "general": (8, 9.5),
+}
+SWAP_PLAYS, SWAP_SECONDS = 3, 1.0
+DEFAULT_SORT_NUMBERS = [64, 34, 25, 12, 22]
+
+
+# ---------------------------------------------------------------------------
+# Cost prediction
+# ---------------------------------------------------------------------------
+
+def scene_format(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Resolution and frame rate of manim render settings"""
+    width, height, frame_rate = QUALITY_FORMATS.get(settings.get("quality"), QUALITY_FORMATS["medium_quality"])
+    return {
+        "pixel_width": settings.get("pixel_width", width),
+        "pixel_height": settings.get("pixel_height", height),
+        "frame_rate": settings.get("frame_rate", frame_rate),
+    }
+
+
+def plan_seconds(plan: Dict[str, Any]) -> float:
+    """Uncalibrated render time of ``{"plays", "run_time", "frame_rate",
+    "pixel_width", "pixel_height"}``"""
+    frames = plan["run_time"] * plan["frame_rate"]
+    pixels = plan["pixel_width"] * plan["pixel_height"]
+    return SETUP_SECONDS + plan["plays"] * PLAY_SECONDS + frames * pixels * PIXEL_SECONDS
+
+
+def plays_plan(plays: List[Dict[str, Any]], settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Plan of recorded plays (``segment_render.record_plays``) or compiled
+    IR plays (``scene_ir.compile_program``)"""
+    run_time = sum(play.get("wait", play.get("run_time", 0.0)) for play in plays)
+    return {"plays": len(plays), "run_time": run_time, **scene_format(settings)}
+
+
+def _bubble_sort_swaps(numbers: List[int]) -> int:
+    values, swaps = list(numbers), 0
+    for i in range(len(values)):
+        for j in range(len(values) - 1 - i):
+            if values[j] > values[j + 1]:
+                values[j], values[j + 1] = values[j + 1], values[j]
+                swaps += 1
+    return swaps
+
+
+def template_plan(branch: str, prompt: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Plan of a generator template branch for ``prompt``"""
+    plays, run_time = TEMPLATE_PLANS.get(branch, TEMPLATE_PLANS["general"])
+    if branch == "sorting":
+        numbers = [int(n) for n in re.findall(r'\d+', prompt)[:5]] or DEFAULT_SORT_NUMBERS
+        swaps = _bubble_sort_swaps(numbers)
+        plays, run_time = plays + swaps * SWAP_PLAYS, run_time + swaps * SWAP_SECONDS
+    return {"plays": plays, "run_time": run_time, **scene_format(settings)}
+
+
+def prompt_plan(target: str, prompt: str, settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Plan of the scene a generator template renders for ``prompt``, resolved
+    from its ``TEMPLATE_KEYWORDS`` without importing manim. ``settings``
+    default to medium quality; the calibration of the job kind absorbs the
+    difference."""
+    from template_router import generator_branch
+
+    return template_plan(generator_branch(target, prompt), prompt, settings or {})
+
+
+_calibration: Dict[str, float] = {}
+_calibration_lock = threading.Lock()
+
+
+def expected_seconds(kind: str, seconds: Optional[float] = None) -> float:
+    """Calibrated render time of a job of ``kind`` whose model predicts
+    ``seconds`` (None: no plan)"""
+    with _calibration_lock:
+        factor = _calibration.get(kind, 1.0)
+    return (DEFAULT_JOB_SECONDS if seconds is None else seconds) * factor
+
+
+def observe(kind: str, seconds: Optional[float], actual: float):
+    """Move the calibration of ``kind`` toward the ratio of the ``actual``
+    render time to the model's ``seconds`` (None: no plan)"""
+    model = DEFAULT_JOB_SECONDS if seconds is None else seconds
+    if model <= 0 or actual <= 0:
+        return
+    ratio = min(MAX_CALIBRATION, max(1 / MAX_CALIBRATION, actual / model))
+    with _calibration_lock:
+        factor = _calibration.get(kind, 1.0)
+        _calibration[kind] = factor + CALIBRATION_WEIGHT * (ratio - factor)
+
+
+def calibration() -> Dict[str, float]:
+    with _calibration_lock:
+        return dict(_calibration)
+
+
+# ---------------------------------------------------------------------------
+# Queue
+# ---------------------------------------------------------------------------
+
+def _pick(heads: Dict[str, tuple], running: Dict[str, int], workers: int) -> str:
+    """User whose queued job runs next"""
+    active = set(heads) | {user for user, count in running.items() if count > 0}
+    share = -(-workers // len(active))
+    eligible = [user for user in heads if running.get(user, 0) < share] or list(heads)
+    return min(eligible, key=lambda user: heads[user])
+
+
+class JobScheduler:
+    """Queue of pool jobs ordered by predicted cost, aging and per-user share.
+
+    Not thread-safe; the pool calls it under its own lock.
+    """
+
+    def __init__(self, aging: float = AGING):
+        self.aging = aging
+        self._queues: Dict[str, List[tuple]] = {}
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def __iter__(self):
+        for queue in self._queues.values():
+            for entry in queue:
+                yield entry[-1]
+
+    def push(self, job_id: str, item: Any, seconds: float, user: str, now: float):
+        # seconds - aging * (t - now) orders jobs the same way at every later t
+        entry = (seconds + self.aging * now, next(self._seq), job_id, seconds, item)
+        heapq.heappush(self._queues.setdefault(user, []), entry)
+
+    def pop(self, running: Dict[str, int], workers: int) -> Tuple[str, Any]:
+        """``(user, item)`` of the job to run next"""
+        user = _pick({u: q[0] for u, q in self._queues.items()}, running, workers)
+        entry = heapq.heappop(self._queues[user])
+        if not self._queues[user]:
+            del self._queues[user]
+        return user, entry[-1]
+
+    def remove(self, job_ids: Iterable[str]) -> List[Any]:
+        """Drop the queued jobs in ``job_ids`` and return their items"""
+        job_ids = set(job_ids)
+        removed = []
+        for user in list(self._queues):
+            queue = self._queues[user]
+            kept = [entry for entry in queue if entry[2] not in job_ids]
+            if len(kept) == len(queue):
+                continue
+            removed.extend(entry[-1] for entry in queue if entry[2] in job_ids)
+            if kept:
+                heapq.heapify(kept)
+                self._queues[user] = kept
+            else:
+                del self._queues[user]
+        return removed
+
+    def drain(self) -> List[Any]:
+        items = list(self)
+        self._queues.clear()
+        return items
+
+    def queued_seconds(self) -> float:
+        return sum(entry[3] for queue in self._queues.values() for entry in queue)
+
+    def eta(self, job_id: str, busy: List[Tuple[str, float]], workers: int) -> Optional[float]:
+        """Seconds until queued ``job_id`` finishes, if nothing else arrives.
+
+        ``busy`` lists ``(user, remaining seconds)`` of the running jobs.
+        """
+        queues = {user: list(queue) for user, queue in self._queues.items()}
+        running: Dict[str, int] = {}
+        order = itertools.count()
+        # (time the worker is free, tie-break, user of the job it finishes)
+        free = [(0.0, next(order), None) for _ in range(max(0, workers - len(busy)))]
+        for user, remaining in busy:
+            running[user] = running.get(user, 0) + 1
+            free.append((remaining, next(order), user))
+        heapq.heapify(free)
+
+        while queues and free:
+            now, _, finished = heapq.heappop(free)
+            if finished is not None:
+                running[finished] -= 1
+            user = _pick({u: q[0] for u, q in queues.items()}, running, workers)
+            entry = heapq.heappop(queues[user])
+            if not queues[user]:
+                del queues[user]
+            if entry[2] == job_id:
+                return now + entry[3]
+            running[user] = running.get(user, 0) + 1
+            heapq.heappush(free, (now + entry[3], next(order), user))
+        return None
@@ -0,0 +1,96 @@
+"""
+Per-job scratch directories for manim renders.
+
+Every render job gets a private media directory under ``media/jobs/<job_id>``
+so concurrent jobs never share partial movie files or output names. The
+finished movie path is taken straight from the scene's file writer instead
+of scanning the media tree for the newest ``.mp4``.
+"""
+
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from ffmpeg_tools import finalize_mp4, web_delivery_enabled
+
+JOBS_DIR = os.path.join("media", "jobs")
+
+# manim's config is process-global, so one job at a time may own it per process.
+# Render workers run one job each, so this only serialises threaded servers.
+_config_lock = threading.RLock()
+
+# Told about every scratch directory created, so a killed job's can be removed
+_workspace_listener: Optional[Callable[[str], None]] = None
+
+
+def set_workspace_listener(listener: Optional[Callable[[str], None]]):
+    global _workspace_listener
+    _workspace_listener = listener
+
+
+def scratch_dir(job_id: str) -> str:
+    """Scratch directory used by the render of ``job_id``"""
+    return os.path.join(JOBS_DIR, job_id)
+
+
+@contextmanager
+def job_workspace(job_id: str, keep: bool = False):
+    """Point manim at a private scratch directory for the duration of one job.
+
+    The global manim config is restored on exit and the scratch directory is
+    removed unless ``keep`` is set. Settings changed inside the block (quality,
+    frame rate, ...) are discarded with it.
+    """
+    import manim as mn
+
+    scratch = os.path.abspath(scratch_dir(job_id))
+    if _workspace_listener is not None:
+        _workspace_listener(scratch)
+    os.makedirs(scratch, exist_ok=True)
+    try:
+        with _config_lock, mn.tempconfig({}):
+            mn.config.media_dir = scratch
+            mn.config.video_dir = os.path.join(scratch, "videos")
+            mn.config.images_dir = os.path.join(scratch, "images")
+            mn.config.partial_movie_dir = os.path.join(scratch, "partial_movie_files")
+            yield scratch
+    finally:
+        if not keep:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+def rendered_movie_path(scene) -> Optional[str]:
+    """Movie written by the last ``scene.render()``, as reported by its file writer"""
+    file_writer = getattr(scene.renderer, "file_writer", None)
+    movie_path = getattr(file_writer, "movie_file_path", None)
+    if movie_path and os.path.exists(movie_path):
+        return str(movie_path)
+    return None
+
+
+def publish_movie(scene, dest_path: str, web: bool = True) -> Optional[str]:
+    """Move the scene's rendered movie to ``dest_path`` and return it.
+
+    With ``web`` the movie is rewritten in the web delivery profile
+    (``ffmpeg_tools.finalize_mp4``); intermediate clips skip that.
+    """
+    movie_path = rendered_movie_path(scene)
+    if movie_path is None:
+        return None
+
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    if web and web_delivery_enabled():
+        try:
+            finalize_mp4(movie_path, dest_path)
+        except Exception as e:
+            print(f"Publishing {dest_path} without the web profile: {e}")
+        else:
+            os.remove(movie_path)
+            return dest_path
+    try:
+        os.replace(movie_path, dest_path)
+    except OSError:
+        shutil.copy2(movie_path, dest_path)
+    return dest_path
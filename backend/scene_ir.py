@@ -0,0 +1,417 @@
+"""
+Versioned JSON instruction IR for generated scenes.
+
+Instead of arbitrary Python, the LLM emits a small program such as::
+
+    {"version": 1, "steps": [
+        {"op": "show_title", "text": "Bubble Sort"},
+        {"op": "create_array", "values": [5, 3, 8, 1]},
+        {"op": "sort_array", "algorithm": "bubble"},
+        {"op": "show_text", "text": "Sorted!", "position": "bottom"}
+    ]}
+
+``validate_program`` checks it against ``OPS`` and simulates the array and
+axes state, so bad indices or missing axes are caught without rendering.
+``compile_program`` expands it into batched plays (a whole comparison or swap
+is one ``play``), and ``build_scene`` interprets those with manim. The same
+normalized program always renders the same video, and no generated Python
+is ever executed.
+"""
+
+import json
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from render_cache import get_render_cache, make_key, source_digest
+
+IR_VERSION = 1
+
+MAX_STEPS = 60
+MAX_ARRAY_SIZE = 12
+MAX_TEXT_LENGTH = 120
+MAX_DURATION_SECONDS = 120.0
+
+_SOURCE_DIGEST = source_digest(__file__)
+_COLOR_RE = re.compile(r"^#[0-9A-Fa-f]{6}$")
+
+# Render settings of IR scenes; part of the cache key
+RENDER_SETTINGS = {"quality": "low_quality", "format": "mp4"}
+
+FUNCTIONS = {
+    "sin": lambda a, f: (lambda x: a * math.sin(f * x)),
+    "cos": lambda a, f: (lambda x: a * math.cos(f * x)),
+    "linear": lambda a, f: (lambda x: a * f * x),
+    "quadratic": lambda a, f: (lambda x: a * (f * x) ** 2),
+    "cubic": lambda a, f: (lambda x: a * (f * x) ** 3),
+    "exp": lambda a, f: (lambda x: a * math.exp(min(f * x, 5))),
+    "abs": lambda a, f: (lambda x: a * abs(f * x)),
+}
+
+# Fields of every op: name -> (type, default). A default of ... means required.
+OPS: Dict[str, Dict[str, tuple]] = {
+    "show_title": {"text": (str, ...)},
+    "show_text": {"text": (str, ...), "position": (str, "center"), "color": (str, "#FFFFFF")},
+    "show_equation": {"latex": (str, ...)},
+    "create_array": {"values": (list, ...)},
+    "highlight": {"indices": (list, ...), "color": (str, "#FF0000")},
+    "swap": {"i": (int, ...), "j": (int, ...)},
+    "sort_array": {"algorithm": (str, "bubble")},
+    "create_axes": {"x_range": (list, [-4, 4]), "y_range": (list, [-3, 3])},
+    "plot_function": {"function": (str, ...), "amplitude": (float, 1.0), "frequency": (float, 1.0),
+                      "color": (str, "#FFFF00")},
+    "wait": {"seconds": (float, 1.0)},
+    "clear": {},
+}
+
+DEFAULT_RUN_TIMES = {
+    "show_title": 1.5, "show_text": 1.0, "show_equation": 1.5, "create_array": 2.0, "highlight": 0.4,
+    "swap": 0.8, "create_axes": 2.0, "plot_function": 3.0, "clear": 0.5,
+}
+
+POSITIONS = ("top", "center", "bottom")
+SORT_ALGORITHMS = ("bubble", "selection", "insertion")
+
+IR_PROMPT = f"""Describe the animation as a JSON program, not Python. Format:
+{{"version": {IR_VERSION}, "steps": [{{"op": ..., ...}}, ...]}}
+Available ops (fields with defaults are optional; every op also accepts "run_time"):
+- show_title: text
+- show_text: text, position ("top" | "center" | "bottom"), color ("#RRGGBB")
+- show_equation: latex
+- create_array: values (list of up to {MAX_ARRAY_SIZE} numbers)
+- highlight: indices (list of array positions), color
+- swap: i, j (array positions)
+- sort_array: algorithm ("bubble" | "selection" | "insertion")
+- create_axes: x_range [min, max], y_range [min, max]
+- plot_function: function ({" | ".join(FUNCTIONS)}), amplitude, frequency, color (needs create_axes first)
+- wait: seconds
+- clear
+Return ONLY the JSON object."""
+
+
+class IRError(ValueError):
+    """Instruction program that does not conform to the IR"""
+
+
+# ---------------------------------------------------------------------------
+# Validation
+# ---------------------------------------------------------------------------
+
+def _coerce(value, kind, where: str):
+    if kind is float and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if kind is int and isinstance(value, float) and value.is_integer():
+        return int(value)
+    if not isinstance(value, kind) or isinstance(value, bool):
+        raise IRError(f"{where} must be {kind.__name__}")
+    return value
+
+
+def _number_pair(value, where: str) -> List[float]:
+    if len(value) != 2 or not all(isinstance(v, (int, float)) for v in value) or value[0] >= value[1]:
+        raise IRError(f"{where} must be [min, max]")
+    return [float(v) for v in value]
+
+
+def validate_program(program: Any) -> Dict[str, Any]:
+    """Return the normalized form of ``program`` or raise ``IRError``.
+
+    Normalizing fills in defaults and drops unknown fields, so equivalent
+    programs compare (and cache) equal.
+    """
+    if isinstance(program, list):
+        program = {"version": IR_VERSION, "steps": program}
+    if not isinstance(program, dict):
+        raise IRError("Program must be a JSON object")
+    if program.get("version", IR_VERSION) != IR_VERSION:
+        raise IRError(f"Unsupported IR version {program.get('version')}")
+    steps = program.get("steps")
+    if not isinstance(steps, list) or not steps:
+        raise IRError("Program needs a non-empty steps list")
+    if len(steps) > MAX_STEPS:
+        raise IRError(f"Program has more than {MAX_STEPS} steps")
+
+    array: Optional[list] = None
+    has_axes = False
+    normalized = []
+    for n, step in enumerate(steps, 1):
+        where = f"step {n}"
+        if not isinstance(step, dict) or step.get("op") not in OPS:
+            raise IRError(f"{where}: unknown op {step.get('op') if isinstance(step, dict) else step!r}")
+        op = step["op"]
+        clean = {"op": op}
+        for field, (kind, default) in OPS[op].items():
+            if field in step:
+                clean[field] = _coerce(step[field], kind, f"{where}.{field}")
+            elif default is ...:
+                raise IRError(f"{where}: {op} needs {field}")
+            else:
+                clean[field] = default
+        if "run_time" in step:
+            run_time = _coerce(step["run_time"], float, f"{where}.run_time")
+            if not 0.1 <= run_time <= 10:
+                raise IRError(f"{where}.run_time must be between 0.1 and 10")
+            clean["run_time"] = run_time
+
+        if "text" in clean and len(clean["text"]) > MAX_TEXT_LENGTH:
+            raise IRError(f"{where}.text is longer than {MAX_TEXT_LENGTH} characters")
+        if "color" in clean and not _COLOR_RE.match(clean["color"]):
+            raise IRError(f"{where}.color must look like #RRGGBB")
+
+        if op == "show_text" and clean["position"] not in POSITIONS:
+            raise IRError(f"{where}.position must be one of {POSITIONS}")
+        elif op == "create_array":
+            values = clean["values"]
+            if not 1 <= len(values) <= MAX_ARRAY_SIZE or not all(
+                    isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+                raise IRError(f"{where}.values must be 1 to {MAX_ARRAY_SIZE} numbers")
+            array = list(values)
+        elif op in ("highlight", "swap", "sort_array"):
+            if array is None:
+                raise IRError(f"{where}: {op} needs create_array first")
+            indices = clean["indices"] if op == "highlight" else [clean["i"], clean["j"]] if op == "swap" else []
+            for index in indices:
+                if not isinstance(index, int) or not 0 <= index < len(array):
+                    raise IRError(f"{where}: index {index} is outside the array")
+            if op == "swap":
+                array[clean["i"]], array[clean["j"]] = array[clean["j"]], array[clean["i"]]
+            elif op == "sort_array":
+                if clean["algorithm"] not in SORT_ALGORITHMS:
+                    raise IRError(f"{where}.algorithm must be one of {SORT_ALGORITHMS}")
+                array.sort()
+        elif op == "create_axes":
+            clean["x_range"] = _number_pair(clean["x_range"], f"{where}.x_range")
+            clean["y_range"] = _number_pair(clean["y_range"], f"{where}.y_range")
+            has_axes = True
+        elif op == "plot_function":
+            if not has_axes:
+                raise IRError(f"{where}: plot_function needs create_axes first")
+            if clean["function"] not in FUNCTIONS:
+                raise IRError(f"{where}.function must be one of {tuple(FUNCTIONS)}")
+        elif op == "wait" and not 0 < clean["seconds"] <= 10:
+            raise IRError(f"{where}.seconds must be between 0 and 10")
+        elif op == "clear":
+            array, has_axes = None, False
+        normalized.append(clean)
+
+    result = {"version": IR_VERSION, "steps": normalized}
+    if program_duration(compile_program(result)) > MAX_DURATION_SECONDS:
+        raise IRError(f"Program runs longer than {MAX_DURATION_SECONDS:.0f} seconds")
+    return result
+
+
+def parse_program(text: str) -> Dict[str, Any]:
+    """Validate an LLM answer that should contain one IR program"""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    try:
+        program = json.loads(text)
+    except ValueError as e:
+        raise IRError(f"Not valid JSON: {e}")
+    return validate_program(program)
+
+
+# ---------------------------------------------------------------------------
+# Compilation
+# ---------------------------------------------------------------------------
+
+def _sort_swaps(values: list, algorithm: str) -> List[tuple]:
+    """(i, j, swapped) comparisons performed by ``algorithm`` on ``values``"""
+    values = list(values)
+    steps = []
+    if algorithm == "bubble":
+        for end in range(len(values) - 1, 0, -1):
+            for i in range(end):
+                swapped = values[i] > values[i + 1]
+                if swapped:
+                    values[i], values[i + 1] = values[i + 1], values[i]
+                steps.append((i, i + 1, swapped))
+    elif algorithm == "selection":
+        for i in range(len(values) - 1):
+            smallest = min(range(i, len(values)), key=values.__getitem__)
+            steps.append((i, smallest, smallest != i))
+            values[i], values[smallest] = values[smallest], values[i]
+    else:
+        for i in range(1, len(values)):
+            j = i
+            while j > 0 and values[j - 1] > values[j]:
+                values[j - 1], values[j] = values[j], values[j - 1]
+                steps.append((j - 1, j, True))
+                j -= 1
+            if j > 0:
+                steps.append((j - 1, j, False))
+    return steps
+
+
+def compile_program(program: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Lower a validated program to plays: ``{"actions": [...], "run_time": s}`` or ``{"wait": s}``.
+
+    Consecutive highlights and waits are merged, and every comparison of a
+    sort becomes one play that animates both bars at once.
+    """
+    plays: List[Dict[str, Any]] = []
+    array: list = []
+
+    def add_play(actions, run_time):
+        plays.append({"actions": actions, "run_time": run_time})
+
+    for step in program["steps"]:
+        op = step["op"]
+        run_time = step.get("run_time", DEFAULT_RUN_TIMES.get(op, 1.0))
+        if op == "wait":
+            if plays and "wait" in plays[-1]:
+                plays[-1]["wait"] += step["seconds"]
+            else:
+                plays.append({"wait": step["seconds"]})
+        elif op == "highlight":
+            action = {"kind": "color", "indices": step["indices"], "color": step["color"]}
+            last = plays[-1] if plays else None
+            if last and "actions" in last and all(a["kind"] == "color" for a in last["actions"]):
+                last["actions"].append(action)
+                last["run_time"] = max(last["run_time"], run_time)
+            else:
+                add_play([action], run_time)
+        elif op == "swap":
+            add_play([{"kind": "swap", "i": step["i"], "j": step["j"]}], run_time)
+            array[step["i"]], array[step["j"]] = array[step["j"]], array[step["i"]]
+        elif op == "sort_array":
+            step_time = step.get("run_time", 0.5)
+            for i, j, swapped in _sort_swaps(array, step["algorithm"]):
+                add_play([{"kind": "color", "indices": [i, j], "color": "#FF0000"}], step_time * 0.4)
+                if swapped:
+                    add_play([{"kind": "swap", "i": i, "j": j}], step_time)
+                    array[i], array[j] = array[j], array[i]
+                add_play([{"kind": "color", "indices": [i, j], "color": "#0066FF"}], step_time * 0.4)
+            add_play([{"kind": "color", "indices": list(range(len(array))), "color": "#00FF00"}], 0.5)
+        else:
+            if op == "create_array":
+                array = list(step["values"])
+            elif op == "clear":
+                array = []
+            add_play([{"kind": op, **{k: v for k, v in step.items() if k not in ("op", "run_time")}}], run_time)
+    return plays
+
+
+def program_duration(plays: List[Dict[str, Any]]) -> float:
+    """Seconds of video a compiled program produces"""
+    return sum(play.get("wait", play.get("run_time", 0.0)) for play in plays)
+
+
+def program_cache_key(program: Dict[str, Any], settings: Dict[str, Any] = RENDER_SETTINGS) -> str:
+    return make_key({"ir": program, "interpreter": _SOURCE_DIGEST, "settings": settings})
+
+
+# ---------------------------------------------------------------------------
+# Interpreter
+# ---------------------------------------------------------------------------
+
+def build_scene(plays: List[Dict[str, Any]]):
+    """manim Scene class that performs the compiled ``plays``"""
+    import manim as mn
+
+    class IRScene(mn.Scene):
+        def construct(self):
+            self.title = None
+            self.bars: list = []
+            self.axes = None
+            for play in plays:
+                if "wait" in play:
+                    self.wait(play["wait"])
+                    continue
+                animations, after = [], []
+                for action in play["actions"]:
+                    animations += self.animate_action(action, after)
+                if animations:
+                    self.play(*animations, run_time=play["run_time"])
+                for update in after:
+                    update()
+
+        def animate_action(self, action, after) -> list:
+            kind = action["kind"]
+            if kind == "show_title":
+                title = mn.Text(action["text"], font_size=32, color="#00FFFF").to_edge(mn.UP)
+                animations = [mn.Write(title)]
+                if self.title is not None:
+                    animations.append(mn.FadeOut(self.title))
+                self.title = title
+                return animations
+            if kind == "show_text":
+                text = mn.Text(action["text"], font_size=24, color=action["color"])
+                if action["position"] == "top":
+                    text.to_edge(mn.UP).shift(mn.DOWN)
+                elif action["position"] == "bottom":
+                    text.to_edge(mn.DOWN)
+                return [mn.Write(text)]
+            if kind == "show_equation":
+                return [mn.Write(mn.MathTex(action["latex"]))]
+            if kind == "create_array":
+                values = action["values"]
+                tallest = max(abs(v) for v in values) or 1
+                width = min(0.8, 10 / len(values))
+                self.bars = []
+                for i, value in enumerate(values):
+                    bar = mn.Rectangle(width=width * 0.85, height=0.2 + 3 * abs(value) / tallest,
+                                       color="#0066FF", fill_opacity=0.8)
+                    label = mn.Text(f"{value:g}", font_size=16).next_to(bar, mn.DOWN, buff=0.1)
+                    self.bars.append(mn.VGroup(bar, label))
+                row = mn.VGroup(*self.bars).arrange(mn.RIGHT, buff=width * 0.15, aligned_edge=mn.DOWN)
+                row.move_to(mn.DOWN * 0.5)
+                return [mn.LaggedStart(*[mn.FadeIn(bar, shift=mn.UP * 0.3) for bar in self.bars], lag_ratio=0.1)]
+            if kind == "color":
+                return [self.bars[i][0].animate.set_color(action["color"]) for i in action["indices"]]
+            if kind == "swap":
+                i, j = action["i"], action["j"]
+                if i == j:
+                    return []
+                dx = self.bars[j].get_x() - self.bars[i].get_x()
+
+                def swap_entries():
+                    self.bars[i], self.bars[j] = self.bars[j], self.bars[i]
+                after.append(swap_entries)
+                return [self.bars[i].animate.shift(mn.RIGHT * dx), self.bars[j].animate.shift(mn.LEFT * dx)]
+            if kind == "create_axes":
+                x_min, x_max = action["x_range"]
+                y_min, y_max = action["y_range"]
+                self.axes = mn.Axes(x_range=[x_min, x_max, 1], y_range=[y_min, y_max, 1], x_length=7, y_length=4)
+                return [mn.Create(self.axes)]
+            if kind == "plot_function":
+                function = FUNCTIONS[action["function"]](action["amplitude"], action["frequency"])
+                return [mn.Create(self.axes.plot(function, color=action["color"]))]
+            if kind == "clear":
+                self.bars, self.axes, self.title = [], None, None
+                return [mn.FadeOut(mob) for mob in self.mobjects]
+            return []
+
+    return IRScene
+
+
+def render_program(program: Dict[str, Any], animation_id: str, output_dir: str = "media",
+                   quality: Optional[str] = None) -> Optional[str]:
+    """Render a validated program into ``output_dir``. Runs in a render worker."""
+    import manim as mn
+    from progress import instrument_scene
+    from render_workspace import job_workspace, publish_movie
+
+    program = validate_program(program)
+    cache = get_render_cache()
+    settings = {**RENDER_SETTINGS, "quality": quality or RENDER_SETTINGS["quality"]}
+    cache_key = program_cache_key(program, settings)
+    final_path = os.path.join(output_dir, f"{animation_id}.mp4")
+    if cache.fetch(cache_key, final_path):
+        return final_path
+
+    plays = compile_program(program)
+    with job_workspace(animation_id):
+        for key, value in settings.items():
+            setattr(mn.config, key, value)
+        scene = instrument_scene(build_scene(plays)(), label=animation_id,
+                                 total_plays=len(plays))
+        scene.render()
+        video_path = publish_movie(scene, final_path)
+
+    if video_path:
+        cache.put(cache_key, video_path)
+    return video_path
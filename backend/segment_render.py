@@ -0,0 +1,448 @@
+"""
+Segment-parallel rendering of a single manim scene.
+
+A long scene (an algorithm walkthrough with hundreds of ``self.play`` calls)
+normally renders every partial movie on one core. Here a recording pass runs
+the scene with animations skipped to learn how many plays it has and how
+long each one is. The plays are then split into contiguous segments of
+similar length and each segment renders in its own pool worker. The
+partial movies are finally joined in their original order with a
+stream-copy concat.
+
+A single long play (a traced sine wave, a slow ``Create``) gains nothing from
+segments, so it is split by frames instead: every slice worker steps the
+animation through all of its frames, keeping updaters such as
+``TracedPath`` exact, but rasterizes only its own frame range and pipes the
+raw frames straight into its own ffmpeg encoder, with the same settings
+manim uses for partial movies. The parent joins the slice movies with a
+stream-copy concat. When any unit fails, the others are cancelled at once.
+
+A worker reaches the mobject state at the start of its range by replaying
+the earlier plays with ``from_animation_number``: skipped plays still run
+``construct`` and apply every animation's final state, but rasterize no
+frames. Scenes are seeded by manim, so every worker sees the same state.
+
+Generators used here provide ``_create_dynamic_scene(prompt)``,
+``_resolve_scene_inputs(prompt, settings)``, ``_job_settings(settings)``,
+``output_dir`` and ``cache`` (the ``TextToAnimationGenerator`` classes).
+``settings`` override the generator's render settings for one video.
+"""
+
+import os
+import shutil
+import threading
+from concurrent.futures import CancelledError, Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from ffmpeg_tools import concat_videos, open_raw_video_encoder
+from progress import emit, instrument_scene
+from render_cache import get_render_cache, make_key
+from render_scheduler import PLAY_SECONDS, plan_seconds, plays_plan
+from render_workspace import job_workspace, publish_movie, scratch_dir
+
+# Fewer plays than this per segment is not worth the replay of earlier plays
+MIN_PLAYS_PER_SEGMENT = int(os.environ.get("EDUARENA_MIN_PLAYS_PER_SEGMENT", 8))
+# Fixed cost of one play (mobject setup, partial movie file) in seconds of video
+PLAY_OVERHEAD_SECONDS = 0.25
+# Plays at least this long (in seconds) are split by frames; 0 disables it
+FRAME_SPLIT_SECONDS = float(os.environ.get("EDUARENA_FRAME_SPLIT_SECONDS", 2.0))
+MIN_FRAMES_PER_SLICE = 15
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+def record_plays(scene_class) -> List[Dict[str, Any]]:
+    """Run ``scene_class`` with every animation skipped and describe each play.
+
+    Returns ``{"run_time", "frames", "static"}`` per play; ``static`` plays
+    are frozen-frame waits that manim writes without rasterizing.
+    """
+    import manim as mn
+    import numpy as np
+
+    plays = []
+    with mn.tempconfig({"write_to_movie": False, "save_last_frame": False, "disable_caching": True}):
+        scene = scene_class(skip_animations=True)
+        play = scene.renderer.play
+
+        def recording_play(current_scene, *args, **kwargs):
+            play(current_scene, *args, **kwargs)
+            run_time = float(current_scene.duration)
+            plays.append({
+                "run_time": run_time,
+                "frames": len(np.arange(0, run_time, 1 / mn.config.frame_rate)),
+                "static": current_scene.is_current_animation_frozen_frame(),
+            })
+
+        scene.renderer.play = recording_play
+        scene.render()
+    return plays
+
+
+def _apply_settings(generator, settings: Optional[Dict[str, Any]] = None):
+    import manim as mn
+
+    for key, value in generator._job_settings(settings).items():
+        setattr(mn.config, key, value)
+
+
+def _stop_after_play(scene, end: int):
+    """End the scene once ``end`` plays have run.
+
+    Used instead of ``upto_animation_number``, for which 0 means "no limit".
+    """
+    from manim.utils.exceptions import EndSceneEarlyException
+
+    renderer = scene.renderer
+    play = renderer.play
+
+    def limited_play(current_scene, *args, **kwargs):
+        if renderer.num_plays >= end:
+            raise EndSceneEarlyException()
+        return play(current_scene, *args, **kwargs)
+
+    renderer.play = limited_play
+
+
+def segment_path(animation_id: str, index: int) -> str:
+    return os.path.join(scratch_dir(animation_id), "segments", f"{index:04d}.mp4")
+
+
+def slice_path(animation_id: str, play: int, index: int) -> str:
+    return os.path.join(scratch_dir(animation_id), "slices", f"{play:04d}_{index:03d}.mp4")
+
+
+def plan_render(target: str, prompt: str, animation_id: str,
+                settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Recording pass. Returns ``{"video": path}`` on a render cache hit,
+    otherwise the cache key, the plays and the output format."""
+    import manim as mn
+    from render_pool import get_instance
+
+    generator = get_instance(target)
+    key = make_key(generator._resolve_scene_inputs(prompt, settings))
+    final_path = os.path.join(generator.output_dir, f"{animation_id}.mp4")
+    if generator.cache.fetch(key, final_path):
+        return {"video": final_path}
+
+    scene_class = generator._create_dynamic_scene(prompt)
+    with job_workspace(f"{animation_id}_plan"):
+        _apply_settings(generator, settings)
+        plays = record_plays(scene_class)
+        return {
+            "key": key,
+            "plays": plays,
+            "width": mn.config.pixel_width,
+            "height": mn.config.pixel_height,
+            "frame_rate": mn.config.frame_rate,
+        }
+
+
+def render_segment(target: str, prompt: str, animation_id: str, index: int,
+                   start: int, end: int, total: int,
+                   settings: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """Render plays ``[start, end)`` of the prompt's scene into one segment movie"""
+    import manim as mn
+    from render_pool import get_instance
+
+    generator = get_instance(target)
+    scene_class = generator._create_dynamic_scene(prompt)
+    with job_workspace(f"{animation_id}_segment_{index}"):
+        _apply_settings(generator, settings)
+        mn.config.from_animation_number = start
+
+        scene = instrument_scene(scene_class(), label=f"segment {index}", total_plays=total)
+        if end < total:
+            _stop_after_play(scene, end)
+        scene.render()
+        # Concatenated into the final video, which gets the web profile
+        return publish_movie(scene, segment_path(animation_id, index), web=False)
+
+
+def render_frames(target: str, prompt: str, animation_id: str, play: int,
+                  index: int, start_frame: int, end_frame: int,
+                  settings: Optional[Dict[str, Any]] = None) -> str:
+    """Rasterize frames ``[start_frame, end_frame)`` of one play and encode
+    them into a slice movie; returns its path"""
+    import manim as mn
+    from render_pool import get_instance
+
+    generator = get_instance(target)
+    scene_class = generator._create_dynamic_scene(prompt)
+    out_path = slice_path(animation_id, play, index)
+
+    with job_workspace(f"{animation_id}_frames_{play}_{index}"):
+        _apply_settings(generator, settings)
+        mn.config.from_animation_number = play
+        # Frames go to the encoder, not to manim's partial movies
+        mn.config.write_to_movie = False
+        mn.config.disable_caching = True
+
+        scene = scene_class()
+        renderer = scene.renderer
+        frame_index = [0]
+
+        def slice_render(current_scene, time, moving_mobjects):
+            if renderer.num_plays != play or renderer.skip_animations:
+                return
+            # The scene was already stepped to this frame; only rasterize our slice
+            if start_frame <= frame_index[0] < end_frame:
+                renderer.update_frame(current_scene, moving_mobjects)
+                encoder.stdin.write(renderer.get_frame().tobytes())
+                if (frame_index[0] - start_frame) % MIN_FRAMES_PER_SLICE == 0:
+                    emit("rendering", label=f"play {play} slice {index}", play_index=play + 1,
+                         frame=frame_index[0] - start_frame, frames=end_frame - start_frame)
+            frame_index[0] += 1
+
+        renderer.render = slice_render
+        _stop_after_play(scene, play + 1)
+        encoder = open_raw_video_encoder(out_path, mn.config.pixel_width, mn.config.pixel_height,
+                                         mn.config.frame_rate)
+        try:
+            scene.render()
+            encoder.stdin.close()
+            if encoder.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed encoding slice {index} of play {play}")
+        except BaseException:
+            encoder.kill()
+            raise
+    return out_path
+
+
+# ---------------------------------------------------------------------------
+# Parent side
+# ---------------------------------------------------------------------------
+
+def plan_segments(durations: List[float], count: int,
+                  min_plays: int = MIN_PLAYS_PER_SEGMENT) -> List[Tuple[int, int]]:
+    """Split plays into at most ``count`` contiguous ``(start, end)`` ranges of similar cost"""
+    total = len(durations)
+    count = max(1, min(count, total // max(min_plays, 1)))
+    if count == 1:
+        return [(0, total)]
+
+    weights = [d + PLAY_OVERHEAD_SECONDS for d in durations]
+    target = sum(weights) / count
+    segments, start, acc = [], 0, 0.0
+    for i, weight in enumerate(weights):
+        acc += weight
+        plays = i + 1 - start
+        remaining_plays = total - (i + 1)
+        remaining_segments = count - len(segments) - 1
+        if (acc >= target and plays >= min_plays and remaining_segments > 0
+                and remaining_plays >= min_plays * remaining_segments):
+            segments.append((start, i + 1))
+            start, acc = i + 1, 0.0
+    segments.append((start, total))
+    return segments
+
+
+def plan_units(plays: List[Dict[str, Any]], count: int) -> List[Tuple]:
+    """Units of parallel work in video order.
+
+    ``("plays", start, end)`` renders a range of plays as one segment;
+    ``("frames", play, frames, slices)`` splits one long play by frames.
+    """
+    durations = [p["run_time"] for p in plays]
+    units = []
+    gap_start = 0
+
+    def add_gap(end):
+        if end > gap_start:
+            units.extend(("plays", gap_start + s, gap_start + e)
+                         for s, e in plan_segments(durations[gap_start:end], count))
+
+    for i, play in enumerate(plays):
+        slices = min(count, play["frames"] // MIN_FRAMES_PER_SLICE)
+        if play["static"] or not FRAME_SPLIT_SECONDS or play["run_time"] < FRAME_SPLIT_SECONDS or slices < 2:
+            continue
+        add_gap(i)
+        units.append(("frames", i, play["frames"], slices))
+        gap_start = i + 1
+    add_gap(len(plays))
+    return units or [("plays", 0, len(plays))]
+
+
+def unit_cost(plan: Dict[str, Any], unit: Tuple) -> float:
+    """Model render time of one unit of ``plan_units``, including the replay
+    of the plays before it"""
+    settings = {"pixel_width": plan["width"], "pixel_height": plan["height"], "frame_rate": plan["frame_rate"]}
+    if unit[0] == "plays":
+        _, start, end = unit
+        return plan_seconds(plays_plan(plan["plays"][start:end], settings)) + start * PLAY_SECONDS
+    _, play, frames, slices = unit
+    slice_plan = plays_plan([{"run_time": plan["plays"][play]["run_time"] / slices}], settings)
+    return plan_seconds(slice_plan) + play * PLAY_SECONDS
+
+
+def _when_all(futures: List[Future], callback):
+    """Call ``callback(futures)`` once every future is done"""
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def on_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        callback(futures)
+
+    for future in futures:
+        future.add_done_callback(on_done)
+
+
+def _render_play_frames(pool, target: str, prompt: str, animation_id: str, index: int,
+                        play: int, frames: int, slices: int, plan: Dict[str, Any],
+                        user: Optional[str] = None, settings: Optional[Dict[str, Any]] = None) -> Future:
+    """Render one play frame-parallel and join its slices into a segment movie"""
+    done = Future()
+    finished = threading.Event()
+    lock = threading.Lock()
+    bounds = [frames * i // slices for i in range(slices + 1)]
+    cost = unit_cost(plan, ("frames", play, frames, slices))
+    slice_futures = [
+        pool.submit(render_frames, target, prompt, animation_id, play, i, bounds[i], bounds[i + 1],
+                    settings, job_id=f"{animation_id}:play:{play}:{i}", progress_id=animation_id,
+                    group=animation_id, cost=cost, user=user or animation_id)
+        for i in range(slices)
+    ]
+
+    def finish(result: Optional[str] = None, error: Optional[BaseException] = None):
+        with lock:
+            if finished.is_set():
+                return
+            finished.set()
+        # Resolved outside the lock: callbacks cancel the other slices, which finish again
+        if error is None:
+            done.set_result(result)
+        else:
+            done.set_exception(error)
+
+    def on_slice(f):
+        # A failed slice fails the play without waiting for the others
+        if f.cancelled():
+            finish(error=CancelledError())
+        elif f.exception() is not None:
+            finish(error=f.exception())
+
+    def join():
+        try:
+            paths = [future.result() for future in slice_futures]
+            # Same encoder settings in every slice, so this is a stream copy
+            video_path = concat_videos(paths, segment_path(animation_id, index), web=False)
+            if video_path is None:
+                raise RuntimeError(f"Play {play} of {animation_id} produced no frames")
+            for path in paths:
+                os.remove(path)
+            finish(video_path)
+        except BaseException as e:
+            finish(error=e)
+
+    def on_slices(_):
+        if not finished.is_set():
+            threading.Thread(target=join, name=f"slice-join-{animation_id}-{play}", daemon=True).start()
+
+    for future in slice_futures:
+        future.add_done_callback(on_slice)
+    _when_all(slice_futures, on_slices)
+    return done
+
+
+def _stream_unit(playlist, index: int, future: Future):
+    if not future.cancelled() and future.exception() is None and future.result():
+        playlist.add(index, future.result())
+
+
+def render_segmented(pool, target: str, prompt: str, animation_id: str,
+                     dest_path: str, segments: Optional[int] = None,
+                     user: Optional[str] = None, settings: Optional[Dict[str, Any]] = None,
+                     playlist=None) -> Future:
+    """Render the prompt's scene across pool workers; returns a future of the video path.
+    Every job is scheduled for ``user`` (default: the animation); ``settings``
+    override the generator's render settings. ``playlist`` (an
+    ``hls_stream.HlsPlaylist``) gets each unit's movie as soon as the units
+    before it are done."""
+    done = Future()
+    failed = threading.Event()
+    lock = threading.Lock()
+    segments = segments or pool.size
+
+    def end_playlist():
+        if playlist is not None:
+            playlist.end()
+
+    def fail(error: BaseException) -> bool:
+        with lock:
+            if failed.is_set() or done.done():
+                return False
+            failed.set()
+        end_playlist()
+        shutil.rmtree(scratch_dir(animation_id), ignore_errors=True)
+        done.set_exception(error)
+        return True
+
+    def on_unit(f):
+        if f.cancelled() or f.exception() is not None:
+            # The video cannot be finished: free the workers still rendering other units
+            if fail(CancelledError() if f.cancelled() else f.exception()):
+                pool.cancel(animation_id)
+
+    def on_plan(f):
+        try:
+            plan = f.result()
+        except BaseException as e:
+            fail(e)
+            return
+        if "video" in plan:
+            end_playlist()
+            done.set_result(plan["video"])
+            return
+
+        plays = plan["plays"]
+        units = plan_units(plays, segments)
+        print(f"Rendering {len(plays)} plays of {animation_id} as {len(units)} parallel units")
+
+        futures = []
+        for index, unit in enumerate(units):
+            if unit[0] == "plays":
+                _, start, end = unit
+                futures.append(pool.submit(
+                    render_segment, target, prompt, animation_id, index, start, end, len(plays), settings,
+                    job_id=f"{animation_id}:segment:{index}", progress_id=animation_id,
+                    group=animation_id, cost=unit_cost(plan, unit), user=user or animation_id))
+            else:
+                _, play, frames, slices = unit
+                futures.append(_render_play_frames(pool, target, prompt, animation_id, index,
+                                                   play, frames, slices, plan, user or animation_id,
+                                                   settings))
+        if playlist is not None:
+            # Registered first, so a unit is streamed before its scratch directory goes
+            for index, future in enumerate(futures):
+                future.add_done_callback(lambda f, index=index: _stream_unit(playlist, index, f))
+        for future in futures:
+            future.add_done_callback(on_unit)
+        _when_all(futures, lambda finished: on_units(plan, finished))
+
+    def on_units(plan, futures):
+        try:
+            paths = [future.result() for future in futures]
+            missing = [index for index, path in enumerate(paths) if path is None]
+            if missing:
+                raise RuntimeError(f"Segments {missing} of {animation_id} produced no video")
+            video_path = concat_videos(paths, dest_path)
+            if video_path:
+                get_render_cache().put(plan["key"], video_path)
+        except BaseException as e:
+            fail(e)
+            return
+        end_playlist()
+        shutil.rmtree(scratch_dir(animation_id), ignore_errors=True)
+        done.set_result(video_path)
+
+    # Every job of the render shares the group, so cancel_render_jobs(animation_id) reaches them
+    pool.submit(plan_render, target, prompt, animation_id, settings, job_id=f"{animation_id}:plan",
+                progress_id=animation_id, group=animation_id,
+                user=user or animation_id).add_done_callback(on_plan)
+    return done
@@ -5,6 +5,9 @@ import os
 import sys
 import subprocess
 import numpy as np
+from render_workspace import job_workspace, publish_movie
+from progress import instrument_scene
+from task_graph import educational_video_graph, educational_video_result
 
 # Setup Manim environment before importing
 try:
@@ -19,32 +22,31 @@ except Exception as e:
 import manim as mn
 
 class EducationalVideoGenerator:
+    # Use animation as final (simplified for now). Renders fall back to a
+    # placeholder video on failure, so they are not memoized across runs.
+    pipeline_options = {"combine": False, "memoize_renders": False}
+    
     def __init__(self):
         self.output_dir = "media"
         os.makedirs(self.output_dir, exist_ok=True)
     
-    def generate_complete_educational_video(self, prompt: str, animation_id: str) -> Dict[str, Any]:
-        """Generate complete educational video with all 3 components"""
-        
-        # Step 1: Generate structured animation instructions
-        instructions = self._generate_animation_instructions(prompt)
-        
-        # Step 2: Create visual animation
-        animation_path = self._create_visual_animation(prompt, f"{animation_id}_animation")
-        
-        # Step 3: Create educational explanation
-        explanation_path = self._create_educational_explanation(instructions, f"{animation_id}_explanation")
-        
-        # Step 4: Use animation as final (simplified for now)
-        final_video_path = animation_path
-        
-        return {
-            "instructions": instructions,
-            "animation_video": animation_path,
-            "explanation_video": explanation_path,
-            "final_video": final_video_path,
-            "status": "completed"
-        }
+    def generate_complete_educational_video(self, prompt: str, animation_id: str, pool=None) -> Dict[str, Any]:
+        """Generate complete educational video with all 3 components.
+
+        Runs the instructions -> {animation, explanation} pipeline; with a
+        render pool the animation and explanation render in parallel.
+        """
+        target = f"{type(self).__module__}:{type(self).__name__}"
+        graph = educational_video_graph(target, prompt, animation_id, **self.pipeline_options, instance=self)
+        return educational_video_result(graph.run(pool))
+    
+    def render_animation(self, prompt: str, instructions: Dict[str, Any], animation_id: str) -> str:
+        """Pipeline step: visual animation"""
+        return self._create_visual_animation(prompt, f"{animation_id}_animation")
+    
+    def render_explanation(self, prompt: str, instructions: Dict[str, Any], animation_id: str) -> str:
+        """Pipeline step: educational explanation video"""
+        return self._create_educational_explanation(instructions, f"{animation_id}_explanation")
     
     def _generate_animation_instructions(self, prompt: str) -> Dict[str, Any]:
         """Generate structured set of animation instructions"""
@@ -542,56 +544,50 @@ class EducationalVideoGenerator:
             # Ensure proper environment setup
             self._setup_render_environment()
             
-            # Configure Manim with Windows-compatible settings
-            mn.config.media_dir = self.output_dir
-            mn.config.video_dir = os.path.join(self.output_dir, "videos")
-            mn.config.images_dir = os.path.join(self.output_dir, "images")
-            mn.config.text_dir = os.path.join(self.output_dir, "texts")
-            
-            # Safe rendering settings
-            mn.config.quality = "low_quality"
-            mn.config.format = "mp4"
-            mn.config.frame_rate = 15
-            mn.config.pixel_height = 480
-            mn.config.pixel_width = 854
-            mn.config.background_color = "#000000"
-            
-            # Disable problematic features
-            mn.config.disable_caching = True
-            mn.config.write_to_movie = True
-            mn.config.save_last_frame = False
-            mn.config.write_all = False
-            mn.config.enable_gui = False
-            mn.config.preview = False
-            mn.config.show_in_file_browser = False
-            
-            # Ensure all directories exist with proper permissions
-            for dir_path in [mn.config.video_dir, mn.config.images_dir, mn.config.text_dir]:
-                os.makedirs(dir_path, exist_ok=True)
-                # Set directory permissions (Windows)
-                try:
-                    os.chmod(dir_path, 0o777)
-                except:
-                    pass
-            
-            print(f"Rendering scene with config: {mn.config.quality}, {mn.config.frame_rate}fps")
-            
-            # Create and render scene with timeout
-            scene = scene_class()
-            
-            # Use subprocess to render with timeout and better error handling
-            import tempfile
-            import pickle
-            
-            # Save scene to temporary file
-            temp_scene_file = os.path.join(tempfile.gettempdir(), f"scene_{video_id}.pkl")
-            with open(temp_scene_file, 'wb') as f:
-                pickle.dump(scene, f)
-            
-            # Render the scene
-            scene.render()
-            
-            print(f"Scene rendered successfully for {video_id}")
+            # Each job renders in its own scratch directory
+            with job_workspace(video_id):
+                # Configure Manim with Windows-compatible settings
+                mn.config.text_dir = os.path.join(self.output_dir, "texts")
+                
+                # Safe rendering settings
+                mn.config.quality = "low_quality"
+                mn.config.format = "mp4"
+                mn.config.frame_rate = 15
+                mn.config.pixel_height = 480
+                mn.config.pixel_width = 854
+                mn.config.background_color = "#000000"
+                
+                # Disable problematic features
+                mn.config.disable_caching = True
+                mn.config.write_to_movie = True
+                mn.config.save_last_frame = False
+                mn.config.write_all = False
+                mn.config.enable_gui = False
+                mn.config.preview = False
+                mn.config.show_in_file_browser = False
+                
+                # Ensure all directories exist with proper permissions
+                for dir_path in [mn.config.video_dir, mn.config.images_dir, mn.config.text_dir]:
+                    os.makedirs(dir_path, exist_ok=True)
+                    # Set directory permissions (Windows)
+                    try:
+                        os.chmod(dir_path, 0o777)
+                    except:
+                        pass
+                
+                print(f"Rendering scene with config: {mn.config.quality}, {mn.config.frame_rate}fps")
+                
+                # Create and render scene with timeout
+                scene = scene_class()
+                
+                # Render the scene, reporting progress from its render loop
+                instrument_scene(scene, label=video_id)
+                scene.render()
+                
+                print(f"Scene rendered successfully for {video_id}")
+                
+                # Take the output straight from the file writer
+                return publish_movie(scene, os.path.join(self.output_dir, f"{video_id}.mp4"))
             
         except FileNotFoundError as e:
             print(f"File not found error: {e}")
@@ -615,22 +611,6 @@ class EducationalVideoGenerator:
             import traceback
             traceback.print_exc()
             return self._create_fallback_video(video_id)
-        
-        # Find and copy video
-        video_files = []
-        for root, dirs, files in os.walk(mn.config.video_dir):
-            for file in files:
-                if file.endswith('.mp4'):
-                    video_files.append(os.path.join(root, file))
-        
-        if video_files:
-            latest_video = max(video_files, key=os.path.getctime)
-            final_path = os.path.join(self.output_dir, f"{video_id}.mp4")
-            import shutil
-            shutil.copy2(latest_video, final_path)
-            return final_path
-        
-        return None
     
     def _setup_render_environment(self):
         """Setup proper rendering environment"""
@@ -686,22 +666,13 @@ class EducationalVideoGenerator:
                     self.add(text)
                     self.wait(2)
             
-            scene = FallbackScene()
-            scene.render()
-            
-            # Find and copy the video
-            video_files = []
-            for root, dirs, files in os.walk(mn.config.video_dir):
-                for file in files:
-                    if file.endswith('.mp4'):
-                        video_files.append(os.path.join(root, file))
-            
-            if video_files:
-                latest_video = max(video_files, key=os.path.getctime)
-                final_path = os.path.join(self.output_dir, f"{video_id}.mp4")
-                import shutil
-                shutil.copy2(latest_video, final_path)
-                return final_path
+            with job_workspace(f"{video_id}_fallback"):
+                scene = FallbackScene()
+                scene.render()
+                
+                final_path = publish_movie(scene, os.path.join(self.output_dir, f"{video_id}.mp4"))
+                if final_path:
+                    return final_path
                 
         except Exception as e:
             print(f"Fallback video creation also failed: {e}")
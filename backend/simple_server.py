@@ -1,13 +1,22 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
 from pydantic import BaseModel
+from video_serving import ArtifactIndex, register_video_routes
+import asyncio
 import uuid
 import os
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from manim_generator import TextToAnimationGenerator
+from concurrent.futures import CancelledError
+from typing import Optional
+from render_pool import (RenderCancelledError, cancel_render_jobs, call_method, get_render_pool,
+                         shutdown_render_pool)
+from render_scheduler import expected_seconds, plan_seconds, prompt_plan
+from admission import AdmissionController, LEVEL_SETTINGS, Overloaded
+from segment_render import render_segmented
+from hls_stream import HLS_DIR, HLS_PREFIX, PROGRESSIVE_HLS, HlsPlaylist
+from render_cache import get_render_cache
+from job_store import get_job_store, request_key
+from progress import ProgressBroker, register_progress_routes
 
 app = FastAPI()
 
@@ -21,89 +30,245 @@ app.add_middleware(
 # Mount static files for serving videos
 app.mount("/media", StaticFiles(directory="media"), name="media")
 
-# Initialize Manim generator
-manim_gen = TextToAnimationGenerator()
-executor = ThreadPoolExecutor(max_workers=2)
+# Manim renders run in a pool of worker processes, one per CPU core
+GENERATOR = "manim_generator:TextToAnimationGenerator"
+
+# Split long scenes into segments rendered by several workers at once.
+# "auto" enables it whenever the pool has more than one worker.
+SEGMENTED_RENDER = os.environ.get("EDUARENA_SEGMENTED_RENDER", "auto")
+
+# Degrades new renders under queue pressure and sheds them past its limits
+admission: Optional[AdmissionController] = None
+
+# Renders running on this process's pool. A cancel made on another API
+# process only changes the job store; it is looked for this often.
+local_renders = set()
+CANCEL_POLL_SECONDS = 0.5
+background_tasks = set()
+
+@app.on_event("startup")
+async def start_render_pool():
+    global admission
+    pool = get_render_pool(preload=["manim_generator"])
+    pool.add_progress_listener(progress.pool_listener)
+    admission = AdmissionController(pool)
+    background_tasks.add(asyncio.create_task(watch_cancellations()))
+
+@app.on_event("shutdown")
+async def stop_render_pool():
+    for task in background_tasks:
+        task.cancel()
+    shutdown_render_pool()
+
+async def watch_cancellations():
+    while True:
+        await asyncio.sleep(CANCEL_POLL_SECONDS)
+        for animation_id in list(local_renders):
+            record = jobs.get(animation_id)
+            if record is not None and (record.get("status") == "cancelled" or record.get("cancel_requested")):
+                cancel_render_jobs(animation_id)
 
 class AnimationRequest(BaseModel):
     prompt: str
+    # Renders are shared fairly between users; defaults to the client address
+    user: Optional[str] = None
 
-# Store animation status
-animation_status = {}
+# Animation status records, shared by every API process
+jobs = get_job_store()
+
+# Render progress pushed to clients: GET /animation-stream/{id} (SSE)
+# or GET /animation-events/{id}?after=<seq> (long-poll)
+progress = ProgressBroker(jobs)
+register_progress_routes(app, jobs, progress)
 
 @app.post("/generate-animation")
-async def generate_animation(request: AnimationRequest):
+async def generate_animation(request: AnimationRequest, http_request: Request):
     animation_id = str(uuid.uuid4())
     
-    # Set initial status
-    animation_status[animation_id] = {
+    # Lower the quality when the queue is long; refuse past its hard limit
+    try:
+        level = admission.admit()
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    user = request.user or (http_request.client.host if http_request.client else None)
+    
+    # Set initial status; an identical prompt already rendering is joined
+    # instead, so its requests share one render, progress stream and result
+    job_id, created = jobs.create_or_join(animation_id, {
         "status": "processing",
         "video_url": None,
-        "prompt": request.prompt
-    }
+        "prompt": request.prompt,
+        "user": user,
+        "degrade": level
+    }, request_key(GENERATOR, request.prompt, level))
+    if not created:
+        # Only a render at the same degradation level is joined
+        return {
+            "id": job_id,
+            "status": "processing",
+            "message": "Joined an identical animation already in progress",
+            "degrade": level,
+            "eta_seconds": animation_eta(job_id, request.prompt, level)
+        }
+    
+    # Queue animation generation on the render pool
+    progress.publish(animation_id, "queued")
+    generate_manim_animation(request.prompt, animation_id, user, level)
     
-    # Start animation generation in background
-    loop = asyncio.get_event_loop()
-    loop.run_in_executor(
-        executor, 
-        generate_manim_animation, 
-        request.prompt, 
-        animation_id
-    )
+    return {
+        "id": animation_id,
+        "status": "processing",
+        "message": "Animation generation started",
+        "degrade": level,
+        "eta_seconds": animation_eta(animation_id, request.prompt, level)
+    }
+
+@app.post("/animation/{animation_id}/rerender")
+async def rerender_animation(animation_id: str):
+    """Render an animation that was degraded under load again at full quality"""
+    record = jobs.get(animation_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Animation not found")
+    if record.get("degrade", "full") == "full":
+        raise HTTPException(status_code=400, detail="Animation was rendered at full quality")
+    try:
+        admission.admit(degrade=False)
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    if not jobs.transition(animation_id, "processing", expected=("completed",),
+                           step="rerendering", rerender_error=None, cancel_requested=None):
+        raise HTTPException(status_code=409, detail=f"Animation is {record['status']}, not completed")
     
+    progress.publish(animation_id, "queued")
+    generate_manim_animation(record["prompt"], animation_id, record.get("user"), "full", rerender=True)
     return {
         "id": animation_id,
         "status": "processing",
-        "message": "Animation generation started"
+        "message": "Full-quality re-render started",
+        "eta_seconds": animation_eta(animation_id, record["prompt"])
     }
 
+@app.delete("/animation/{animation_id}")
+async def cancel_animation(animation_id: str):
+    """Cancel a render: queued jobs are dropped, running ones killed with their workers"""
+    record = jobs.get(animation_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Animation not found")
+    rerender = record.get("step") == "rerendering"
+    if rerender:
+        # The degraded video is still there; the marker tells the process
+        # running the re-render to stop it
+        cancelled = jobs.transition(animation_id, "completed", expected=("processing",), step=None,
+                                    rerender_error="Re-render cancelled", cancel_requested=True)
+    else:
+        cancelled = jobs.transition(animation_id, "cancelled", expected=("processing",))
+    if not cancelled:
+        raise HTTPException(status_code=409, detail=f"Animation is already {record['status']}")
+    cancel_render_jobs(animation_id)
+    
+    if rerender:
+        progress.publish(animation_id, "completed", video_url=videos.url(f"{animation_id}.mp4"))
+        return {"id": animation_id, "status": "completed"}
+    progress.publish(animation_id, "cancelled")
+    return {"id": animation_id, "status": "cancelled"}
+
 @app.get("/animation-status/{animation_id}")
 async def get_animation_status(animation_id: str):
-    if animation_id not in animation_status:
+    record = jobs.get(animation_id)
+    if record is None:
         raise HTTPException(status_code=404, detail="Animation not found")
     
-    return animation_status[animation_id]
+    return record
 
-@app.get("/video/{filename}")
-async def get_video(filename: str):
-    video_path = os.path.join("media", filename)
-    if os.path.exists(video_path):
-        return FileResponse(video_path, media_type="video/mp4")
-    raise HTTPException(status_code=404, detail="Video not found")
+# Videos with byte ranges, ETags and 304s: GET /video/{filename}
+videos = ArtifactIndex("media")
+register_video_routes(app, videos)
 
-def generate_manim_animation(prompt: str, animation_id: str):
-    """Background task to generate Manim animation"""
+# Live playlists of renders in progress, as playlist_url in the status: GET /hls/{id}.m3u8
+register_video_routes(app, ArtifactIndex(HLS_DIR), prefix=HLS_PREFIX)
+
+def segmented_render_enabled(pool) -> bool:
+    return SEGMENTED_RENDER == "1" or (SEGMENTED_RENDER == "auto" and pool.size > 1)
+
+def animation_eta(animation_id: str, prompt: str, level: str = "full") -> Optional[float]:
+    """Predicted seconds until the render of ``animation_id`` finishes"""
+    pool = get_render_pool()
+    if not segmented_render_enabled(pool):
+        eta = pool.eta(animation_id)
+    else:
+        # The recording pass, then the scene spread over the workers
+        eta = pool.eta(f"{animation_id}:plan")
+        if eta is not None:
+            cost = plan_seconds(prompt_plan(GENERATOR, prompt, LEVEL_SETTINGS[level]))
+            eta += expected_seconds(f"{GENERATOR}.generate_animation", cost) / pool.size
+    return None if eta is None else round(eta, 1)
+
+def generate_manim_animation(prompt: str, animation_id: str, user: Optional[str] = None,
+                             level: str = "full", rerender: bool = False):
+    """Submit a render job at degradation ``level`` and record its outcome when it finishes"""
+    pool = get_render_pool()
+    settings = LEVEL_SETTINGS[level]
+    if segmented_render_enabled(pool):
+        # Each unit is playable as HLS once the units before it are done
+        playlist = None
+        if PROGRESSIVE_HLS:
+            playlist = HlsPlaylist(animation_id, listener=lambda stage, **data: progress.publish(animation_id, stage, **data))
+        future = render_segmented(pool, GENERATOR, prompt, animation_id,
+                                  os.path.join("media", f"{animation_id}.mp4"), user=user, settings=settings,
+                                  playlist=playlist)
+    else:
+        future = pool.submit(
+            call_method, GENERATOR, "generate_animation", prompt, animation_id, settings,
+            job_id=animation_id, cost=plan_seconds(prompt_plan(GENERATOR, prompt, settings)), user=user
+        )
+    local_renders.add(animation_id)
+    future.add_done_callback(lambda f: record_animation_result(prompt, animation_id, f, level, rerender))
+
+def record_animation_result(prompt: str, animation_id: str, future, level: str = "full", rerender: bool = False):
+    """Update animation status from a finished render job"""
+    local_renders.discard(animation_id)
     try:
-        video_path = manim_gen.generate_animation(prompt, animation_id)
+        video_path = future.result()
         
         if video_path and os.path.exists(video_path):
-            # Update status with success
-            animation_status[animation_id] = {
-                "status": "completed",
-                "video_url": f"/video/{animation_id}.mp4",
-                "prompt": prompt
-            }
-        else:
-            # Update status with failure
-            animation_status[animation_id] = {
-                "status": "failed",
-                "video_url": None,
-                "prompt": prompt,
-                "error": "Failed to generate video"
-            }
+            # Update status with success; the URL names this version of the video
+            video_url = videos.url(f"{animation_id}.mp4")
+            if jobs.transition(animation_id, "completed", expected=("processing",),
+                               video_url=video_url, degrade=level, step=None):
+                progress.publish(animation_id, "completed", video_url=video_url)
+            return
+        error = "Failed to generate video"
+        status = "failed"
+    except (RenderCancelledError, CancelledError):
+        # Usually already recorded by the cancel request
+        error = "Re-render cancelled" if rerender else None
+        status = "cancelled"
     except Exception as e:
-        # Update status with error
-        animation_status[animation_id] = {
-            "status": "failed",
-            "video_url": None,
-            "prompt": prompt,
-            "error": str(e)
-        }
+        error = str(e)
+        status = "failed"
+    
+    if rerender:
+        # The degraded video is still there
+        if jobs.transition(animation_id, "completed", expected=("processing",),
+                           step=None, rerender_error=error):
+            progress.publish(animation_id, "completed", video_url=videos.url(f"{animation_id}.mp4"))
+    elif jobs.transition(animation_id, status, expected=("processing",),
+                         video_url=None, error=error):
+        # Update status with the failure or cancellation
+        progress.publish(animation_id, status, error=error)
 
 @app.get("/health")
 async def health():
     return {"status": "healthy"}
 
+@app.get("/cache-stats")
+async def cache_stats():
+    return get_render_cache().stats()
+
+@app.get("/admission-stats")
+async def admission_stats():
+    return admission.stats()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8007)
\ No newline at end of file
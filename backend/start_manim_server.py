@@ -4,19 +4,23 @@ Clean Manim-based animation server
 No OpenAI dependencies - pure Manim generation
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
 from pydantic import BaseModel
+from video_serving import ArtifactIndex, register_video_routes
+import asyncio
 import uuid
 import os
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
 import traceback
+from concurrent.futures import CancelledError
+from typing import Optional
 
-# Import our Manim generator
-from simple_educational_generator import EducationalVideoGenerator
+# Manim is imported by the render workers, not by the API process
+from render_pool import RenderCancelledError, cancel_render_jobs, get_render_pool, shutdown_render_pool
+from task_graph import educational_video_graph, educational_video_result
+from job_store import get_job_store, request_key
+from progress import ProgressBroker, register_progress_routes
 
 app = FastAPI(title="EduArena Manim Animation Server")
 
@@ -31,58 +35,107 @@ app.add_middleware(
 os.makedirs("media", exist_ok=True)
 app.mount("/media", StaticFiles(directory="media"), name="media")
 
-# Initialize Educational Video generator
-print("Initializing Educational Video generator...")
-edu_gen = EducationalVideoGenerator()
-executor = ThreadPoolExecutor(max_workers=1)  # Single worker to avoid conflicts
+# Educational videos render in worker processes, one per CPU core
+GENERATOR = "simple_educational_generator:EducationalVideoGenerator"
+
+# Videos rendering on this process's pool. A cancel made on another API
+# process only changes the job store; it is looked for this often.
+local_renders = set()
+CANCEL_POLL_SECONDS = 0.5
+background_tasks = set()
+
+@app.on_event("startup")
+async def start_render_pool():
+    print("Starting render workers...")
+    pool = get_render_pool(preload=["simple_educational_generator"])
+    pool.add_progress_listener(progress.pool_listener)
+    print(f"Render pool started with {pool.size} workers")
+    background_tasks.add(asyncio.create_task(watch_cancellations()))
+
+@app.on_event("shutdown")
+async def stop_render_pool():
+    for task in background_tasks:
+        task.cancel()
+    shutdown_render_pool()
+
+async def watch_cancellations():
+    while True:
+        await asyncio.sleep(CANCEL_POLL_SECONDS)
+        for animation_id in list(local_renders):
+            record = jobs.get(animation_id)
+            if record is not None and record.get("status") == "cancelled":
+                cancel_render_jobs(animation_id)
 
 class AnimationRequest(BaseModel):
     prompt: str
+    # Renders are shared fairly between users; defaults to the client address
+    user: Optional[str] = None
+
+# Animation status records, shared by every API process
+jobs = get_job_store()
 
-# Store animation status
-animation_status = {}
+# Render progress pushed to clients: GET /animation-stream/{id} (SSE)
+# or GET /animation-events/{id}?after=<seq> (long-poll)
+progress = ProgressBroker(jobs)
+register_progress_routes(app, jobs, progress)
 
 @app.post("/generate-animation")
-async def generate_animation(request: AnimationRequest):
+async def generate_animation(request: AnimationRequest, http_request: Request):
     animation_id = str(uuid.uuid4())
     
     print(f"Received animation request: {request.prompt}")
     
-    # Set initial status
-    animation_status[animation_id] = {
+    # Set initial status; an identical prompt already rendering is joined
+    # instead, so its requests share one render, progress stream and result
+    job_id, created = jobs.create_or_join(animation_id, {
         "status": "processing",
         "video_url": None,
         "prompt": request.prompt
-    }
+    }, request_key(GENERATOR, request.prompt))
+    if not created:
+        print(f"Joined animation {job_id} already in progress")
+        return {
+            "id": job_id,
+            "status": "processing",
+            "message": "Joined an identical animation already in progress",
+            "eta_seconds": round(educational_graph(request.prompt, job_id).eta(get_render_pool()), 1)
+        }
     
-    # Start animation generation in background
-    loop = asyncio.get_event_loop()
-    loop.run_in_executor(
-        executor, 
-        generate_educational_video, 
-        request.prompt, 
-        animation_id
-    )
+    # Queue educational video generation on the render pool
+    progress.publish(animation_id, "queued")
+    user = request.user or (http_request.client.host if http_request.client else None)
+    graph = generate_educational_video(request.prompt, animation_id, user)
     
     return {
         "id": animation_id,
         "status": "processing",
-        "message": "Animation generation started"
+        "message": "Animation generation started",
+        "eta_seconds": round(graph.eta(get_render_pool()), 1)
     }
 
+@app.delete("/animation/{animation_id}")
+async def cancel_animation(animation_id: str):
+    """Cancel a video: queued steps are dropped, running ones killed with their workers"""
+    record = jobs.get(animation_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Animation not found")
+    if not jobs.transition(animation_id, "cancelled", expected=("processing",)):
+        raise HTTPException(status_code=409, detail=f"Animation is already {record['status']}")
+    cancel_render_jobs(animation_id)
+    progress.publish(animation_id, "cancelled")
+    return {"id": animation_id, "status": "cancelled"}
+
 @app.get("/animation-status/{animation_id}")
 async def get_animation_status(animation_id: str):
-    if animation_id not in animation_status:
+    record = jobs.get(animation_id)
+    if record is None:
         raise HTTPException(status_code=404, detail="Animation not found")
     
-    return animation_status[animation_id]
+    return record
 
-@app.get("/video/{filename}")
-async def get_video(filename: str):
-    video_path = os.path.join("media", filename)
-    if os.path.exists(video_path):
-        return FileResponse(video_path, media_type="video/mp4")
-    raise HTTPException(status_code=404, detail="Video not found")
+# Videos with byte ranges, ETags and 304s: GET /video/{filename}
+videos = ArtifactIndex("media")
+register_video_routes(app, videos)
 
 @app.post("/fix-status/{animation_id}")
 async def fix_animation_status(animation_id: str):
@@ -107,7 +160,7 @@ async def fix_animation_status(animation_id: str):
         elif explanation_exists:
             main_video = f"/video/{animation_id}_explanation.mp4"
         
-        animation_status[animation_id] = {
+        jobs.put(animation_id, {
             "status": "completed",
             "video_url": main_video,
             "animation_url": f"/video/{animation_id}_animation.mp4" if animation_exists else None,
@@ -121,8 +174,8 @@ async def fix_animation_status(animation_id: str):
                     "Concept visualization"
                 ]
             },
-            "prompt": animation_status.get(animation_id, {}).get("prompt", "Unknown")
-        }
+            "prompt": (jobs.get(animation_id) or {}).get("prompt", "Unknown")
+        })
         
         return {
             "message": "Status fixed",
@@ -135,63 +188,91 @@ async def fix_animation_status(animation_id: str):
     else:
         raise HTTPException(status_code=404, detail="No video files found for this animation ID")
 
-def generate_educational_video(prompt: str, animation_id: str):
-    """Background task to generate complete educational video"""
+def educational_graph(prompt: str, animation_id: str, user: Optional[str] = None):
+    """Pipeline of one educational video; the options match
+    EducationalVideoGenerator.pipeline_options"""
+    return educational_video_graph(GENERATOR, prompt, animation_id, combine=False,
+                                   memoize_renders=False, user=user)
+
+def generate_educational_video(prompt: str, animation_id: str, user: Optional[str] = None):
+    """Start the educational video pipeline and record its outcome when it finishes.
+
+    The animation and explanation steps render in parallel on the pool.
+    Returns the running graph.
+    """
+    print(f"Starting educational video generation for: {prompt}")
+    graph = educational_graph(prompt, animation_id, user)
+    future = graph.start(get_render_pool())
+    local_renders.add(animation_id)
+    future.add_done_callback(lambda f: record_educational_result(prompt, animation_id, f))
+    return graph
+
+def finish_job(animation_id: str, record: dict):
+    """Store a job's final record unless it already finished"""
+    status = record.pop("status")
+    if jobs.transition(animation_id, status, expected=("processing",), **record):
+        progress.publish(animation_id, status, video_url=record.get("video_url"), error=record.get("error"))
+
+def record_educational_result(prompt: str, animation_id: str, future):
+    """Update animation status from a finished educational video job"""
+    local_renders.discard(animation_id)
     try:
-        print(f"Starting educational video generation for: {prompt}")
-        result = edu_gen.generate_complete_educational_video(prompt, animation_id)
+        result = educational_video_result(future.result())
         
         if result and result["status"] == "completed":
             print(f"Educational video generated successfully")
             
-            # Check which files actually exist
-            final_video = f"/video/{animation_id}_final.mp4" if os.path.exists(os.path.join("media", f"{animation_id}_final.mp4")) else None
-            animation_video = f"/video/{animation_id}_animation.mp4" if os.path.exists(os.path.join("media", f"{animation_id}_animation.mp4")) else None
-            explanation_video = f"/video/{animation_id}_explanation.mp4" if os.path.exists(os.path.join("media", f"{animation_id}_explanation.mp4")) else None
+            # Check which files actually exist; URLs name the current version
+            final_video = videos.url(f"{animation_id}_final.mp4")
+            animation_video = videos.url(f"{animation_id}_animation.mp4")
+            explanation_video = videos.url(f"{animation_id}_explanation.mp4")
             
             # Use animation as main video if final doesn't exist
             main_video = final_video or animation_video
             
             # Update status with comprehensive result
-            animation_status[animation_id] = {
+            finish_job(animation_id, {
                 "status": "completed",
                 "video_url": main_video,
                 "animation_url": animation_video,
                 "explanation_url": explanation_video,
                 "instructions": result["instructions"],
                 "prompt": prompt
-            }
+            })
         else:
             print(f"Failed to generate educational video for: {prompt}")
             # Check if at least animation file exists
-            animation_video = f"/video/{animation_id}_animation.mp4" if os.path.exists(os.path.join("media", f"{animation_id}_animation.mp4")) else None
+            animation_video = videos.url(f"{animation_id}_animation.mp4")
             
             if animation_video:
                 # Partial success - at least animation was created
-                animation_status[animation_id] = {
+                finish_job(animation_id, {
                     "status": "completed",
                     "video_url": animation_video,
                     "animation_url": animation_video,
                     "explanation_url": None,
                     "instructions": {"concept": "Animation Generated", "educational_points": ["Visual demonstration created"]},
                     "prompt": prompt
-                }
+                })
             else:
-                animation_status[animation_id] = {
+                finish_job(animation_id, {
                     "status": "failed",
                     "video_url": None,
                     "prompt": prompt,
                     "error": "Failed to generate educational video"
-                }
+                })
+    except (RenderCancelledError, CancelledError):
+        # Usually already recorded by the cancel request
+        finish_job(animation_id, {"status": "cancelled", "prompt": prompt})
     except Exception as e:
         print(f"Error generating educational video: {str(e)}")
         print(traceback.format_exc())
-        animation_status[animation_id] = {
+        finish_job(animation_id, {
             "status": "failed",
             "video_url": None,
             "prompt": prompt,
             "error": str(e)
-        }
+        })
 
 @app.get("/health")
 async def health():
@@ -0,0 +1,287 @@
+"""
+Small task DAG executor for multi-step video pipelines.
+
+A ``TaskGraph`` is a set of named steps, each a method of one generator
+class, whose arguments may refer to the outputs of earlier steps with
+``Ref``. Steps whose inputs are ready run at the same time on the render
+pool, so an educational video takes as long as its longest branch instead of
+the sum of all renders.
+
+Step outputs are memoized: within a run every step executes once, and steps
+that declare a ``key`` are reused across runs. Video outputs are stored in
+the render cache, other outputs in a small in-process table.
+"""
+
+import importlib.util
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from render_cache import get_render_cache, make_key, source_digest
+from render_scheduler import expected_seconds
+
+# Non-file step outputs kept for reuse across runs
+MEMO_SIZE = 256
+
+_memo: "OrderedDict[str, Any]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+class Ref:
+    """Placeholder for the output of another step"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self):
+        return f"Ref({self.name!r})"
+
+
+def _refs(value) -> List[str]:
+    if isinstance(value, Ref):
+        return [value.name]
+    if isinstance(value, (list, tuple)):
+        return [name for item in value for name in _refs(item)]
+    if isinstance(value, dict):
+        return [name for item in value.values() for name in _refs(item)]
+    return []
+
+
+def _resolve_refs(value, results: Dict[str, Any]):
+    if isinstance(value, Ref):
+        return results[value.name]
+    if isinstance(value, (list, tuple)):
+        return type(value)(_resolve_refs(item, results) for item in value)
+    if isinstance(value, dict):
+        return {k: _resolve_refs(item, results) for k, item in value.items()}
+    return value
+
+
+def _module_digest(target: str) -> str:
+    """Source hash of the module behind "module:Class", without importing it"""
+    spec = importlib.util.find_spec(target.partition(":")[0])
+    if spec is None or not spec.origin or not os.path.exists(spec.origin):
+        return ""
+    return source_digest(spec.origin)
+
+
+class TaskNode:
+    def __init__(self, name: str, method: str, args: tuple, key: Optional[Dict[str, Any]], output: Optional[str]):
+        self.name = name
+        self.method = method
+        self.args = args
+        self.key = key
+        self.output = output
+        self.deps = sorted(set(_refs(args) + _refs(key)))
+
+
+class TaskGraph:
+    """DAG of generator steps executed on the render pool or in-process"""
+
+    def __init__(self, target: str, job_id: Optional[str] = None, instance: Any = None,
+                 user: Optional[str] = None):
+        self.target = target
+        self.job_id = job_id
+        self.instance = instance
+        # Pool jobs are scheduled for this user (default: the graph's job id)
+        self.user = user
+        self.nodes: "OrderedDict[str, TaskNode]" = OrderedDict()
+        self._digest = None
+
+    def add(self, name: str, method: str, *args, key: Optional[Dict[str, Any]] = None,
+            output: Optional[str] = None) -> Ref:
+        """Add step ``name`` calling ``method(*args)`` on the generator.
+
+        ``key`` lists the inputs that fully determine the output; steps
+        without one are not reused across runs. ``output`` is the video path
+        the step writes, which lets a memoized result be restored from the
+        render cache. Dependencies must be added first, so the graph is
+        always acyclic.
+        """
+        if name in self.nodes:
+            raise ValueError(f"Duplicate step {name}")
+        node = TaskNode(name, method, args, key, output)
+        missing = [dep for dep in node.deps if dep not in self.nodes]
+        if missing:
+            raise ValueError(f"Step {name} depends on unknown steps {missing}")
+        self.nodes[name] = node
+        return Ref(name)
+
+    def run(self, pool=None) -> Dict[str, Any]:
+        """Run the graph to completion and return every step's output"""
+        return self.start(pool).result()
+
+    def start(self, pool=None) -> Future:
+        """Start the graph and return a future of ``{step name: output}``.
+
+        With a ``RenderPool`` independent steps run concurrently in its
+        workers; without one they run one after another in this process.
+        """
+        done = Future()
+        results: Dict[str, Any] = {}
+        waiting = OrderedDict(self.nodes)
+        lock = threading.Lock()
+
+        def launch_ready():
+            with lock:
+                if done.done():
+                    return
+                ready = [node for node in waiting.values() if all(dep in results for dep in node.deps)]
+                for node in ready:
+                    del waiting[node.name]
+                inputs = dict(results)
+            for node in ready:
+                self._launch(node, inputs, pool, finish)
+
+        def finish(node: TaskNode, value: Any = None, error: Optional[BaseException] = None):
+            with lock:
+                if done.done():
+                    return
+                if error is None:
+                    results[node.name] = value
+                    complete = len(results) == len(self.nodes)
+            if error is not None:
+                done.set_exception(error)
+            elif complete:
+                done.set_result(dict(results))
+            else:
+                launch_ready()
+
+        if not self.nodes:
+            done.set_result({})
+        else:
+            launch_ready()
+        return done
+
+    def eta(self, pool) -> float:
+        """Predicted seconds until every step has finished on ``pool``.
+
+        Queued and running steps use the pool's prediction; steps still
+        waiting for their inputs add their kind's expected render time to
+        the latest finish of their dependencies.
+        """
+        finish: Dict[str, float] = {}
+        for node in self.nodes.values():
+            job_eta = pool.eta(f"{self.job_id}:{node.name}") if self.job_id else None
+            start = max((finish[dep] for dep in node.deps), default=0.0)
+            if job_eta is not None:
+                finish[node.name] = job_eta
+            elif start > 0:
+                finish[node.name] = start + expected_seconds(f"{self.target}.{node.method}")
+            else:
+                # Finished, or restored from the memo without a job
+                finish[node.name] = 0.0
+        return max(finish.values(), default=0.0)
+
+    def _memo_key(self, node: TaskNode, results: Dict[str, Any]) -> Optional[str]:
+        if node.key is None:
+            return None
+        if self._digest is None:
+            self._digest = _module_digest(self.target)
+        return make_key({
+            "target": self.target,
+            "source": self._digest,
+            "step": node.method,
+            "inputs": _resolve_refs(node.key, results),
+        })
+
+    def _launch(self, node: TaskNode, results: Dict[str, Any], pool, finish):
+        key = self._memo_key(node, results)
+        if key is not None:
+            if node.output is not None:
+                if get_render_cache().fetch(key, node.output):
+                    finish(node, node.output)
+                    return
+            else:
+                with _memo_lock:
+                    hit = key in _memo
+                    if hit:
+                        _memo.move_to_end(key)
+                        value = _memo[key]
+                if hit:
+                    finish(node, value)
+                    return
+
+        def remember(value):
+            if key is None:
+                return
+            if node.output is not None:
+                if isinstance(value, str) and os.path.exists(value):
+                    get_render_cache().put(key, value)
+            else:
+                with _memo_lock:
+                    _memo[key] = value
+                    while len(_memo) > MEMO_SIZE:
+                        _memo.popitem(last=False)
+
+        args = _resolve_refs(node.args, results)
+        if pool is None:
+            try:
+                instance = self.instance
+                if instance is None:
+                    from render_pool import call_method
+                    value = call_method(self.target, node.method, *args)
+                else:
+                    value = getattr(instance, node.method)(*args)
+            except Exception as e:
+                finish(node, error=e)
+                return
+            remember(value)
+            finish(node, value)
+            return
+
+        from render_pool import call_method
+        job_id = f"{self.job_id}:{node.name}" if self.job_id else None
+        future = pool.submit(call_method, self.target, node.method, *args, job_id=job_id,
+                             progress_id=self.job_id, group=self.job_id, user=self.user or self.job_id)
+
+        def on_done(f):
+            try:
+                value = f.result()
+            except BaseException as e:
+                finish(node, error=e)
+                return
+            remember(value)
+            finish(node, value)
+
+        future.add_done_callback(on_done)
+
+
+def educational_video_graph(target: str, prompt: str, animation_id: str,
+                            combine: bool = True, memoize_renders: bool = True,
+                            instance: Any = None, output_dir: str = "media",
+                            user: Optional[str] = None) -> TaskGraph:
+    """Pipeline of an educational video: instructions -> {animation, explanation} -> combine.
+
+    ``target`` is the generator class ("module:Class"). It must provide
+    ``_generate_animation_instructions``, ``render_animation``,
+    ``render_explanation`` and, when ``combine`` is set, ``combine_videos``.
+    Generators that substitute a placeholder video on failure should pass
+    ``memoize_renders=False`` so the placeholder is not reused.
+    """
+    graph = TaskGraph(target, job_id=animation_id, instance=instance, user=user)
+    render_key = None
+    instructions = graph.add("instructions", "_generate_animation_instructions", prompt,
+                             key={"prompt": prompt})
+    if memoize_renders:
+        render_key = {"prompt": prompt, "instructions": instructions}
+    animation = graph.add("animation", "render_animation", prompt, instructions, animation_id,
+                          key=render_key, output=os.path.join(output_dir, f"{animation_id}_animation.mp4"))
+    explanation = graph.add("explanation", "render_explanation", prompt, instructions, animation_id,
+                            key=render_key, output=os.path.join(output_dir, f"{animation_id}_explanation.mp4"))
+    if combine:
+        graph.add("final", "combine_videos", animation, explanation, animation_id)
+    return graph
+
+
+def educational_video_result(results: Dict[str, Any]) -> Dict[str, Any]:
+    """Result record of a finished ``educational_video_graph``"""
+    return {
+        "instructions": results["instructions"],
+        "animation_video": results["animation"],
+        "explanation_video": results["explanation"],
+        "final_video": results.get("final", results["animation"]),
+        "status": "completed",
+    }
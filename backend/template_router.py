@@ -0,0 +1,190 @@
+"""
+Template router for the LangGraph workflow.
+
+Many prompts ("bubble sort", "bernoulli", "matrix exponentiation", "sine")
+already have hand-written scenes. ``match_template`` checks a prompt against
+the registry below, and ``render_template`` renders the match in a render
+pool worker, so those prompts skip both LLM calls and the render of untested
+generated code. Hit-rate counters are kept per API process.
+
+The registry is checked in order, so the scene classes come before the
+branches of ``manim_generator_clean``. Only generator branches with a
+hand-written scene for the concept are routed (a bubble sort, sine and
+cosine plots, a pendulum, a binary search); its generic fallbacks for
+words like "graph" or "tree" are left to the LLM. Keywords match whole
+words, so "photograph" or "street" match nothing.
+"""
+
+import ast
+import functools
+import importlib
+import importlib.util
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from render_cache import get_render_cache, make_key, source_digest
+
+GENERATOR_TARGET = "manim_generator_clean:TextToAnimationGenerator"
+
+# Hand-written scene classes rendered as they are
+SCENE_TEMPLATES = [
+    {"name": "bernoulli", "keywords": ["bernoulli"], "target": "bernoulli_fixed:BernoulliScene"},
+    {"name": "matrix_power", "keywords": ["matrix exponentiation", "matrix exponent", "matrix power"],
+     "target": "matrix_fixed:MatrixPowerScene"},
+]
+
+# Branches of the generator that draw a hand-written scene for the concept,
+# by branch name. A prompt is only routed to a branch the generator would
+# pick for it too.
+GENERATOR_TEMPLATES = [
+    {"name": "sorting", "keywords": ["bubble sort", "sort", "sorting"]},
+    {"name": "math", "keywords": ["sine", "cosine"]},
+    {"name": "physics", "keywords": ["pendulum"]},
+    {"name": "algorithm", "keywords": ["binary search"]},
+]
+
+# Quality of scene template renders; part of their cache key
+RENDER_SETTINGS = {"quality": "low_quality", "format": "mp4"}
+
+_registry: Optional[List[Dict[str, Any]]] = None
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "misses": 0, "hits": {}}
+
+
+def _module_path(target: str) -> Optional[str]:
+    spec = importlib.util.find_spec(target.partition(":")[0])
+    if spec is None or not spec.origin or not os.path.exists(spec.origin):
+        return None
+    return spec.origin
+
+
+def generator_keywords(target: str) -> Dict[str, List[str]]:
+    """``TEMPLATE_KEYWORDS`` of a generator module, read without importing manim.
+
+    The source is parsed once per modification time of the file.
+    """
+    path = _module_path(target)
+    if path is None:
+        return {}
+    return _read_keywords(path, os.path.getmtime(path))
+
+
+@functools.lru_cache(maxsize=16)
+def _read_keywords(path: str, mtime: float) -> Dict[str, List[str]]:
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+                isinstance(t, ast.Name) and t.id == "TEMPLATE_KEYWORDS" for t in node.targets):
+            return ast.literal_eval(node.value)
+    return {}
+
+
+def generator_branch(target: str, prompt: str) -> str:
+    """Branch a generator takes for ``prompt``: the first whose keywords are
+    substrings of it, as the generator itself checks, else ``general``"""
+    prompt_lower = prompt.lower()
+    return next(
+        (name for name, words in generator_keywords(target).items() if any(w in prompt_lower for w in words)),
+        "general"
+    )
+
+
+def _keyword_pattern(keywords: List[str]) -> "re.Pattern":
+    """Any of ``keywords`` as whole words; plurals and any whitespace between words also match"""
+    words = [r"\s+".join(re.escape(w) for w in keyword.split()) for keyword in keywords]
+    return re.compile(r"\b(?:" + "|".join(words) + r")s?\b", re.IGNORECASE)
+
+
+def registry() -> List[Dict[str, Any]]:
+    """Templates in match order"""
+    global _registry
+    if _registry is None:
+        templates = [{**t, "kind": "scene"} for t in SCENE_TEMPLATES]
+        branches = generator_keywords(GENERATOR_TARGET)
+        templates += [{**t, "target": GENERATOR_TARGET, "kind": "generator"}
+                      for t in GENERATOR_TEMPLATES if t["name"] in branches]
+        for template in templates:
+            template["pattern"] = _keyword_pattern(template["keywords"])
+        _registry = templates
+    return _registry
+
+
+def get_template(name: str) -> Dict[str, Any]:
+    return next(t for t in registry() if t["name"] == name)
+
+
+def match_template(prompt: str) -> Optional[Dict[str, Any]]:
+    """First template with a keyword in ``prompt``, counted in the hit-rate stats"""
+    template = next(
+        (t for t in registry() if t["pattern"].search(prompt) and (
+            t["kind"] == "scene" or generator_branch(t["target"], prompt) == t["name"])),
+        None
+    )
+    with _stats_lock:
+        _stats["requests"] += 1
+        if template is None:
+            _stats["misses"] += 1
+        else:
+            _stats["hits"][template["name"]] = _stats["hits"].get(template["name"], 0) + 1
+    return template
+
+
+def router_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        hits = sum(_stats["hits"].values())
+        return {
+            "requests": _stats["requests"],
+            "hits": hits,
+            "misses": _stats["misses"],
+            "hit_rate": hits / _stats["requests"] if _stats["requests"] else 0.0,
+            "by_template": dict(_stats["hits"]),
+        }
+
+
+def scene_cache_key(template: Dict[str, Any]) -> str:
+    """Render cache key of a scene template: its source and the render settings"""
+    return make_key({
+        "template": template["target"],
+        "source": source_digest(_module_path(template["target"])),
+        "settings": RENDER_SETTINGS,
+    })
+
+
+def cached_template_video(template: Dict[str, Any], dest_path: str) -> bool:
+    """Place a cached render of a scene template at ``dest_path``. Generator
+    templates depend on the prompt and are looked up by the generator itself."""
+    if template["kind"] != "scene":
+        return False
+    return get_render_cache().fetch(scene_cache_key(template), dest_path)
+
+
+def render_template(template: Dict[str, Any], prompt: str, animation_id: str,
+                    output_dir: str = "media") -> Optional[str]:
+    """Render ``template`` for ``prompt`` into ``output_dir``. Runs in a render worker."""
+    if template["kind"] == "generator":
+        from render_pool import call_method
+        return call_method(template["target"], "generate_animation", prompt, animation_id)
+
+    import manim as mn
+    from progress import instrument_scene
+    from render_workspace import job_workspace, publish_movie
+
+    final_path = os.path.join(output_dir, f"{animation_id}.mp4")
+    if cached_template_video(template, final_path):
+        return final_path
+
+    with job_workspace(animation_id):
+        for key, value in RENDER_SETTINGS.items():
+            setattr(mn.config, key, value)
+        module_name, _, class_name = template["target"].partition(":")
+        scene_class = getattr(importlib.import_module(module_name), class_name)
+        scene = instrument_scene(scene_class(), label=template["name"])
+        scene.render()
+        video_path = publish_movie(scene, final_path)
+
+    if video_path:
+        get_render_cache().put(scene_cache_key(template), video_path)
+    return video_path
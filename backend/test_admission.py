@@ -0,0 +1,73 @@
+import pytest
+
+from admission import AdmissionController, Overloaded
+
+
+class FakePool:
+    def __init__(self, size=2):
+        self.size = size
+        self.wait_seconds = 0.0
+        self.queued = 0
+
+    def load(self):
+        return {"wait_seconds": self.wait_seconds, "queued": self.queued}
+
+
+@pytest.fixture
+def pool():
+    return FakePool()
+
+
+@pytest.fixture
+def admission(pool):
+    return AdmissionController(pool, degrade_wait=60, shed_wait=600, degrade_queue=4, shed_queue=25)
+
+
+@pytest.mark.parametrize("wait, queued, level", [
+    (0, 0, "full"),
+    (59, 7, "full"),
+    (60, 0, "reduced"),
+    (0, 8, "reduced"),
+    (119, 0, "reduced"),
+    (120, 0, "preview"),
+    (0, 16, "preview"),
+    (599, 49, "preview"),
+])
+def test_level_follows_the_larger_pressure(pool, admission, wait, queued, level):
+    pool.wait_seconds, pool.queued = wait, queued
+    assert admission.admit() == level
+
+
+@pytest.mark.parametrize("wait, queued", [(600, 0), (0, 50)])
+def test_sheds_past_the_hard_limits(pool, admission, wait, queued):
+    pool.wait_seconds, pool.queued = wait, queued
+    with pytest.raises(Overloaded) as info:
+        admission.admit()
+    assert info.value.retry_after >= 1
+
+
+def test_retry_after_tracks_the_backlog(pool, admission):
+    pool.wait_seconds = 900
+    with pytest.raises(Overloaded) as info:
+        admission.admit()
+    assert info.value.retry_after == 600
+
+
+def test_full_quality_only_refuses_to_degrade(pool, admission):
+    assert admission.admit(degrade=False) == "full"
+    pool.wait_seconds = 90
+    with pytest.raises(Overloaded) as info:
+        admission.admit(degrade=False)
+    assert info.value.retry_after == 30
+
+
+def test_stats_count_each_outcome(pool, admission):
+    admission.admit()
+    pool.queued = 8
+    admission.admit()
+    pool.queued = 50
+    with pytest.raises(Overloaded):
+        admission.admit()
+    stats = admission.stats()
+    assert stats["queued"] == 50
+    assert stats["admitted"] == {"full": 1, "reduced": 1, "preview": 0, "rejected": 1}
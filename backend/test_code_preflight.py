@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+import code_preflight
+from code_preflight import PreflightError, SceneCodeError, failure_signature, record_failure, validate_code
+
+GOOD = """from manim import *
+
+class Demo(Scene):
+    def construct(self):
+        circle = Circle()
+        self.play(Create(circle))
+"""
+
+
+@pytest.fixture(autouse=True)
+def fake_manim_api(monkeypatch):
+    # The installed manim is listed in a subprocess; tests use a small fixed API
+    monkeypatch.setattr(code_preflight, "_api", {"names": {"Scene", "Circle", "Create", "Text", "Write"},
+                                                 "scenes": {"Scene"}})
+    code_preflight._failures.clear()
+    yield
+    code_preflight._failures.clear()
+
+
+def test_accepts_a_valid_program():
+    validate_code(GOOD)
+
+
+@pytest.mark.parametrize("code, signature", [
+    ("class Demo(Scene)\n    pass\n", ("SyntaxError", "class Demo(Scene)")),
+    ("import os\n" + GOOD, ("ImportError", "os")),
+    (GOOD + "        open('x')\n", ("ForbiddenCall", "open")),
+    (GOOD + "        self.__class__\n", ("ForbiddenCall", "__class__")),
+    ("from manim import ShowCreation\n" + GOOD, ("NameError", "ShowCreation")),
+    (GOOD.replace("Create(circle)", "ShowCreation(circle)"), ("NameError", "ShowCreation")),
+    ("from manim import *\nx = 1\n", ("SceneError", "0 scenes")),
+    (GOOD + "\nclass Other(Scene):\n    def construct(self):\n        pass\n", ("SceneError", "2 scenes")),
+    (GOOD.replace("def construct", "def build"), ("SceneError", "no construct")),
+])
+def test_rejects_broken_programs(code, signature):
+    with pytest.raises(PreflightError) as info:
+        validate_code(code)
+    assert info.value.signature == signature
+
+
+def test_rejected_programs_are_remembered():
+    code = "import os\n" + GOOD
+    with pytest.raises(PreflightError):
+        validate_code(code)
+    hits = code_preflight.preflight_stats()["cache_hits"]
+    with pytest.raises(PreflightError):
+        validate_code(code)
+    assert code_preflight.preflight_stats()["cache_hits"] == hits + 1
+
+
+def test_recorded_render_failures_are_rejected():
+    error = 'Traceback:\n  File "<generated abc>", line 6, in construct\nTypeError: bad argument'
+    signature = failure_signature(error, GOOD)
+    assert signature == ("TypeError", "self.play(Create(circle))")
+    record_failure(GOOD, error, signature)
+    with pytest.raises(PreflightError, match="bad argument") as info:
+        validate_code(GOOD)
+    assert info.value.signature == signature
+
+
+@pytest.mark.parametrize("error, recorded", [
+    (SceneCodeError("TypeError: bad argument"), True),
+    (RuntimeError("Render exceeded its wall-time limit"), False),
+    (RuntimeError("Render process died (SIGKILL)"), False),
+])
+def test_only_code_errors_are_recorded_after_a_render(monkeypatch, error, recorded):
+    import langgraph_workflow
+
+    async def failing_render(code, quality):
+        raise error
+
+    monkeypatch.setattr(langgraph_workflow, "render_code", failing_render)
+    clip = asyncio.run(langgraph_workflow.check_and_render({"index": 0}, GOOD))
+    assert clip["status"] == "failed" and clip["failed_at"] == "render"
+    if recorded:
+        with pytest.raises(PreflightError):
+            validate_code(GOOD)
+    else:
+        validate_code(GOOD)
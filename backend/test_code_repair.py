@@ -0,0 +1,62 @@
+import pytest
+
+import code_preflight
+import code_repair
+from code_repair import learn, repair_locally
+
+
+@pytest.fixture(autouse=True)
+def fake_manim_api(monkeypatch):
+    monkeypatch.setattr(code_preflight, "_api", {"names": {"Scene", "Circle", "Create", "Text", "Square"},
+                                                 "scenes": {"Scene"}})
+    code_repair._learned.clear()
+    yield
+    code_repair._learned.clear()
+
+
+def test_renames_legacy_names_outside_strings():
+    code = 'from manim import *\nx = TextMobject("TextMobject")\nself.play(ShowCreation(x))\n'
+    repaired, kind = repair_locally(code, ("NameError", "self.play(ShowCreation(x))"))
+    assert kind == "local"
+    assert repaired == 'from manim import *\nx = Text("TextMobject")\nself.play(Create(x))\n'
+
+
+def test_rewrites_manimlib_imports():
+    repaired, _ = repair_locally("from manimlib.imports import *\nimport manimlib\n", ("ImportError", "manimlib"))
+    assert repaired == "from manim import *\nfrom manim import *\n"
+
+
+def test_adds_a_missing_manim_import_for_name_errors():
+    code = "class Demo(Scene):\n    pass\n"
+    repaired, _ = repair_locally(code, ("NameError", "Scene"))
+    assert repaired.startswith("from manim import *\n")
+    assert repair_locally(code, ("TypeError", "")) is None
+
+
+def test_unknown_failures_are_not_repaired():
+    code = "from manim import *\nx = Circle(radius='big')\n"
+    assert repair_locally(code, ("TypeError", "x = Circle(radius='big')")) is None
+
+
+def test_learns_a_line_rewrite_from_a_model_repair():
+    signature = ("TypeError", "x = Circle(radius='big')")
+    failed = "from manim import *\n    x = Circle(radius='big')\n"
+    learn(signature, failed, "from manim import *\n    x = Circle(radius=2)\n")
+
+    repaired, kind = repair_locally("a = 1\n        x = Circle(radius='big')\n", signature)
+    assert kind == "learned"
+    assert repaired == "a = 1\n        x = Circle(radius=2)\n"
+
+
+def test_learns_a_renamed_name_from_a_model_repair():
+    signature = ("NameError", "Sqaure")
+    learn(signature, "s = Sqaure(side_length=2)\n", "s = Square(side_length=2)\n")
+    repaired, kind = repair_locally("t = Sqaure()\nu = Sqaure()\n", signature)
+    assert kind == "learned"
+    assert repaired == "t = Square()\nu = Square()\n"
+
+
+def test_unrelated_model_edits_are_not_learned():
+    signature = ("TypeError", "x = Circle(radius='big')")
+    learn(signature, "x = Circle(radius='big')\ny = 1\n", "x = Circle(radius='big')\ny = 2\n")
+    assert code_repair.repair_stats()["learned_signatures"] == 0
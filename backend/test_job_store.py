@@ -0,0 +1,104 @@
+import time
+
+import pytest
+
+from job_store import MemoryJobStore, SQLiteJobStore, request_key
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryJobStore()
+    return SQLiteJobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_request_key_ignores_whitespace_but_not_case():
+    assert request_key("g:G", "sort  5 3\n1") == request_key("g:G", " sort 5 3 1 ")
+    assert request_key("g:G", "Sort") != request_key("g:G", "sort")
+    assert request_key("g:G", "sort") != request_key("h:H", "sort")
+
+
+def test_request_key_separates_variants():
+    assert request_key("g:G", "sort", "full") != request_key("g:G", "sort", "preview")
+    assert request_key("g:G", "sort", "full") == request_key("g:G", " sort ", "full")
+
+
+def test_identical_requests_join_the_running_job(store):
+    key = request_key("g:G", "bubble sort")
+    assert store.create_or_join("a", {"status": "processing"}, key) == ("a", True)
+    assert store.create_or_join("b", {"status": "processing"}, key) == ("a", False)
+    assert store.get("b") is None
+
+
+def test_finished_job_releases_its_key(store):
+    key = request_key("g:G", "bubble sort")
+    store.create_or_join("a", {"status": "processing"}, key)
+    assert store.transition("a", "completed", expected=("processing",))
+    assert store.create_or_join("b", {"status": "processing"}, key) == ("b", True)
+
+
+def test_old_jobs_are_not_joined(store):
+    key = request_key("g:G", "bubble sort")
+    store.create_or_join("a", {"status": "processing"}, key)
+    assert store.create_or_join("b", {"status": "processing"}, key, max_age=0) == ("b", True)
+
+
+def test_create_rejects_existing_id(store):
+    store.create("a", {"status": "processing"})
+    with pytest.raises(KeyError):
+        store.create("a", {"status": "processing"})
+
+
+def test_transition_checks_the_expected_status(store):
+    store.create("a", {"status": "processing"})
+    assert not store.transition("a", "completed", expected=("queued",))
+    assert store.transition("a", "completed", expected=("processing",), video_url="/video/a.mp4")
+    assert store.get("a") == {"status": "completed", "video_url": "/video/a.mp4"}
+
+
+def test_transition_without_expected_never_leaves_a_finished_status(store):
+    store.create("a", {"status": "processing"})
+    assert store.transition("a", "cancelled")
+    assert not store.transition("a", "failed")
+    assert store.get("a")["status"] == "cancelled"
+    assert not store.transition("missing", "failed")
+
+
+def test_update_merges_fields(store):
+    store.create("a", {"status": "processing", "prompt": "p"})
+    assert store.update("a", step="rendering")["prompt"] == "p"
+    assert store.update("missing", step="x") is None
+
+
+def test_finished_jobs_expire_after_the_ttl(store):
+    store.ttl_seconds = 0.05
+    store.create("done", {"status": "processing"})
+    store.create("running", {"status": "processing"})
+    store.transition("done", "completed")
+    time.sleep(0.1)
+    assert store.get("done") is None
+    assert store.get("running") is not None
+
+
+def test_list_by_status(store):
+    store.create("a", {"status": "processing"})
+    store.create("b", {"status": "processing"})
+    store.transition("b", "failed")
+    assert [r["status"] for r in store.list_by_status("processing")] == ["processing"]
+    assert len(store.list_by_status("failed")) == 1
+
+
+def test_get_many_skips_missing_and_expired_jobs(store, monkeypatch):
+    monkeypatch.setattr("job_store.GET_MANY_CHUNK", 2)
+    store.ttl_seconds = 0.05
+    for job_id in "abc":
+        store.create(job_id, {"status": "processing", "id": job_id})
+    store.transition("c", "cancelled")
+    assert store.get_many(["a", "b", "c", "missing"]) == {
+        "a": {"status": "processing", "id": "a"},
+        "b": {"status": "processing", "id": "b"},
+        "c": {"status": "cancelled", "id": "c"},
+    }
+    time.sleep(0.1)
+    assert set(store.get_many(["a", "b", "c"])) == {"a", "b"}
+    assert store.get_many([]) == {}
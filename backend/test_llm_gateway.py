@@ -0,0 +1,48 @@
+import pytest
+
+import llm_gateway
+from llm_gateway import ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_gateway.time, "time", lambda: now[0])
+    return now
+
+
+def test_cache_round_trip(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "llm.sqlite3"))
+    assert cache.get("k") is None
+    cache.put("k", "model", "answer")
+    assert cache.get("k") == "answer"
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "llm.sqlite3"), max_bytes=25)
+    for key in "abc":
+        clock[0] += 1
+        cache.put(key, "model", "x" * 10)
+    # Two entries fit: "a" went first when "c" arrived
+    assert cache.get("a") is None
+
+    clock[0] += 1
+    assert cache.get("b") is not None
+    clock[0] += 1
+    cache.put("d", "model", "x" * 10)
+    assert cache.get("c") is None
+    assert cache.get("b") is not None and cache.get("d") is not None
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "llm.sqlite3"), ttl_seconds=60)
+    cache.put("old", "model", "answer")
+    clock[0] += 30
+    assert cache.get("old") == "answer"
+    clock[0] += 31
+    assert cache.get("old") is None
+
+    # Expired entries are removed by the next write
+    cache.put("new", "model", "answer")
+    with cache._db() as db:
+        assert [row[0] for row in db.execute("SELECT key FROM responses")] == ["new"]
@@ -0,0 +1,72 @@
+import itertools
+import os
+
+import pytest
+
+import render_cache
+from render_cache import RenderCache, make_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Distinct access times, so the LRU order never depends on timer resolution
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(render_cache.time, "time", lambda: float(next(ticks)))
+
+
+def video(tmp_path, name, size=10):
+    path = tmp_path / f"{name}.mp4"
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def test_keys_ignore_input_order():
+    assert make_key({"a": 1, "b": [1, 2]}) == make_key({"b": [1, 2], "a": 1})
+    assert make_key({"a": 1}) != make_key({"a": 2})
+
+
+def test_fetch_links_a_hit_into_place(tmp_path):
+    cache = RenderCache(str(tmp_path / "cache"), max_bytes=100)
+    cache.put("k", video(tmp_path, "src"))
+    dest = str(tmp_path / "out" / "job.mp4")
+    assert cache.fetch("k", dest)
+    assert open(dest, "rb").read() == b"x" * 10
+    assert not cache.fetch("missing", str(tmp_path / "other.mp4"))
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = RenderCache(str(tmp_path / "cache"), max_bytes=25)
+    cache.put("a", video(tmp_path, "a"))
+    cache.put("b", video(tmp_path, "b"))
+    assert cache.get("a") is not None
+    cache.put("c", video(tmp_path, "c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["entries"] == 2 and stats["bytes"] == 20
+
+
+def test_file_removed_behind_the_index_is_a_miss(tmp_path):
+    cache = RenderCache(str(tmp_path / "cache"), max_bytes=100)
+    os.remove(cache.put("k", video(tmp_path, "src")))
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_entry_evicted_between_lookup_and_link_is_a_miss(tmp_path, monkeypatch):
+    cache = RenderCache(str(tmp_path / "cache"), max_bytes=100)
+    cache.put("k", video(tmp_path, "src"))
+    lookup = cache.get
+
+    def get_then_evict(key):
+        path = lookup(key)
+        # Another worker evicts the entry right after this one looked it up
+        os.remove(path)
+        return path
+
+    monkeypatch.setattr(cache, "get", get_then_evict)
+    dest = str(tmp_path / "job.mp4")
+    assert not cache.fetch("k", dest)
+    assert not os.path.exists(dest)
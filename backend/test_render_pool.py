@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+from render_pool import RenderCancelledError, RenderJobError, RenderPool, RenderTimeoutError
+
+
+def spin_with_fallback(seconds: float) -> str:
+    """CPU-bound job that, like the generators, turns any error into a fallback result"""
+    try:
+        end = time.process_time() + seconds
+        while time.process_time() < end:
+            pass
+        return "video"
+    except Exception:
+        return "fallback"
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = RenderPool(workers=1)
+    yield pool
+    pool.shutdown()
+
+
+def test_cpu_bound_job_fails_with_the_budget_error(pool):
+    future = pool.submit(spin_with_fallback, 30, cpu_seconds=1, wall_seconds=60)
+    with pytest.raises(RenderJobError, match="CPUBudgetExceeded"):
+        future.result(timeout=60)
+
+
+def test_worker_survives_the_budget_error(pool):
+    assert pool.submit(spin_with_fallback, 0.1, cpu_seconds=5).result(timeout=60) == "video"
+
+
+def test_job_past_its_wall_clock_budget_is_killed(pool):
+    future = pool.submit(time.sleep, 30, wall_seconds=0.5)
+    with pytest.raises(RenderTimeoutError):
+        future.result(timeout=60)
+    assert pool.submit(spin_with_fallback, 0.1).result(timeout=60) == "video"
+
+
+def wait_until_busy(pool, timeout=30):
+    deadline = time.monotonic() + timeout
+    while pool.stats()["idle"]:
+        assert time.monotonic() < deadline, "job never started"
+        time.sleep(0.05)
+
+
+def test_results_and_job_errors_reach_the_future(pool):
+    assert pool.submit(divmod, 7, 2).result(timeout=60) == (3, 1)
+    with pytest.raises(RenderJobError, match="ZeroDivisionError"):
+        pool.submit(divmod, 1, 0).result(timeout=60)
+
+
+def test_cancel_drops_queued_jobs_and_kills_running_ones(pool):
+    running = pool.submit(time.sleep, 30, job_id="anim:plan", group="anim")
+    wait_until_busy(pool)
+    queued = pool.submit(time.sleep, 30, job_id="anim:segment:0", group="anim")
+    other = pool.submit(divmod, 9, 4, job_id="other")
+
+    assert pool.cancel("anim") == 2
+    assert queued.cancelled()
+    with pytest.raises(RenderCancelledError):
+        running.result(timeout=60)
+    # The killed worker is replaced and the next job runs
+    assert other.result(timeout=60) == (2, 1)
+    assert pool.cancel("anim") == 0
+
+
+def test_cancel_a_single_job(pool):
+    first = pool.submit(time.sleep, 30, job_id="first")
+    wait_until_busy(pool)
+    second = pool.submit(divmod, 5, 5, job_id="second")
+    assert pool.cancel("first") == 1
+    with pytest.raises(RenderCancelledError):
+        first.result(timeout=60)
+    assert second.result(timeout=60) == (1, 0)
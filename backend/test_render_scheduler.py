@@ -0,0 +1,98 @@
+import pytest
+
+import render_scheduler
+from render_scheduler import JobScheduler, expected_seconds, observe, plan_seconds, template_plan
+
+
+def drain_order(scheduler, running=None, workers=1):
+    running = dict(running or {})
+    order = []
+    while len(scheduler):
+        _, item = scheduler.pop(running, workers)
+        order.append(item)
+    return order
+
+
+def test_shortest_job_runs_first():
+    scheduler = JobScheduler(aging=0.0)
+    scheduler.push("long", "long", 60.0, "u", now=0.0)
+    scheduler.push("short", "short", 5.0, "u", now=1.0)
+    scheduler.push("medium", "medium", 20.0, "u", now=2.0)
+    assert drain_order(scheduler) == ["short", "medium", "long"]
+
+
+def test_equal_jobs_run_in_arrival_order():
+    scheduler = JobScheduler(aging=0.0)
+    for name in "abc":
+        scheduler.push(name, name, 10.0, "u", now=0.0)
+    assert drain_order(scheduler) == ["a", "b", "c"]
+
+
+def test_waiting_long_job_overtakes_new_short_ones():
+    scheduler = JobScheduler(aging=1.0)
+    scheduler.push("long", "long", 60.0, "u", now=0.0)
+    # Waited 56 s: 60 - 56 = 4 s of effective work left, less than a new 5 s job
+    scheduler.push("short", "short", 5.0, "u", now=56.0)
+    assert drain_order(scheduler) == ["long", "short"]
+
+    scheduler.push("long", "long", 60.0, "u", now=0.0)
+    scheduler.push("short", "short", 5.0, "u", now=50.0)
+    assert drain_order(scheduler) == ["short", "long"]
+
+
+def test_users_share_the_workers():
+    scheduler = JobScheduler(aging=0.0)
+    for i in range(3):
+        scheduler.push(f"a{i}", f"a{i}", 1.0, "alice", now=0.0)
+    scheduler.push("b0", "b0", 50.0, "bob", now=0.0)
+
+    # alice already runs her share of two workers, so bob's longer job goes first
+    assert scheduler.pop({"alice": 1}, workers=2) == ("bob", "b0")
+    assert scheduler.pop({"alice": 1, "bob": 1}, workers=2) == ("alice", "a0")
+
+
+def test_a_user_over_their_share_still_gets_idle_workers():
+    scheduler = JobScheduler(aging=0.0)
+    scheduler.push("a0", "a0", 1.0, "alice", now=0.0)
+    assert scheduler.pop({"alice": 3, "bob": 1}, workers=4) == ("alice", "a0")
+
+
+def test_remove_and_drain():
+    scheduler = JobScheduler()
+    scheduler.push("a", "a", 1.0, "alice", now=0.0)
+    scheduler.push("b", "b", 2.0, "alice", now=0.0)
+    scheduler.push("c", "c", 3.0, "bob", now=0.0)
+    assert scheduler.remove(["b", "c", "missing"]) == ["b", "c"]
+    assert len(scheduler) == 1 and scheduler.queued_seconds() == 1.0
+    assert scheduler.drain() == ["a"]
+    assert len(scheduler) == 0
+
+
+def test_eta_replays_the_queue_on_every_worker():
+    scheduler = JobScheduler(aging=0.0)
+    scheduler.push("a", "a", 10.0, "alice", now=0.0)
+    scheduler.push("b", "b", 20.0, "alice", now=0.0)
+    scheduler.push("c", "c", 5.0, "bob", now=0.0)
+    # Worker 1 is busy for 3 s more; worker 2 is free
+    busy = [("carol", 3.0)]
+    assert scheduler.eta("c", busy, workers=2) == 5.0
+    assert scheduler.eta("a", busy, workers=2) == 13.0
+    assert scheduler.eta("b", busy, workers=2) == 25.0
+    assert scheduler.eta("missing", busy, workers=2) is None
+
+
+def test_sorting_plans_grow_with_the_swaps():
+    settings = {"quality": "low_quality"}
+    sorted_plan = template_plan("sorting", "sort 1 2 3", settings)
+    reversed_plan = template_plan("sorting", "sort 3 2 1", settings)
+    assert reversed_plan["plays"] == sorted_plan["plays"] + 3 * render_scheduler.SWAP_PLAYS
+    assert plan_seconds(reversed_plan) > plan_seconds(sorted_plan)
+
+
+def test_calibration_moves_toward_observed_times(monkeypatch):
+    monkeypatch.setattr(render_scheduler, "_calibration", {})
+    assert expected_seconds("kind", 10.0) == 10.0
+    for _ in range(30):
+        observe("kind", 10.0, 20.0)
+    assert expected_seconds("kind", 10.0) == pytest.approx(20.0, rel=0.01)
+    assert expected_seconds("other") == render_scheduler.DEFAULT_JOB_SECONDS
@@ -0,0 +1,93 @@
+import pytest
+
+from scene_ir import (IRError, MAX_STEPS, compile_program, parse_program, program_cache_key,
+                      program_duration, validate_program)
+
+
+def program(*steps):
+    return {"version": 1, "steps": list(steps)}
+
+
+def test_normalizes_defaults_and_drops_unknown_fields():
+    result = validate_program([
+        {"op": "show_text", "text": "Hi", "font": "Comic Sans"},
+        {"op": "wait", "seconds": 2},
+    ])
+    assert result == {"version": 1, "steps": [
+        {"op": "show_text", "text": "Hi", "position": "center", "color": "#FFFFFF"},
+        {"op": "wait", "seconds": 2.0},
+    ]}
+
+
+def test_equivalent_programs_share_a_cache_key():
+    a = validate_program(program({"op": "show_title", "text": "Sort"}, {"op": "wait"}))
+    b = validate_program(program({"op": "show_title", "text": "Sort", "extra": 1}, {"op": "wait", "seconds": 1}))
+    assert program_cache_key(a) == program_cache_key(b)
+
+
+@pytest.mark.parametrize("bad, message", [
+    ("not a program", "JSON object"),
+    ({"version": 2, "steps": [{"op": "clear"}]}, "version"),
+    (program(), "non-empty"),
+    (program({"op": "explode"}), "unknown op"),
+    (program({"op": "show_title"}), "needs text"),
+    (program({"op": "show_title", "text": 5}), "must be str"),
+    (program({"op": "show_text", "text": "x", "position": "left"}), "position"),
+    (program({"op": "show_text", "text": "x", "color": "red"}), "#RRGGBB"),
+    (program({"op": "show_title", "text": "x" * 500}), "longer than"),
+    (program({"op": "swap", "i": 0, "j": 1}), "needs create_array"),
+    (program({"op": "create_array", "values": [1, 2]}, {"op": "swap", "i": 0, "j": 2}), "outside the array"),
+    (program({"op": "create_array", "values": [1, 2]}, {"op": "highlight", "indices": [-1]}), "outside the array"),
+    (program({"op": "create_array", "values": list(range(20))}), "values must be"),
+    (program({"op": "create_array", "values": [1]}, {"op": "sort_array", "algorithm": "bogo"}), "algorithm"),
+    (program({"op": "plot_function", "function": "sin"}), "needs create_axes"),
+    (program({"op": "create_axes"}, {"op": "plot_function", "function": "tan"}), "function must be"),
+    (program({"op": "create_axes", "x_range": [3, 1]}), "x_range"),
+    (program({"op": "wait", "seconds": 60}), "seconds"),
+    (program({"op": "clear", "run_time": 30}), "run_time"),
+    (program(*[{"op": "wait"}] * (MAX_STEPS + 1)), "more than"),
+    (program(*[{"op": "wait", "seconds": 10}] * 13), "longer than"),
+])
+def test_rejects_invalid_programs(bad, message):
+    with pytest.raises(IRError, match=message):
+        validate_program(bad)
+
+
+def test_clear_resets_the_simulated_state():
+    with pytest.raises(IRError, match="needs create_array"):
+        validate_program(program({"op": "create_array", "values": [1, 2]}, {"op": "clear"},
+                                 {"op": "highlight", "indices": [0]}))
+
+
+def test_parse_program_accepts_fenced_json():
+    text = '```json\n{"version": 1, "steps": [{"op": "clear"}]}\n```'
+    assert parse_program(text)["steps"] == [{"op": "clear"}]
+    with pytest.raises(IRError, match="Not valid JSON"):
+        parse_program("{steps: [")
+
+
+def test_compile_merges_waits_and_highlights():
+    plays = compile_program(validate_program(program(
+        {"op": "create_array", "values": [3, 1]},
+        {"op": "highlight", "indices": [0]},
+        {"op": "highlight", "indices": [1], "run_time": 1.0},
+        {"op": "wait", "seconds": 1},
+        {"op": "wait", "seconds": 2},
+    )))
+    assert len(plays) == 3
+    assert [a["indices"] for a in plays[1]["actions"]] == [[0], [1]]
+    assert plays[1]["run_time"] == 1.0
+    assert plays[2] == {"wait": 3.0}
+
+
+def test_compile_batches_each_sort_comparison():
+    plays = compile_program(validate_program(program(
+        {"op": "create_array", "values": [2, 1, 3]},
+        {"op": "sort_array", "algorithm": "bubble"},
+    )))
+    swaps = [a for play in plays for a in play["actions"] if a["kind"] == "swap"]
+    # Bubble sort of [2, 1, 3]: three comparisons, one swap
+    assert swaps == [{"kind": "swap", "i": 0, "j": 1}]
+    assert len(plays) == 1 + 3 * 2 + 1 + 1
+    assert all(len(play["actions"]) == 1 for play in plays)
+    assert program_duration(plays) == pytest.approx(2.0 + 3 * 0.4 + 0.5 + 0.5)
@@ -0,0 +1,118 @@
+import os
+from concurrent.futures import Future
+
+import pytest
+
+import segment_render
+from render_pool import RenderCancelledError
+from segment_render import plan_segments, plan_units, render_segmented
+
+
+class FakePool:
+    """Records submitted jobs; tests resolve their futures by hand"""
+
+    size = 3
+
+    def __init__(self):
+        self.jobs = {}
+
+    def submit(self, fn, *args, job_id=None, group=None, **kwargs):
+        future = Future()
+        self.jobs[job_id] = (fn, args, group, future)
+        return future
+
+    def cancel(self, group):
+        cancelled = 0
+        for fn, args, job_group, future in self.jobs.values():
+            if job_group == group and not future.done():
+                future.set_exception(RenderCancelledError("Render cancelled"))
+                cancelled += 1
+        return cancelled
+
+    def future(self, job_id):
+        return self.jobs[job_id][3]
+
+
+def plays(*run_times):
+    return [{"run_time": t, "frames": int(t * 30), "static": False} for t in run_times]
+
+
+def plan(play_list):
+    return {"key": "k", "plays": play_list, "width": 320, "height": 240, "frame_rate": 30}
+
+
+@pytest.fixture
+def scratch(tmp_path, monkeypatch):
+    monkeypatch.setattr(segment_render, "scratch_dir", lambda animation_id: str(tmp_path / animation_id))
+    joined = []
+
+    def fake_concat(paths, dest_path, web=True):
+        joined.append((list(paths), dest_path, web))
+        return dest_path
+
+    monkeypatch.setattr(segment_render, "concat_videos", fake_concat)
+    return joined
+
+
+def test_segments_balance_play_durations():
+    assert plan_segments([1.0] * 16, 2) == [(0, 8), (8, 16)]
+    # Too few plays for a second segment
+    assert plan_segments([1.0] * 10, 4) == [(0, 10)]
+
+
+def test_long_plays_are_split_by_frames():
+    units = plan_units(plays(*[0.5] * 8, 4.0, *[0.5] * 8), 3)
+    assert units == [("plays", 0, 8), ("frames", 8, 120, 3), ("plays", 9, 17)]
+
+
+def test_a_failed_unit_cancels_the_others(scratch):
+    pool = FakePool()
+    done = render_segmented(pool, "g:G", "p", "anim", "out.mp4", segments=2)
+    pool.future("anim:plan").set_result(plan(plays(*[1.0] * 16)))
+    first, second = pool.future("anim:segment:0"), pool.future("anim:segment:1")
+
+    first.set_exception(RuntimeError("boom"))
+    with pytest.raises(RuntimeError, match="boom"):
+        done.result(timeout=1)
+    with pytest.raises(RenderCancelledError):
+        second.result(timeout=1)
+    assert all(job[2] == "anim" for job in pool.jobs.values())
+
+
+def test_a_failed_slice_fails_its_play_at_once(scratch):
+    pool = FakePool()
+    done = render_segmented(pool, "g:G", "p", "anim", "out.mp4", segments=3)
+    pool.future("anim:plan").set_result(plan(plays(4.0)))
+    slices = [pool.future(f"anim:play:0:{i}") for i in range(3)]
+
+    slices[2].set_exception(RuntimeError("slice failed"))
+    with pytest.raises(RuntimeError, match="slice failed"):
+        done.result(timeout=1)
+    assert all(future.done() for future in slices)
+    assert scratch == []
+
+
+def test_slices_are_joined_without_the_web_profile(scratch, monkeypatch):
+    class Cache:
+        def put(self, key, path):
+            self.stored = (key, path)
+
+    cache = Cache()
+    monkeypatch.setattr(segment_render, "get_render_cache", lambda: cache)
+    pool = FakePool()
+    done = render_segmented(pool, "g:G", "p", "anim", "out.mp4", segments=3)
+    pool.future("anim:plan").set_result(plan(plays(4.0)))
+    for i in range(3):
+        path = segment_render.slice_path("anim", 0, i)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "wb").close()
+        pool.future(f"anim:play:0:{i}").set_result(path)
+
+    assert done.result(timeout=5) == "out.mp4"
+    slice_join, final_join = scratch
+    assert slice_join[0] == [segment_render.slice_path("anim", 0, i) for i in range(3)]
+    assert slice_join[2] is False
+    assert final_join == ([segment_render.segment_path("anim", 0)], "out.mp4", True)
+    assert cache.stored == ("k", "out.mp4")
+    # Slice movies are removed once joined
+    assert not os.path.exists(slice_join[0][0])
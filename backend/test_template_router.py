@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+import template_router
+from template_router import generator_branch, generator_keywords, match_template, registry
+
+
+def matched(prompt):
+    template = match_template(prompt)
+    return template["name"] if template else None
+
+
+@pytest.mark.parametrize("prompt, name", [
+    ("Explain Bernoulli's principle", "bernoulli"),
+    ("matrix exponentiation by squaring", "matrix_power"),
+    ("Matrix  powers", "matrix_power"),
+    ("Bubble sort 5 3 1", "sorting"),
+    ("sort these numbers: 4 2 9", "sorting"),
+    ("plot a sine wave", "math"),
+    ("a swinging pendulum", "physics"),
+    ("Binary search for 7", "algorithm"),
+])
+def test_hand_written_concepts_are_routed(prompt, name):
+    assert matched(prompt) == name
+
+
+@pytest.mark.parametrize("prompt", [
+    "Explain how a photograph is developed",
+    "A promotion strategy for a small shop",
+    "Crossing the street safely",
+    "Graph coloring of a map",
+    "Draw a binary tree",
+    "Newton's laws of motion",
+    "The derivative of a function",
+    "Push and pop on a stack",
+    "Resorting to brute force",
+])
+def test_other_prompts_are_not_routed(prompt):
+    assert matched(prompt) is None
+
+
+def test_generic_generator_branches_are_not_registered():
+    assert {t["name"] for t in registry() if t["kind"] == "generator"} == {"sorting", "math", "physics", "algorithm"}
+
+
+def test_prompts_the_generator_would_draw_differently_are_not_routed():
+    # "sorted" sends the generator to its bubble sort, not a binary search
+    assert matched("binary search in a sorted list") is None
+
+
+def test_generator_keywords_are_parsed_once_per_source_version(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    source = tmp_path / "fake_generator.py"
+    source.write_text('TEMPLATE_KEYWORDS = {"waves": ["wave"]}\n')
+    target = "fake_generator:Generator"
+    template_router._read_keywords.cache_clear()
+
+    assert generator_branch(target, "a wave") == "waves"
+    assert generator_branch(target, "a circle") == "general"
+    assert generator_keywords(target) == {"waves": ["wave"]}
+    assert template_router._read_keywords.cache_info().misses == 1
+
+    source.write_text('TEMPLATE_KEYWORDS = {"circles": ["circle"]}\n')
+    os.utime(source, (1, 1))
+    assert generator_branch(target, "a circle") == "circles"
+    assert template_router._read_keywords.cache_info().misses == 2
@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from video_serving import IMMUTABLE, REVALIDATE, ArtifactIndex, _parse_range, plan_response
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=10-", (10, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    ("BYTES = 5-6", (5, 6)),
+    # Malformed or unsupported: answered with the whole file
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+    ("bytes=abc", None),
+    ("bytes=-", None),
+    ("bytes=5-a", None),
+    ("bytes=9-3", None),
+])
+def test_parse_range(header, expected):
+    assert _parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header, size", [("bytes=1000-", 1000), ("bytes=-0", 1000), ("bytes=-10", 0)])
+def test_unsatisfiable_ranges_raise(header, size):
+    with pytest.raises(ValueError):
+        _parse_range(header, size)
+
+
+@pytest.fixture
+def artifact():
+    return {"path": "media/a.mp4", "size": 1000, "mtime": 0.0, "etag": '"0123456789abcdef0123"'}
+
+
+def test_whole_file(artifact):
+    status, headers, byte_range = plan_response(artifact, {})
+    assert status == 200 and byte_range == (0, 999)
+    assert headers["Content-Length"] == "1000" and headers["Content-Type"] == "video/mp4"
+    assert headers["Cache-Control"] == REVALIDATE
+
+
+def test_range_request(artifact):
+    status, headers, byte_range = plan_response(artifact, {"range": "bytes=100-199"}, "0123456789abcdef")
+    assert status == 206 and byte_range == (100, 199)
+    assert headers["Content-Range"] == "bytes 100-199/1000" and headers["Content-Length"] == "100"
+    assert headers["Cache-Control"] == IMMUTABLE
+
+
+def test_unsatisfiable_range_is_416(artifact):
+    status, headers, byte_range = plan_response(artifact, {"range": "bytes=5000-"})
+    assert status == 416 and byte_range is None
+    assert headers["Content-Range"] == "bytes */1000" and headers["Content-Length"] == "0"
+
+
+@pytest.mark.parametrize("header", ['"0123456789abcdef0123"', 'W/"0123456789abcdef0123"', '"other", "0123456789abcdef0123"', "*"])
+def test_matching_if_none_match_is_304(artifact, header):
+    status, headers, byte_range = plan_response(artifact, {"if-none-match": header, "range": "bytes=0-1"})
+    assert status == 304 and byte_range is None
+    assert headers["ETag"] == artifact["etag"] and "Content-Length" not in headers
+
+
+def test_if_range_for_another_version_sends_the_whole_file(artifact):
+    stale = {"range": "bytes=100-199", "if-range": '"old"', "if-none-match": '"old"'}
+    assert plan_response(artifact, stale)[0] == 200
+    current = {"range": "bytes=100-199", "if-range": artifact["etag"]}
+    assert plan_response(artifact, current)[0] == 206
+
+
+def test_url_version_follows_the_file_version(tmp_path):
+    index = ArtifactIndex(str(tmp_path))
+    assert index.url("a.mp4") is None
+
+    path = tmp_path / "a.mp4"
+    path.write_bytes(b"first")
+    first = index.url("a.mp4")
+    f, artifact = index.open("a.mp4")
+    f.close()
+    assert first == f"/video/a.mp4?v={artifact['etag'].strip(chr(34))[:16]}"
+    assert index.url("a.mp4") == first
+
+    # A re-render is published by rename
+    replacement = tmp_path / "new.mp4"
+    replacement.write_bytes(b"second")
+    os.replace(replacement, path)
+    assert index.url("a.mp4") != first
+
+
+def test_names_outside_the_media_directory_are_not_served(tmp_path):
+    index = ArtifactIndex(str(tmp_path))
+    assert index.url("../secret") is None and index.open(".hidden") is None
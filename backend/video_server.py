@@ -1,5 +1,7 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify
 from flask_cors import CORS
+from render_workspace import publish_movie
+from video_serving import ArtifactIndex, register_flask_video_routes
 from manim_config_fix import setup_manim_environment
 import uuid
 import os
@@ -192,6 +194,8 @@ def generate_animation():
             return jsonify({"error": "Only Bernoulli and Matrix supported"})
         
         session_id = str(uuid.uuid4())[:8]
+        # Web-ready copy served by GET /video/<session_id>
+        publish_movie(scene, os.path.join(videos.root, f"{session_id}.mp4"))
         return jsonify({
             "success": True,
             "session_id": session_id,
@@ -217,17 +221,9 @@ def generate_animation():
     except Exception as e:
         return jsonify({"error": f"Animation generation failed: {str(e)}"})
 
-@app.route('/video/<session_id>')
-def serve_video(session_id):
-    media_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "media", "videos")
-    
-    for root, dirs, files in os.walk(media_dir):
-        for file in files:
-            if file.endswith('.mp4'):
-                video_path = os.path.join(root, file)
-                return send_file(video_path, mimetype='video/mp4')
-    
-    return jsonify({"error": "Video not found"}), 404
+# Videos with byte ranges, ETags and 304s: GET /video/<session_id>
+videos = ArtifactIndex(os.path.join(os.path.dirname(os.path.abspath(__file__)), "media"), suffix=".mp4")
+register_flask_video_routes(app, videos)
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,279 @@
+"""
+Video serving for the FastAPI and Flask servers.
+
+Browsers seek in a video with Range requests and revalidate it with
+``If-None-Match``; a plain file response answers both with the whole file.
+Here every response carries a strong ETag, ``Accept-Ranges: bytes`` and
+honours ``Range``, ``If-Range`` and ``If-None-Match``. URLs from
+``ArtifactIndex.url`` carry the file version (``?v=``) and are cached as
+immutable; a bare URL is revalidated on every use, which costs a 304.
+
+``ArtifactIndex`` resolves a video name to its file in O(1): a registered
+path, or the name under the media directory. The ETag is a hash of the file
+version (inode, size, mtime) taken from the same handle that is served, not
+of the content, so neither a status response nor a video request reads the
+file to version it. Videos are published by rename, so a file replaced by a
+re-render never gets the old ETag.
+
+Bodies are sent without copying through Python where the server allows it:
+the ASGI ``http.response.zerocopysend`` extension, or the WSGI server's
+``wsgi.file_wrapper`` (``sendfile`` in gunicorn). Other servers get the
+requested bytes in chunks.
+"""
+
+import hashlib
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+from typing import Any, Dict, Optional, Tuple
+
+CHUNK_BYTES = 256 * 1024
+# Hex digits of the content hash in versioned URLs
+VERSION_LENGTH = 16
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# HLS playlists and segments (.ts is otherwise a Qt translation file)
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/mp2t", ".ts")
+
+
+class ArtifactIndex:
+    """Video name -> file, with the ETag of each file version"""
+
+    def __init__(self, root: str = "media", suffix: str = "", capacity: int = 4096):
+        self.root = root
+        # Appended to names that are not registered, e.g. ".mp4" for session ids
+        self.suffix = suffix
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._paths: "OrderedDict[str, str]" = OrderedDict()
+
+    def register(self, name: str, path: str):
+        """Serve ``path`` under ``name``"""
+        with self._lock:
+            self._paths[name] = path
+            self._paths.move_to_end(name)
+            while len(self._paths) > self.capacity:
+                self._paths.popitem(last=False)
+
+    def path(self, name: str) -> Optional[str]:
+        with self._lock:
+            registered = self._paths.get(name)
+        if registered is not None:
+            return registered
+        # Only plain file names in the media directory
+        if not name or name != os.path.basename(name) or name.startswith("."):
+            return None
+        return os.path.join(self.root, name + self.suffix)
+
+    def open(self, name: str) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        """``(open file, artifact)`` for ``name``, or None when there is no such video.
+
+        The artifact describes the opened file: ``path``, ``size``, ``mtime``
+        and ``etag``.
+        """
+        path = self.path(name)
+        if path is None:
+            return None
+        try:
+            f = open(path, "rb")
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            return None
+        try:
+            st = os.fstat(f.fileno())
+        except BaseException:
+            f.close()
+            raise
+        return f, {"path": path, "size": st.st_size, "mtime": st.st_mtime, "etag": _version_etag(st)}
+
+    def url(self, name: str, prefix: str = "/video") -> Optional[str]:
+        """Cacheable URL of the current version of ``name``; only stats the file"""
+        path = self.path(name)
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return f"{prefix}/{name}?v={_version_etag(st).strip(chr(34))[:VERSION_LENGTH]}"
+
+
+def _version_etag(st: os.stat_result) -> str:
+    """Strong ETag of one version of a file: inode, size and mtime"""
+    signature = f"{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+    return f'"{hashlib.sha256(signature.encode()).hexdigest()[:32]}"'
+
+
+def _parse_range(value: str, size: int) -> Optional[Tuple[int, int]]:
+    """``(first, last)`` byte of a single ``bytes=`` range. None for a range
+    that is malformed or not supported (several ranges, other units), which
+    is answered with the whole file. Raises ValueError when unsatisfiable."""
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = (part.strip() for part in spec.partition("-"))
+    if not sep or not (first or last) or not all(p.isdigit() for p in (first, last) if p):
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        if int(last) == 0 or size == 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - int(last)), size - 1
+    start, end = int(first), int(last) if last else size - 1
+    if start >= size:
+        raise ValueError("Range starts past the end of the file")
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def _matches(header: Optional[str], etag: str) -> bool:
+    """Whether an ``If-None-Match`` list names ``etag`` (weak comparison)"""
+    for tag in (header or "").split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+def plan_response(artifact: Dict[str, Any], headers, version: Optional[str] = None
+                  ) -> Tuple[int, Dict[str, str], Optional[Tuple[int, int]]]:
+    """``(status, response headers, (first, last) byte to send or None)`` for
+    a request with ``headers`` (any case-insensitive mapping) and the ``v``
+    query parameter ``version``"""
+    etag, size = artifact["etag"], artifact["size"]
+    current = version == etag.strip('"')[:VERSION_LENGTH]
+    response_headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE if current else REVALIDATE,
+        "Accept-Ranges": "bytes",
+        "Last-Modified": formatdate(artifact["mtime"], usegmt=True),
+    }
+    if _matches(headers.get("if-none-match"), etag):
+        return 304, response_headers, None
+
+    response_headers["Content-Type"] = mimetypes.guess_type(artifact["path"])[0] or "application/octet-stream"
+    byte_range = None
+    range_header = headers.get("range")
+    # A Range whose If-Range names another version gets the whole new file
+    if range_header and (not headers.get("if-range") or headers.get("if-range").strip() == etag):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            response_headers["Content-Range"] = f"bytes */{size}"
+            response_headers["Content-Length"] = "0"
+            return 416, response_headers, None
+    if byte_range is None:
+        response_headers["Content-Length"] = str(size)
+        return 200, response_headers, ((0, size - 1) if size else None)
+
+    first, last = byte_range
+    response_headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+    response_headers["Content-Length"] = str(last - first + 1)
+    return 206, response_headers, byte_range
+
+
+def _read_at(f, offset: int, size: int) -> bytes:
+    f.seek(offset)
+    return f.read(size)
+
+
+# ---------------------------------------------------------------------------
+# FastAPI
+# ---------------------------------------------------------------------------
+
+def register_video_routes(app, index: ArtifactIndex, prefix: str = "/video"):
+    """Add ``GET``/``HEAD {prefix}/{filename}`` serving videos of ``index``"""
+    import anyio
+    from fastapi import HTTPException, Request
+    from starlette.responses import Response
+
+    class VideoResponse(Response):
+        """Sends bytes ``[first, last]`` of an open file, then closes it"""
+
+        def __init__(self, f, status_code: int, headers: Dict[str, str], byte_range: Optional[Tuple[int, int]]):
+            self.file = f
+            self.status_code = status_code
+            self.byte_range = byte_range
+            self.background = None
+            self.init_headers(headers)
+
+        async def __call__(self, scope, receive, send):
+            try:
+                await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+                if self.byte_range is None:
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+                first, last = self.byte_range
+                if "http.response.zerocopysend" in scope.get("extensions", {}):
+                    await send({"type": "http.response.zerocopysend", "file": self.file,
+                                "offset": first, "count": last - first + 1})
+                    return
+                offset = first
+                while True:
+                    size = min(CHUNK_BYTES, last + 1 - offset)
+                    chunk = await anyio.to_thread.run_sync(_read_at, self.file, offset, size) if size > 0 else b""
+                    offset += len(chunk)
+                    more = bool(chunk) and offset <= last
+                    await send({"type": "http.response.body", "body": chunk, "more_body": more})
+                    if not more:
+                        return
+            finally:
+                self.file.close()
+
+    @app.api_route(prefix + "/{filename}", methods=["GET", "HEAD"])
+    async def get_video(filename: str, request: Request):
+        # open and fstat can block on a slow disk; keep them off the event loop
+        opened = await anyio.to_thread.run_sync(index.open, filename)
+        if opened is None:
+            raise HTTPException(status_code=404, detail="Video not found")
+        f, artifact = opened
+        status, headers, byte_range = plan_response(artifact, request.headers, request.query_params.get("v"))
+        return VideoResponse(f, status, headers, None if request.method == "HEAD" else byte_range)
+
+
+# ---------------------------------------------------------------------------
+# Flask
+# ---------------------------------------------------------------------------
+
+def _iter_range(f, first: int, last: int):
+    try:
+        offset = first
+        while offset <= last:
+            chunk = _read_at(f, offset, min(CHUNK_BYTES, last + 1 - offset))
+            if not chunk:
+                break
+            offset += len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def register_flask_video_routes(app, index: ArtifactIndex, prefix: str = "/video"):
+    """Add ``GET``/``HEAD {prefix}/<name>`` serving videos of ``index``"""
+    from flask import Response, jsonify, request
+
+    @app.route(prefix + "/<name>", methods=["GET", "HEAD"])
+    def serve_video(name):
+        opened = index.open(name)
+        if opened is None:
+            return jsonify({"error": "Video not found"}), 404
+        f, artifact = opened
+        status, headers, byte_range = plan_response(artifact, request.headers, request.args.get("v"))
+        if byte_range is None or request.method == "HEAD":
+            f.close()
+            # No body, so Content-Length stays the file's
+            return Response(status=status, headers=headers)
+
+        first, last = byte_range
+        file_wrapper = request.environ.get("wsgi.file_wrapper")
+        if file_wrapper is not None:
+            # The server sends Content-Length bytes from the file position
+            f.seek(first)
+            body = file_wrapper(f, CHUNK_BYTES)
+        else:
+            body = _iter_range(f, first, last)
+        return Response(body, status=status, headers=headers, direct_passthrough=True)
@@ -1,8 +1,8 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
 from pydantic import BaseModel
+from video_serving import ArtifactIndex, register_video_routes
 import uuid
 import os
 import asyncio
@@ -44,12 +44,9 @@ async def get_animation_status(animation_id: str):
         raise HTTPException(status_code=404, detail="Animation not found")
     return animation_status[animation_id]
 
-@app.get("/video/{filename}")
-async def get_video(filename: str):
-    video_path = os.path.join("media", filename)
-    if os.path.exists(video_path):
-        return FileResponse(video_path, media_type="video/mp4")
-    raise HTTPException(status_code=404, detail="Video not found")
+# Videos with byte ranges, ETags and 304s: GET /video/{filename}
+videos = ArtifactIndex("media")
+register_video_routes(app, videos)
 
 def generate_manim_animation(prompt: str, animation_id: str):
     try: